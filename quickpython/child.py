@@ -0,0 +1,724 @@
+"""The process side of running code from QuickPython.
+
+`python -m quickpython.child --serve FD` starts a fork server: it imports everything programs
+written in QuickPython commonly need once, then waits on the connection inherited as file
+descriptor FD for run requests, forking a fresh child for each one. Children start with those
+modules already imported, so a run begins in milliseconds rather than paying for interpreter
+startup every time.
+
+`python -m quickpython.child --connect ADDRESS` runs a single program in a new interpreter instead,
+for platforms without fork. The program is received over a connection to ADDRESS, authenticated
+with the key from the QUICKPYTHON_AUTHKEY environment variable.
+
+Either way programs are sent as source code and never written to disk. Their output goes to a
+pipe the editor displays in its output pane. Programs can also be run in one of the MODES, such as
+under a profiler, which report their results back to the editor.
+"""
+import builtins
+import errno
+import importlib
+import io
+import linecache
+import marshal
+import os
+import random
+import signal
+import sys
+import threading
+import traceback
+import types
+from dataclasses import astuple, dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from multiprocessing.connection import Connection
+
+AUTHKEY_VARIABLE = "QUICKPYTHON_AUTHKEY"
+# Signals that end programs which went over their CPU time limit or were stopped by the editor,
+# after which anything else they started is stopped too.
+LIMIT_SIGNALS = {getattr(signal, name) for name in ("SIGXCPU", "SIGKILL") if hasattr(signal, name)}
+
+Report = Callable[[str, Any], None]
+
+# The connection results are reported to the editor over, where there is one. Modes that take
+# requests from the editor, such as kernels, receive them on it too.
+editor: Optional["Connection"] = None
+
+
+@dataclass
+class Limits:
+    """Caps on the resources a program may use, each None for no cap.
+
+    All but wall_seconds are set as the program's rlimits, where the platform has them, and so
+    apply to each process it starts as well. The editor stops programs running for longer than
+    wall_seconds itself, along with every process they started.
+    """
+
+    cpu_seconds: Optional[int] = None
+    memory_mb: Optional[int] = None  # Address space, in MiB.
+    open_files: Optional[int] = None
+    wall_seconds: Optional[float] = None
+
+    @classmethod
+    def from_environ(cls, environ: Dict[str, str]) -> "Limits":
+        """Reads the limits from the LIMIT_VARIABLES set in environ.
+
+        Raises ValueError if one isn't a positive number.
+        """
+        values: Dict[str, Any] = {}
+        for name, variable in LIMIT_VARIABLES.items():
+            text = environ.get(variable)
+            if text:
+                try:
+                    value = (float if name == "wall_seconds" else int)(text)
+                except ValueError:
+                    value = 0
+                if value <= 0:
+                    raise ValueError(f"{variable} must be a positive number, not {text!r}")
+                values[name] = value
+        return cls(**values)
+
+
+LIMIT_VARIABLES = {
+    "cpu_seconds": "QUICKPYTHON_CPU_LIMIT",
+    "memory_mb": "QUICKPYTHON_MEMORY_LIMIT",
+    "open_files": "QUICKPYTHON_FILES_LIMIT",
+    "wall_seconds": "QUICKPYTHON_WALL_LIMIT",
+}
+
+
+@dataclass
+class Usage:
+    """The resources a program used, as measured once it exited."""
+
+    cpu_seconds: float  # User and system time.
+    peak_rss: int  # The most memory it had resident, in bytes.
+
+
+@dataclass
+class Program:
+    """A program to run, as sent from the editor."""
+
+    source: str
+    filename: str  # Where the source came from, used for tracebacks and sys.argv.
+    environ: Dict[str, str] = field(default_factory=dict)
+    mode: str = "run"
+    options: Dict[str, Any] = field(default_factory=dict)
+    limits: Limits = field(default_factory=Limits)
+
+
+@dataclass
+class Cell:
+    """Part of a program to run in a kernel."""
+
+    source: str
+    filename: str
+    line: int  # The line of the program the cell starts on, counting from 1.
+    text: str  # The whole program as it is now, for tracebacks to show.
+    capture: bool = False  # Whether to report what the cell printed too, for it to be replayed.
+
+
+@dataclass
+class Reload:
+    """Top level definitions changed in the editor since a program started, to swap into it."""
+
+    code: bytes  # The definitions compiled as a module and marshalled, at their own line numbers.
+    names: List[str]  # The names they define.
+    filename: str
+    text: str  # The whole program as it is now, for tracebacks to show.
+
+
+def _no_report(kind: str, result: Any) -> None:
+    pass
+
+
+ProgramMode = Callable[[Program, types.CodeType, dict, Report], None]
+MODES: Dict[str, ProgramMode] = {}
+
+
+def mode(name: str) -> Callable[[ProgramMode], ProgramMode]:
+    """Registers a way of running programs. Modes execute the compiled program in the given
+    namespace and send anything they measure back to the editor using report.
+    """
+
+    def register(function: ProgramMode) -> ProgramMode:
+        MODES[name] = function
+        return function
+
+    return register
+
+
+@mode("run")
+def _execute(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    if editor is not None:
+        threading.Thread(
+            target=_reload_agent, args=(editor, namespace, report), daemon=True
+        ).start()
+    exec(code, namespace)  # nosec
+
+
+def _reload_agent(connection: "Connection", namespace: dict, report: Report) -> None:
+    """Applies each Reload the editor sends while the program runs, reporting the names that
+    were swapped in and those that couldn't be.
+    """
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        linecache.cache[request.filename] = (
+            len(request.text),
+            None,
+            request.text.splitlines(True),
+            request.filename,
+        )
+        try:
+            failed = reload(request, namespace)
+        except Exception:
+            traceback.print_exc()
+            failed = request.names
+        report("reloaded", ([name for name in request.names if name not in failed], failed))
+
+
+def reload(request: Reload, namespace: dict) -> List[str]:
+    """Runs the changed definitions and swaps them into namespace, returning the names that
+    couldn't be.
+
+    Functions and classes that already exist are updated in place rather than replaced, so that
+    everything holding on to them, such as callbacks, instances and other modules, uses the new
+    code from their next call on. Calls already in progress finish with the old code.
+    """
+    # Definitions run in a copy of the namespace so the names can be updated one by one, and
+    # with @main disabled so the program isn't started a second time.
+    scratch = dict(namespace, main=lambda function: function)
+    exec(marshal.loads(request.code), scratch)  # nosec
+    failed = []
+    for name in request.names:
+        try:
+            namespace[name] = _updated(namespace.get(name), scratch[name], namespace, scratch)
+        except (KeyError, TypeError, ValueError):
+            failed.append(name)
+    return failed
+
+
+def _updated(old: Any, new: Any, namespace: dict, scratch: dict) -> Any:
+    """Returns old changed to behave like new where possible, or new otherwise."""
+    if isinstance(new, types.FunctionType):
+        if isinstance(old, types.FunctionType) and (
+            old.__code__.co_freevars == new.__code__.co_freevars
+        ):
+            old.__code__ = new.__code__
+            old.__defaults__ = new.__defaults__
+            old.__kwdefaults__ = new.__kwdefaults__
+            old.__doc__ = new.__doc__
+            return old
+        if new.__globals__ is scratch:  # Defined by the program, rather than by a decorator.
+            function = types.FunctionType(
+                new.__code__, namespace, new.__name__, new.__defaults__, new.__closure__
+            )
+            function.__kwdefaults__ = new.__kwdefaults__
+            function.__qualname__ = new.__qualname__
+            function.__dict__.update(new.__dict__)
+            return function
+    elif isinstance(new, (staticmethod, classmethod)) and type(old) is type(new):
+        _updated(old.__func__, new.__func__, namespace, scratch)
+        return old
+    elif isinstance(new, type) and isinstance(old, type):
+        for attribute, value in vars(new).items():
+            if attribute.startswith("__") and attribute.endswith("__"):
+                if not isinstance(value, types.FunctionType):
+                    continue
+            setattr(old, attribute, _updated(vars(old).get(attribute), value, namespace, scratch))
+        return old
+    return new
+
+
+@mode("debug")
+def _debug(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program under the debugger, pausing at the breakpoints from the options, or at
+    its first line if they say to step. The editor controls it from then on.
+    """
+    from quickpython import debugger
+
+    program_debugger = debugger.Debugger(
+        program.filename,
+        code,
+        report,
+        program.options.get("breakpoints", ()),
+        program.options.get("step", False),
+    )
+    if editor is not None:
+        threading.Thread(target=program_debugger.receive, args=(editor,), daemon=True).start()
+    program_debugger.run(code, namespace)
+
+
+@mode("profile")
+def _profile(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program under cProfile, reporting the raw stats in the marshal format pstats
+    reads from files.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runctx(code, namespace, namespace)
+    finally:
+        profiler.create_stats()
+        report("profile", marshal.dumps(profiler.stats))  # type: ignore
+
+
+@mode("sample")
+def _sample(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program under the sampling profiler, reporting how many samples saw each call
+    stack. Samples are taken every interval seconds from the options.
+    """
+    from quickpython import sampler
+
+    profiler = sampler.Sampler(program.filename, program.options.get("interval", 0.005))
+    try:
+        profiler.run(code, namespace)
+    finally:
+        report("samples", profiler.stacks)
+
+
+@mode("timeit")
+def _timeit(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program as setup, without starting its main function, and then times the
+    statement from the options in its namespace. Like `python -m timeit`, the number of loops is
+    calibrated so each of the repeated timings takes at least 0.2 seconds.
+    """
+    import timeit
+
+    namespace["__name__"] = "__timeit__"
+    sys.modules["__timeit__"] = sys.modules["__main__"]
+    exec(code, namespace)  # nosec
+    timer = timeit.Timer(program.options["statement"], globals=namespace)
+    loops, _ = timer.autorange()
+    timings = timer.repeat(program.options.get("repeat", 5), loops)
+    report("timeit", (loops, [timing / loops for timing in timings]))
+
+
+@mode("lines")
+def _profile_lines(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program under the line profiler, reporting how many times each of its lines ran
+    and for how many nanoseconds, as lists indexed by line number.
+    """
+    from quickpython import line_profiler
+
+    overheads = line_profiler.calibrate()
+    profiler = line_profiler.LineProfiler(code, program.source.count("\n") + 1)
+    try:
+        profiler.run(code, namespace)
+    finally:
+        report("lines", profiler.results(overheads))
+
+
+@mode("coverage")
+def _coverage(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program recording which of its lines run, reporting them along with all the lines
+    that could have.
+    """
+    from quickpython import line_coverage
+
+    coverage = line_coverage.LineCoverage(code)
+    try:
+        coverage.run(code, namespace)
+    finally:
+        report("coverage", coverage.results())
+
+
+@mode("kernel")
+def _kernel(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program, then each Cell the editor sends in the same namespace, until the editor
+    disconnects or a cell exits. Whether each cell ran without error is reported once it finishes,
+    after what it printed to stdout and stderr for cells that capture it.
+
+    Interrupting a cell only stops that cell, leaving the kernel waiting for the next one.
+    """
+    exec(code, namespace)  # nosec
+    if editor is None:
+        return
+
+    while True:
+        try:
+            cell = editor.recv()
+        except KeyboardInterrupt:  # Nothing was running to interrupt.
+            continue
+        except (EOFError, OSError):
+            return
+
+        lines = cell.text.splitlines(True)
+        linecache.cache[cell.filename] = (len(cell.text), None, lines, cell.filename)
+        succeeded = False
+        streams = sys.stdout, sys.stderr
+        printed = io.StringIO()
+        if cell.capture:
+            sys.stdout, sys.stderr = _Tee(sys.stdout, printed), _Tee(sys.stderr, printed)
+        try:
+            # Padded so line numbers in tracebacks match the program's.
+            exec(compile("\n" * (cell.line - 1) + cell.source, cell.filename, "exec"), namespace)
+            succeeded = True
+        except SystemExit:
+            raise
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout, sys.stderr = streams
+            sys.stdout.flush()
+            sys.stderr.flush()
+        if cell.capture:
+            report("printed", printed.getvalue())
+        report("cell", succeeded)
+
+
+class _Tee:
+    """A text stream that copies everything written to it into another as it passes it on."""
+
+    def __init__(self, stream: Any, copy: io.StringIO):
+        self._stream = stream
+        self._copy = copy
+
+    def write(self, text: str) -> int:
+        self._copy.write(text)
+        return self._stream.write(text)
+
+    def writelines(self, lines: List[str]) -> None:
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+
+@mode("tests")
+def _tests(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program and the other files from the options as modules, without starting their
+    main functions, then runs the tests in them. Up to the options' workers, or one per CPU, run
+    at once, each stopped after timeout seconds.
+    """
+    from quickpython import testing
+
+    module = sys.modules["__main__"]
+    module.__name__ = os.path.splitext(os.path.basename(program.filename))[0].strip("<>")
+    sys.modules[module.__name__] = module  # So the other files import the program as edited.
+    exec(code, namespace)  # nosec
+    modules = [module]
+    for filename, source in program.options.get("files", ()):
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        other = types.ModuleType(os.path.splitext(os.path.basename(filename))[0])
+        other.__file__ = filename
+        sys.modules[other.__name__] = other
+        exec(compile(source, filename, "exec"), vars(other))  # nosec
+        modules.append(other)
+
+    tests = [test for each in modules for test in testing.collect(each)]
+    report("tests", len(tests))
+    workers = program.options.get("workers") or os.cpu_count() or 1
+    testing.run_tests(tests, report, workers, program.options.get("timeout", 60.0))
+
+
+@mode("fixtures")
+def _fixtures(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program once for each of the fixtures from the options, with stdin read from the
+    fixture's input file, reporting the name, exit code, duration and output of each run as
+    "fixture" once it has finished. Runs are stopped after timeout seconds, for which the exit code
+    is None, and up to the options' workers, or one per CPU, run at once.
+    """
+    global editor
+    from quickpython import testing
+
+    editor = None  # The runs don't take requests from the editor the way a program run alone does.
+    run_program = partial(run, Program(program.source, program.filename, program.environ))
+    runs = [
+        testing.Test(name, program.filename, 1, run_program, stdin=input_path)
+        for name, input_path in program.options["fixtures"]
+    ]
+    workers = program.options.get("workers") or os.cpu_count() or 1
+    timeout = program.options.get("timeout", 60.0)
+    for fixture, exit_code, duration, output in testing.run_all(runs, workers, timeout):
+        report("fixture", (fixture.name, exit_code, duration, output))
+
+
+def peak_rss() -> Optional[int]:
+    """Returns the most memory this process has had resident, in bytes, where that is known."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+
+    return rss_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def rss_bytes(maxrss: int) -> int:
+    """Converts the peak resident memory getrusage returns to bytes."""
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@mode("memory")
+def _memory(program: Program, code: types.CodeType, namespace: dict, report: Report) -> None:
+    """Runs the program with tracemalloc on, reporting the lines of the program holding the most
+    memory when it finishes along with the peak traced and resident memory.
+
+    If the options include an interval, the same is reported every interval seconds while the
+    program runs.
+    """
+    import tracemalloc
+
+    def take_snapshot():
+        # Filtering the statistics is much faster than filtering the snapshot's traces.
+        statistics = [
+            statistic
+            for statistic in tracemalloc.take_snapshot().statistics("lineno")
+            if statistic.traceback[0].filename == program.filename
+        ]
+        lines = [
+            (statistic.traceback[0].lineno, statistic.size, statistic.count)
+            for statistic in statistics[: program.options.get("limit", 100)]
+        ]
+        current, peak = tracemalloc.get_traced_memory()
+        report("memory", (lines, current, peak, peak_rss()))
+
+    stop = threading.Event()
+
+    def sample(interval: float):
+        while not stop.wait(interval):
+            take_snapshot()
+
+    sampler = None
+    if program.options.get("interval"):
+        sampler = threading.Thread(target=sample, args=(program.options["interval"],), daemon=True)
+
+    tracemalloc.start()
+    try:
+        if sampler is not None:
+            sampler.start()
+        exec(code, namespace)  # nosec
+    finally:
+        stop.set()
+        if sampler is not None:
+            sampler.join()
+        take_snapshot()
+        tracemalloc.stop()
+
+
+PRELOAD = (
+    "quickpython.extensions",
+    "colorama",
+    "pyfiglet",
+    "collections",
+    "dataclasses",
+    "datetime",
+    "inspect",
+    "json",
+    "math",
+    "pathlib",
+    "random",
+    "re",
+    "string",
+    "subprocess",
+    "time",
+    "typing",
+)
+
+
+def preload() -> None:
+    for module_name in PRELOAD:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:  # pragma: no cover
+            pass
+
+
+def line_buffered_stdio() -> None:
+    """Makes output written to pipes show up line by line rather than once the buffer fills."""
+    sys.stdin = io.TextIOWrapper(open(0, "rb", closefd=False), encoding="utf8")
+    sys.stdout = io.TextIOWrapper(
+        open(1, "wb", closefd=False), encoding="utf8", line_buffering=True
+    )
+    sys.stderr = io.TextIOWrapper(
+        open(2, "wb", closefd=False),
+        encoding="utf8",
+        errors="backslashreplace",
+        line_buffering=True,
+    )
+
+
+def apply_limits(limits: Limits) -> None:
+    """Sets limits as this process's rlimits, leaving out any the platform doesn't support."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return
+
+    caps = (
+        # A second more before the hard limit kills programs that handle SIGXCPU.
+        ("RLIMIT_CPU", limits.cpu_seconds, 1),
+        ("RLIMIT_AS", limits.memory_mb and limits.memory_mb * 1024 * 1024, 0),
+        ("RLIMIT_NOFILE", limits.open_files, 0),
+    )
+    for name, value, grace in caps:
+        if value is None or not hasattr(resource, name):
+            continue
+        limit = getattr(resource, name)
+        _soft, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+            grace = min(grace, hard - value)
+        try:
+            resource.setrlimit(limit, (value, value + grace))
+        except (ValueError, OSError):  # pragma: no cover
+            pass
+
+
+def breached_limit(error: BaseException, limits: Limits) -> Optional[str]:
+    """Returns the name of the limit an exception a program raised comes from, if any."""
+    if isinstance(error, MemoryError) and limits.memory_mb is not None:
+        return "memory_mb"
+    if isinstance(error, OSError) and error.errno == errno.EMFILE and limits.open_files is not None:
+        return "open_files"
+    return None
+
+
+def run(program: Program, report: Report = _no_report) -> int:
+    """Runs the program as the __main__ module, returning the exit code it finished with.
+
+    Tracebacks show the program's source even if it differs from what is saved in its file.
+    """
+    from quickpython import extensions  # noqa  Adds QuickPython's helpers to builtins.
+
+    source, filename = program.source, program.filename
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    main_module = types.ModuleType("__main__")
+    main_module.__file__ = filename
+    main_module.__builtins__ = builtins  # type: ignore
+    sys.modules["__main__"] = main_module
+    sys.argv = [filename]
+    sys.path[0] = os.path.dirname(os.path.abspath(filename))
+    try:
+        code = compile(source, filename, "exec")
+        MODES[program.mode](program, code, vars(main_module), report)
+    except SystemExit as error:
+        if error.code is None or isinstance(error.code, int):
+            return error.code or 0
+        print(error.code, file=sys.stderr)
+        return 1
+    except BaseException as error:
+        traceback.print_exc()
+        limit = breached_limit(error, program.limits)
+        if limit is not None:
+            report("limit", limit)
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return 0
+
+
+def exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _fork_run(
+    connection: "Connection", program: Program, stdio: Tuple[int, int, int]
+) -> Tuple[int, Usage]:
+    from multiprocessing.connection import Connection
+
+    global editor
+
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        code = 1
+        try:
+            connection.close()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            os.setsid()  # Keep the program away from the editor's terminal.
+            stdin_fd, output_fd, results_fd = stdio
+            os.dup2(stdin_fd, 0)
+            os.dup2(output_fd, 1)
+            os.dup2(output_fd, 2)
+            os.close(stdin_fd)
+            os.close(output_fd)
+            line_buffered_stdio()
+            editor = Connection(results_fd)
+            report = editor.send
+            random.seed()
+            os.environ.update(program.environ)
+            apply_limits(program.limits)
+            code = run(program, lambda kind, result: report((kind, result)))
+        finally:
+            os._exit(code)
+
+    for fd in stdio:
+        os.close(fd)
+    connection.send(("started", pid))
+    _, status, resource_usage = os.wait4(pid, 0)
+    usage = Usage(
+        resource_usage.ru_utime + resource_usage.ru_stime, rss_bytes(resource_usage.ru_maxrss)
+    )
+    if os.WIFSIGNALED(status) and os.WTERMSIG(status) in LIMIT_SIGNALS:
+        try:  # Stop anything the program started too, in the session it leads.
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    return exit_code(status), usage
+
+
+def serve(connection: "Connection") -> None:
+    """Answers run requests sent over connection until it is closed.
+
+    Each request is a program followed by the file descriptors for its stdin, for its combined
+    stdout and stderr, and for the connection to the editor it reports results on. The program's
+    process id is sent back once it starts, and its exit code and Usage once it exits.
+    """
+    from multiprocessing.reduction import recv_handle
+
+    # Ctrl+C during a run is meant for the program being run, not for the server.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    preload()
+    while True:
+        try:
+            program = connection.recv()
+            stdio = (recv_handle(connection), recv_handle(connection), recv_handle(connection))
+        except (EOFError, OSError):
+            return
+        code, usage = _fork_run(connection, program, stdio)
+        # Sent as a tuple, since classes defined here belong to __main__ in the server.
+        connection.send(("exited", code, astuple(usage)))
+
+
+def connect(address: str) -> int:
+    """Receives a single program from the editor listening at address and runs it, reporting
+    results back over the same connection.
+    """
+    from multiprocessing.connection import Client
+
+    global editor
+
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_VARIABLE))
+    with Client(address, authkey=authkey) as connection:
+        editor = connection
+        program = connection.recv()
+        os.environ.update(program.environ)
+        apply_limits(program.limits)
+        line_buffered_stdio()
+        return run(program, lambda kind, result: connection.send((kind, result)))
+
+
+def main(argv=None) -> None:
+    from multiprocessing.connection import Connection
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--serve"] and len(argv) == 2:
+        serve(Connection(int(argv[1])))
+    elif argv[:1] == ["--connect"] and len(argv) == 2:
+        sys.exit(connect(argv[1]))
+    else:
+        sys.exit("Usage: python -m quickpython.child (--serve FD | --connect ADDRESS)")
+
+
+if __name__ == "__main__":
+    main()
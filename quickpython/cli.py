@@ -2,17 +2,16 @@ import asyncio
 import builtins
 import dataclasses
 import os
-import pydoc
+import signal
 import sys
+import time
 import types
 from asyncio import Future, ensure_future
 from datetime import datetime
 from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
 
-import black
-import isort
 from prompt_toolkit import Application
 from prompt_toolkit.completion import PathCompleter
 from prompt_toolkit.filters import Condition
@@ -28,17 +27,22 @@ from prompt_toolkit.layout.containers import (
     VSplit,
     Window,
 )
+from prompt_toolkit.layout.controls import UIControl
 from prompt_toolkit.layout.dimension import AnyDimension, Dimension
 from prompt_toolkit.layout.layout import Layout
 from prompt_toolkit.layout.menus import CompletionsMenu
 from prompt_toolkit.output.color_depth import ColorDepth
 from prompt_toolkit.search import start_search
-from prompt_toolkit.shortcuts import clear, message_dialog
 from prompt_toolkit.styles import Style
 from prompt_toolkit.widgets import Dialog, MenuContainer, MenuItem, SearchToolbar, TextArea
 from prompt_toolkit.widgets.base import Border, Button, Label
 
-from quickpython import __version__, extensions  # noqa
+from quickpython import __version__, extensions, formatting, output, reports  # noqa
+
+if TYPE_CHECKING:  # pragma: no cover
+    import isort
+
+    from quickpython import child, incremental, kernel, runner, storage, viewer
 
 ABOUT_MESSAGE = f"""QuickPython version {__version__}
 
@@ -50,24 +54,48 @@ A productive parody.
 Made in Seattle.
 """
 
-BLACK_ALLOWED_MODE_KEYS = {field.name for field in dataclasses.fields(black.FileMode)}
-
 kb = KeyBindings()
 eb = KeyBindings()
 current_file: Optional[Path] = None
-
-default_isort_config = isort.Config(settings_path=os.getcwd())
-if default_isort_config == isort.settings.DEFAULT_CONFIG:
-    default_isort_config = isort.Config(profile="black", float_to_top=True)
-
-default_black_config_file = black.find_pyproject_toml((os.getcwd(),))
-if default_black_config_file:
-    default_black_config = black.parse_pyproject_toml(default_black_config_file)
-else:
-    default_black_config = {}
-
-isort_config: isort.Config = default_isort_config
-black_config: dict = default_black_config
+large_file: Optional["viewer.LargeFileViewer"] = None
+last_search = ""
+
+VIEWER_SIZE_THRESHOLD = 16 * 1024 * 1024  # Files larger than this open in a read-only viewer.
+MEMORY_SAMPLE_INTERVAL = 1.0  # Seconds between the memory snapshots taken by memory profiles.
+STACK_SAMPLE_INTERVAL = 0.005  # Seconds between the call stacks taken by sampling profiles.
+COVERAGE_CACHE_SIZE = 16  # How many versions of the program to remember the coverage of.
+TEST_TIMEOUT = 30.0  # Seconds each test may take before it is stopped.
+FIXTURE_TIMEOUT = 30.0  # Seconds each run against a fixture may take before it is stopped.
+fixtures_directory: Optional[Path] = None  # The stdin fixtures attached to the current file.
+
+# The formatters and their configuration are loaded in the background once the UI is up.
+# A config of None means it still needs to be found for the current file.
+default_isort_config: Optional["isort.Config"] = None
+default_black_config: dict = {}
+isort_config: Optional["isort.Config"] = None
+black_config: dict = {}
+prewarmed: Optional[asyncio.Future] = None
+# The first row edited since the block around the cursor was last formatted on Enter.
+pending_format_row: Optional[int] = None
+config_resolver = formatting.ConfigResolver()
+# The stores, the runner and the kernels are only created once something uses them, so the
+# modules they need aren't imported before the editor appears.
+formatted_files: Optional["storage.FormattedFiles"] = None
+run_history: Optional["storage.RunHistory"] = None
+program_runner: Optional["runner.Runner"] = None
+current_run: Optional["runner.Run"] = None
+current_program: Optional["child.Program"] = None  # As last sent to current_run.
+program_limits: Optional["child.Limits"] = None  # Read from the environment on start.
+# How much slower, or larger, a run can be than the previous version's before it is flagged.
+regression_threshold = 0.1
+REGRESSION_THRESHOLD_VARIABLE = "QUICKPYTHON_REGRESSION_THRESHOLD"  # A percentage.
+# The reloads sent to current_run that it hasn't reported on yet, in order, each with whether
+# anything besides functions and classes changed too.
+pending_reloads: List[Tuple["child.Reload", bool]] = []
+debug_paused = False
+program_kernel: Optional["kernel.Kernel"] = None
+smart_session: Optional["incremental.Session"] = None
+output_visible = False
 
 code_frame_style = Style.from_dict({"frame.label": "bg:#AAAAAA fg:#0000aa"})
 style = Style.from_dict(
@@ -86,6 +114,22 @@ style = Style.from_dict(
         "scrollbar.background": "bg:#AAAAAA",
         "scrollbar.button": "bg:black fg:black",
         "scrollbar.arrow": "bg:#AAAAAA fg:black bold",
+        "output": "bg:#000000 fg:#AAAAAA nobold",
+        "program-input": "bg:#000000 fg:#FFFFFF",
+        "report.header": "bg:#AAAAAA fg:#000000",
+        "breakpoint": "fg:#FF5555",
+        "paused-line": "fg:#FFFF55",
+        "covered": "fg:#55FF55",
+        "flame.0": "bg:#AA0000 fg:#FFFFFF nobold",
+        "flame.1": "bg:#AA5500 fg:#FFFFFF nobold",
+        "flame.2": "bg:#555500 fg:#FFFFFF nobold",
+        "flame.3": "bg:#AA5555 fg:#FFFFFF nobold",
+        "not-covered": "fg:#FF5555",
+        "line-heat.0": "bg:#000055 fg:#AAAAAA nobold",
+        "line-heat.1": "bg:#005555 fg:#FFFFFF nobold",
+        "line-heat.2": "bg:#555500 fg:#FFFFFF nobold",
+        "line-heat.3": "bg:#AA5500 fg:#FFFFFF nobold",
+        "line-heat.4": "bg:#AA0000 fg:#FFFFFF",
         "": "bg:#0000AA fg:#AAAAAA bold",
     }
 )
@@ -95,17 +139,108 @@ style = Style.from_dict(
 def _(event):
     """Focus the menu"""
     if event.app.layout.has_focus(root_container.window):
-        event.app.layout.focus(code)
+        focus_editor()
     else:
         event.app.layout.focus(root_container.window)
 
 
-def format_code(contents: str) -> str:
-    return black_format_code(isort_format_code(contents))
+def get_formatted_files() -> "storage.FormattedFiles":
+    global formatted_files
+
+    if formatted_files is None:
+        from quickpython import storage
+
+        formatted_files = storage.FormattedFiles(storage.cache_dir() / "formatted_files.json")
+    return formatted_files
+
+
+def get_run_history() -> "storage.RunHistory":
+    global run_history
+
+    if run_history is None:
+        from quickpython import storage
+
+        run_history = storage.RunHistory(storage.cache_dir() / "run_history.json")
+    return run_history
+
+
+def get_program_runner() -> "runner.Runner":
+    global program_runner
+
+    if program_runner is None:
+        from quickpython import runner
+
+        program_runner = runner.Runner()
+    return program_runner
+
+
+def get_program_kernel() -> "kernel.Kernel":
+    global program_kernel
 
+    if program_kernel is None:
+        from quickpython import kernel
 
-def isort_format_code(contents: str) -> str:
-    return isort.code(contents, config=isort_config)
+        program_kernel = kernel.Kernel(_show_kernel_output)
+    return program_kernel
+
+
+def get_smart_session() -> "incremental.Session":
+    global smart_session
+
+    if smart_session is None:
+        from quickpython import incremental
+
+        smart_session = incremental.Session(_show_kernel_output)
+    return smart_session
+
+
+def load_formatting():
+    """Imports the formatting stack and discovers the default configuration for it."""
+    global default_isort_config
+    global default_black_config
+
+    import isort
+
+    isort_config, default_black_config = config_resolver.resolve(Path.cwd())
+    if isort_config == isort.settings.DEFAULT_CONFIG:
+        isort_config = isort.Config(profile="black", float_to_top=True)
+    default_isort_config = isort_config
+
+
+def prewarm() -> asyncio.Future:
+    """Starts loading the formatters off of the event loop, and the warm process programs are
+    run from, if that hasn't started already.
+
+    Called once the first frame has been drawn so it never delays the editor appearing.
+    """
+    global prewarmed
+
+    if prewarmed is None:
+        prewarmed = asyncio.get_event_loop().run_in_executor(None, load_formatting)
+        format_scheduler.warm()
+        get_program_runner().warm()
+    return prewarmed
+
+
+async def formatting_ready():
+    """The barrier every format call waits at until the formatters and their configuration for
+    the current file are loaded.
+    """
+    global isort_config
+    global black_config
+
+    await prewarm()
+    while isort_config is None:
+        if current_file is None:
+            isort_config, black_config = default_isort_config, default_black_config
+            return
+
+        path = current_file
+        configs = await asyncio.get_event_loop().run_in_executor(
+            None, config_resolver.resolve, path.parent
+        )
+        if path == current_file and isort_config is None:
+            isort_config, black_config = configs
 
 
 class TextInputDialog:
@@ -187,7 +322,6 @@ def open_file(event=None):
     async def coroutine():
         global current_file
         global isort_config
-        global black_config
 
         open_dialog = TextInputDialog(
             title="Open file",
@@ -199,17 +333,10 @@ def open_file(event=None):
 
         if filename is not None:
             current_file = Path(filename).resolve()
-            isort_config = isort.Config(settings_path=current_file.parent)
-            black_config_file = black.find_pyproject_toml((str(current_file),))
-            if black_config_file:
-                black_config = black.parse_pyproject_toml(black_config_file)
-            else:
-                black_config = {}
+            isort_config = None
 
             try:
-                with open(current_file, "r", encoding="utf8") as new_file_conent:
-                    code.buffer.text = new_file_conent.read()
-                    open_file_frame.title = current_file.name
+                load_file(current_file)
                 feedback(f"Successfully opened {current_file}")
             except IOError as error:
                 feedback(f"Error: {error}")
@@ -218,10 +345,12 @@ def open_file(event=None):
 
 
 def save_as_file():
+    if is_read_only():
+        return
+
     async def coroutine():
         global current_file
         global isort_config
-        global black_config
 
         save_dialog = TextInputDialog(
             title="Save file",
@@ -233,12 +362,7 @@ def save_as_file():
 
         if filename is not None:
             current_file = Path(filename).resolve()
-            isort_config = isort.Config(settings_path=current_file.parent)
-            black_config_file = black.find_pyproject_toml((str(current_file),))
-            if black_config_file:
-                black_config = black.parse_pyproject_toml(black_config_file)
-            else:
-                black_config = {}
+            isort_config = None
             if not current_file.suffixes and not current_file.exists():
                 current_file = current_file.with_suffix(".py")
             open_file_frame.title = current_file.name
@@ -251,33 +375,70 @@ def feedback(text):
     immediate.buffer.text = text
 
 
-def black_format_code(contents: str) -> str:
-    """Formats the given import section using black."""
-    try:
-        immediate.buffer.text = ""
-        return black.format_file_contents(
-            contents,
-            fast=True,
-            mode=black.FileMode(
-                **{k: v for k, v in black_config.items() if k in BLACK_ALLOWED_MODE_KEYS}
-            ),
-        )
-    except black.NothingChanged:
-        return contents
-    except Exception as error:
-        immediate.buffer.text = str(error)
-        return contents
+def load_file(path: Path):
+    """Loads the file into the code pane, or into a read-only viewer if it is very large."""
+    global large_file
+    global fixtures_directory
+
+    from quickpython import viewer
+
+    close_large_file()
+    fixtures_directory = None
+    if path.stat().st_size > VIEWER_SIZE_THRESHOLD:
+        code.buffer.text = ""
+        large_file = viewer.LargeFileViewer(path)
+        open_file_frame.body = Window(large_file, style="class:large-file")
+        open_file_frame.title = f"{path.name} (read-only)"
+    else:
+        with path.open(encoding="utf8") as new_file_content:
+            code.buffer.text = new_file_content.read()
+        open_file_frame.title = path.name
+    focus_editor()
+
+
+def close_large_file():
+    global large_file
+
+    if large_file is not None:
+        large_file.close()
+        large_file = None
+        open_file_frame.body = code_pane
+
+
+def focus_editor():
+    app.layout.focus(large_file or code)
+
+
+def is_read_only() -> bool:
+    if large_file is not None:
+        feedback(f"{large_file.path} is too large to edit and is open read-only")
+        return True
+    return False
+
+
+def format_request(contents: str, **kwargs) -> formatting.FormatRequest:
+    return formatting.FormatRequest(buffer_version, contents, isort_config, black_config, **kwargs)
+
+
+async def format_buffer(add_imports: Sequence[str] = ()):
+    """Formats the whole buffer in the background, unless it is edited in the meantime."""
+    await formatting_ready()
+    request = format_request(code.buffer.text, add_imports=add_imports)
+    formatted_code, error = await format_scheduler.format(request)
+    feedback(error)
+    if not format_scheduler.is_stale(request):
+        code.buffer.text = formatted_code
 
 
 def new(content=""):
     """Creates a new file buffer."""
     global current_file
     global isort_config
-    global black_config
 
     current_file = None
-    isort_config = default_isort_config
-    black_config = default_black_config
+    isort_config = None
+    close_large_file()
+    focus_editor()
     code.buffer.text = content
     open_file_frame.title = "Untitled"
     feedback("")
@@ -301,74 +462,896 @@ def indent(event):
 
 @kb.add("enter", filter=is_code_focused)
 def enter(event):
+    global pending_format_row
+
     buffer = event.app.current_buffer
     buffer.insert_text("\n")
     if current_file and ".py" not in current_file.suffixes and ".pyi" not in current_file.suffixes:
         return
 
+    row = buffer.document.cursor_position_row - 1
+    pending_format_row = row if pending_format_row is None else min(row, pending_format_row)
+    format_scheduler.schedule("enter", format_block_request)
+
+
+def format_block_request() -> Optional[formatting.FormatRequest]:
+    """Snapshots the top-level blocks edited since the last format so they can be formatted in
+    the background. Held down or rapidly repeated Enter presses are merged into one request.
+    """
+    global pending_format_row
+
+    buffer = code.buffer
+    document = buffer.document
+    first_row = min(pending_format_row or 0, document.cursor_position_row)
+    pending_format_row = None
+
     old_cursor_position = buffer.cursor_position
-    if old_cursor_position == 0:
-        return
+    text = buffer.text
+    end_position = text.rfind("\n", 0, old_cursor_position) + 1
+    while end_position >= 2 and text[end_position - 2] == "\n":
+        end_position -= 1
+    if end_position < 2:
+        return None
 
-    end_position = buffer.text.rfind("\n", 0, old_cursor_position) + 1
-    code, rest = buffer.text[:end_position], buffer.text[end_position:]
-    if len(code) < 2 or (code[-1] == "\n" and code[-2] == "\n"):
-        return
+    first_line_end = document.translate_row_col_to_index(first_row + 1, 0)
+    start_position = formatting.block_start(text, min(first_line_end, end_position))
+
+    def apply(formatted_code: str, error: str):
+        feedback(error)
+        difference = len(formatted_code) - (end_position - start_position)
+        buffer.text = text[:start_position] + formatted_code + text[end_position:]
+        buffer.cursor_position = old_cursor_position + difference
 
-    formatted_code = format_code(code)
-    difference = len(formatted_code) - len(code)
-    buffer.text = formatted_code + rest
-    buffer.cursor_position = old_cursor_position + difference
+    return format_request(text[start_position:end_position], apply=apply)
 
 
 @kb.add("c-s")
 def save_file(event=None):
-    if not current_file:
+    if is_read_only():
+        return
+    elif not current_file:
         save_as_file()
         return
 
-    buffer = app.current_buffer
-    buffer.text = format_code(buffer.text)
-    current_file.write_text(buffer.text, encoding="utf8")
-    immediate.buffer.text = f"Successfully saved {current_file}"
+    ensure_future(_save_file(current_file))
 
 
-async def _run_buffer(debug: bool = False):
-    buffer_filename = f"{current_file or 'buffer'}.qpython"
-    with open(buffer_filename, "w") as buffer_file:
-        user_code = app.current_buffer.text
-        if not user_code.endswith("\n"):
-            user_code += "\n"
-        with_qpython_injected = isort.code(user_code, add_imports=["import quickpython.extensions"])
-        buffer_file.write(isort_format_code(with_qpython_injected))
-        if debug:
-            buffer_file.write("breakpoint()")
+async def _save_file(path: Path):
+    """Formats the buffer and writes it out, with all file I/O happening off the event loop."""
+    from quickpython import storage
 
+    started = time.perf_counter()
+    contents = code.buffer.text
+    loop = asyncio.get_event_loop()
     try:
-        clear()
-        os.environ["PYTHONBREAKPOINT"] = "ipdb.set_trace"
-        await app.run_system_command(f'{sys.executable} "{buffer_filename}"')
+        await formatting_ready()
+        fingerprint = format_scheduler.cache.fingerprint(isort_config, black_config)
+        if await loop.run_in_executor(
+            None, get_formatted_files().is_formatted, path, contents, fingerprint
+        ):
+            feedback(f"{path} is already saved ({(time.perf_counter() - started) * 1000:.0f} ms)")
+            return
+
+        request = format_request(contents)
+        formatted_code, error = await format_scheduler.format(request)
+        if not format_scheduler.is_stale(request):
+            code.buffer.text = formatted_code
+    except Exception as format_error:  # The buffer is written out unformatted rather than lost.
+        formatted_code, error = contents, str(format_error) or type(format_error).__name__
+    try:
+        written = await loop.run_in_executor(None, storage.write_if_changed, path, formatted_code)
+        if not error:
+            await loop.run_in_executor(
+                None, get_formatted_files().record, path, formatted_code, fingerprint
+            )
+    except OSError as write_error:
+        feedback(f"Error: {write_error}")
+        return
+
+    elapsed = (time.perf_counter() - started) * 1000
+    if error:
+        saved = f"Saved {path}" if written else f"{path} is unchanged, nothing to write"
+        feedback(f"{saved} without formatting it ({elapsed:.0f} ms): {error}")
+    elif written:
+        feedback(f"Successfully saved {path} ({elapsed:.0f} ms)")
+    else:
+        feedback(f"{path} is unchanged, nothing to write ({elapsed:.0f} ms)")
+
+
+def buffer_program(**kwargs) -> "child.Program":
+    """Prepares the contents of the code pane to be run."""
+    from quickpython import child
+
+    user_code = code.buffer.text
+    if not user_code.endswith("\n"):
+        user_code += "\n"
+    limits = program_limits or child.Limits()
+    return child.Program(user_code, str(current_file or "<buffer>"), limits=limits, **kwargs)
+
+
+async def _run_buffer():
+    await run_program(buffer_program(), _reloaded)
+
+
+async def _debug_buffer(step: bool = False):
+    global debug_paused
+
+    program = buffer_program(
+        mode="debug", options={"breakpoints": sorted(breakpoints.breakpoints), "step": step}
+    )
+    try:
+        await run_program(program, _debugger_event)
+    finally:
+        if current_run is None:
+            debug_paused = False
+            breakpoints.paused_line = None
+
+
+async def run_program(
+    program: "child.Program", on_result: Optional["runner.OnResult"] = None
+) -> Optional[int]:
+    """Runs the program with its output shown in the output pane, returning its exit code."""
+    global current_run
+    global current_program
+
+    if current_run is not None:
+        current_run.kill()
+        await current_run.wait()
+
+    output_buffer.clear()
+    output_control.cursor_line = None
+    show_output()
+    app.layout.focus(program_input)
+
+    def on_output(data: bytes):
+        output_buffer.write(data)
+        app.invalidate()
+
+    breached: Optional[str] = None  # The limit the program went over, if it did.
+
+    def on_report(kind: str, result):
+        nonlocal breached
+        if kind == "limit":
+            breached = result
+            run.kill()
+        elif on_result is not None:
+            on_result(kind, result)
+
+    started, started_at = time.time(), time.perf_counter()
+    run = current_run = await get_program_runner().launch(program, on_output, on_report)
+    current_program = program
+    pending_reloads.clear()
+    exited = asyncio.ensure_future(run.wait())
+    try:
+        done, _ = await asyncio.wait({exited}, timeout=program.limits.wall_seconds)
+        if not done:
+            breached = "wall_seconds"
+            run.kill()
+        exit_code = await exited
     finally:
-        os.remove(buffer_filename)
+        if current_run is run:
+            current_run = current_program = None
+    if hasattr(signal, "SIGXCPU") and exit_code == -signal.SIGXCPU:
+        breached = "cpu_seconds"
+    if breached is not None:
+        feedback(limit_message(breached, program.limits))
+    else:
+        feedback(f"Program finished with exit code {exit_code}")
+    if program.mode == "run":  # Other modes measure the program, slowing it down.
+        wall_seconds = time.perf_counter() - started_at
+        flag = await _record_run(program, started, wall_seconds, exit_code, run.usage)
+        if flag and breached is None:
+            feedback(
+                f"Program finished with exit code {exit_code} in "
+                f"{reports.format_duration(wall_seconds)} (compared with the previous version: "
+                f"{flag})"
+            )
+    if app.layout.has_focus(program_input):
+        focus_editor()
+    return exit_code
+
+
+async def _record_run(
+    program: "child.Program",
+    started: float,
+    wall_seconds: float,
+    exit_code: int,
+    usage: Optional["child.Usage"],
+) -> str:
+    """Adds a run to the history, returning what got notably worse or better since the previous
+    version of the program.
+    """
+    from quickpython import storage
+
+    source_hash = storage.content_hash(program.source)
+    entry = (
+        program.filename,
+        source_hash,
+        started,
+        wall_seconds,
+        usage.cpu_seconds if usage else None,
+        usage.peak_rss if usage else None,
+        exit_code,
+    )
+
+    def record() -> List[storage.RunEntry]:
+        get_run_history().record(entry)
+        return get_run_history().runs(program.filename)
+
+    runs = await asyncio.get_event_loop().run_in_executor(None, record)
+    return reports.history_rows(runs, source_hash, regression_threshold)[-1].flag
+
+
+async def _show_run_history():
+    from quickpython import storage
+
+    filename = str(current_file or "<buffer>")
+    runs = await asyncio.get_event_loop().run_in_executor(None, get_run_history().runs, filename)
+    if not runs:
+        feedback("This program hasn't been run yet")
+        return
+
+    current_hash = storage.content_hash(buffer_program().source)
+    rows = reports.history_rows(runs, current_hash, regression_threshold)
+    table = reports.ReportTable(reports.HISTORY_COLUMNS, rows, _select_run)
+    show_output(table, f"Run History ({len(rows)} runs, * marks the current version)")
+
+
+def _select_run(row: reports.HistoryRow):
+    changes = [
+        f"{name} {change:+.1%}"
+        for name, change in (("time", row.time_change), ("peak memory", row.memory_change))
+        if change is not None
+    ]
+    feedback(
+        f"Version {row.version} took {reports.format_duration(row.wall_seconds)}"
+        + (f", {', '.join(changes)} from the previous version" if changes else "")
+    )
+
+
+def limit_message(limit: str, limits: "child.Limits") -> str:
+    """Explains which of its limits a program was stopped for going over."""
+    from quickpython import child
+
+    if limit == "cpu_seconds":
+        went_over = f"used more CPU time than its limit of {limits.cpu_seconds} s"
+    elif limit == "memory_mb":
+        went_over = f"used more memory than its limit of {limits.memory_mb} MiB"
+    elif limit == "open_files":
+        went_over = f"had more files open than its limit of {limits.open_files}"
+    else:
+        went_over = f"ran for longer than its limit of {limits.wall_seconds:g} s"
+    return f"Program stopped: it {went_over}. The limit is set by {child.LIMIT_VARIABLES[limit]}."
+
+
+def _reloaded(kind: str, result):
+    global current_program
+
+    from quickpython import hot_reload
+
+    if not pending_reloads:  # Sent to a run that has since been replaced.
+        return
+
+    reloaded, failed = result
+    request, other_changes = pending_reloads.pop(0)
+    if current_program is not None and reloaded:
+        # Only what was swapped in counts as running, so anything else still shows as changed.
+        source = hot_reload.applied(current_program.source, request.text, reloaded)
+        current_program = dataclasses.replace(current_program, source=source)
+    message = f"Reloaded {', '.join(reloaded)}" if reloaded else "Nothing was reloaded"
+    if failed:
+        message += f", restart to change {', '.join(failed)}"
+    feedback(message + (", other changes need a restart" if other_changes else ""))
+
+
+def _show_kernel_output(data: bytes):
+    output_buffer.write(data)
+    app.invalidate()
+
+
+async def _run_cell():
+    from quickpython import child, kernel
+
+    document = code.buffer.document
+    start, end = kernel.cell_at(document.lines, document.cursor_position_row)
+    source = "".join(line + "\n" for line in document.lines[start:end])
+    cell = child.Cell(source, str(current_file or "<buffer>"), start + 1, document.text)
+    show_output()
+    feedback(f"Running the cell on lines {start + 1}-{end}...")
+    succeeded = await get_program_kernel().execute(cell)
+    if succeeded is None:
+        feedback("The kernel exited before the cell finished")
+    else:
+        feedback(f"Cell on lines {start + 1}-{end} {'finished' if succeeded else 'failed'}")
+
+
+async def _restart_kernel():
+    await get_program_kernel().restart()
+    await get_smart_session().restart()
+    feedback("Kernel restarted, the next cell or Smart Run starts with a fresh namespace")
+
+
+async def _smart_run():
+    session = get_smart_session()
+    if session.busy:
+        feedback("Smart Run is still running, stop it first to run again")
+        return
+
+    output_buffer.clear()
+    output_control.cursor_line = None
+    show_output()
+    feedback("Running the statements that changed...")
+    started = time.perf_counter()
+    try:
+        result = await session.run(buffer_program().source, str(current_file or "<buffer>"))
+    except SyntaxError as error:
+        feedback(f"Can't run until the syntax error on line {error.lineno} is fixed")
+        return
+
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.exited:
+        feedback(f"The kernel exited on line {result.failed}, the next run starts from scratch")
+    elif result.failed is not None:
+        feedback(f"Smart Run stopped at the statement that failed on line {result.failed}")
+    else:
+        feedback(
+            f"Smart Run ran {result.ran} of {result.ran + result.replayed} statements, the rest "
+            f"were unchanged ({elapsed:.0f} ms)"
+        )
+
+
+def _debugger_event(kind: str, result):
+    global debug_paused
+
+    if kind == "paused":
+        line, stack, variables = result
+        debug_paused = True
+        breakpoints.paused_line = line
+        code.buffer.cursor_position = code.buffer.document.translate_row_col_to_index(line - 1, 0)
+        where = " called from ".join(
+            f"{function} line {frame_line}" for function, frame_line in stack[:3]
+        )
+        rows = [reports.VariableRow(name, value, line) for name, value in variables]
+        show_output(
+            reports.ReportTable(reports.VARIABLE_COLUMNS, rows, jump_to_row),
+            f"Paused in {where}",
+            with_input=True,
+        )
+        feedback("F5 continue, F8 step, F10 step over, F11 step out, or enter an expression")
+    elif kind == "resumed":
+        debug_paused = False
+        breakpoints.paused_line = None
+        show_output()
+    elif kind == "evaluated":
+        expression, value = result
+        feedback(f"{expression} = {value}")
+    app.invalidate()
+
+
+async def _profile_buffer():
+    program = buffer_program(mode="profile")
+    stats = []
+    await run_program(program, lambda kind, result: stats.append(result))
+    if stats:
+        rows = reports.profile_rows(stats[-1], program.filename)
+        show_output(reports.ReportTable(reports.PROFILE_COLUMNS, rows, jump_to_row), "Profile")
+
+
+async def _memory_profile_buffer():
+    program = buffer_program(mode="memory", options={"interval": MEMORY_SAMPLE_INTERVAL})
+    snapshots = []
+
+    def on_result(kind, snapshot):
+        snapshots.append(snapshot)
+        _lines, current, peak, _peak_rss = snapshot
+        output_frame.title = (
+            f"Output (memory {reports.format_size(current)}, peak {reports.format_size(peak)})"
+        )
+        app.invalidate()
+
+    await run_program(program, on_result)
+    if snapshots:
+        lines, _current, peak, peak_rss = snapshots[-1]
+        title = f"Memory Profile (peak traced {reports.format_size(peak)}"
+        if peak_rss:
+            title += f", peak RSS {reports.format_size(peak_rss)}"
+        rows = reports.memory_rows(lines, program.source)
+        show_output(reports.ReportTable(reports.MEMORY_COLUMNS, rows, jump_to_row), title + ")")
+
+
+# The call stacks seen by the last sampling profile, with how many samples saw each.
+sampled_stacks: Dict[Tuple[str, ...], int] = {}
+
+
+async def _sample_buffer():
+    global sampled_stacks
+
+    program = buffer_program(mode="sample", options={"interval": STACK_SAMPLE_INTERVAL})
+    results = []
+    await run_program(program, lambda kind, result: results.append(result))
+    if not results:
+        return
+
+    sampled_stacks = results[-1]
+    samples = sum(sampled_stacks.values())
+    graph = reports.FlameGraph(sampled_stacks, lambda node: _select_frame(node, samples))
+    show_output(graph, f"Sampling Profile ({samples} samples)")
+
+
+def _select_frame(node: reports.FlameNode, samples: int):
+    feedback(f"{node.name}: {node.count} samples, {100 * node.count / max(samples, 1):.1f}%")
+
+
+async def _export_samples():
+    from quickpython import sampler, storage
+
+    if not sampled_stacks:
+        feedback("Run with Sampling Profile first to have samples to export")
+        return
+
+    dialog = TextInputDialog(
+        title="Export samples",
+        label_text="Enter the path of a file to save the collapsed stacks to:",
+        completer=PathCompleter(),
+    )
+    filename = await show_dialog_as_float(dialog)
+    if filename:
+        path = Path(filename).expanduser().resolve()
+        try:
+            storage.atomic_write(path, sampler.collapsed(sampled_stacks))
+            feedback(f"Saved {len(sampled_stacks)} stacks to {path}")
+        except OSError as error:
+            feedback(f"Error: {error}")
+
+
+async def _profile_buffer_lines():
+    program = buffer_program(mode="lines")
+    results = []
+    await run_program(program, lambda kind, result: results.append(result))
+    if results and program.source == code.buffer.text:
+        line_heat.show(*results[-1])
+        feedback("Line times shown next to the code until it is edited")
+
+
+# The lines that ran and that could have in recent coverage runs, by the hash of the source run.
+coverage_results: Dict[bytes, Tuple[List[int], List[int]]] = {}
 
 
-async def _view_buffer():
-    clear()
-    await app.run_system_command("echo ''")
+async def _run_with_coverage():
+    from quickpython import storage
+
+    program = buffer_program(mode="coverage")
+    results = []
+    await run_program(program, lambda kind, result: results.append(result))
+    if not results:
+        return
+
+    source_hash = storage.content_hash(program.source)
+    coverage_results.pop(source_hash, None)
+    coverage_results[source_hash] = results[-1]
+    for stale_hash in list(coverage_results)[:-COVERAGE_CACHE_SIZE]:
+        del coverage_results[stale_hash]
+    if buffer_program().source == program.source:
+        _show_coverage(*results[-1])
+
+
+def _show_coverage(executed: List[int], executable: List[int]):
+    coverage.show(executed, executable)
+    percent = 100 * len(executed) // max(len(executable), 1)
+    feedback(f"{percent}% of lines ran ({len(executed)} of {len(executable)})")
+
+
+def test_files() -> List[Tuple[str, str]]:
+    """Returns the names and contents of the test files next to the current file."""
+    if current_file is None:
+        return []
+    return [
+        (str(path), path.read_text(encoding="utf8"))
+        for path in sorted(current_file.resolve().parent.glob("*.py"))
+        if (path.name.startswith("test_") or path.stem.endswith("_test"))
+        and path.resolve() != current_file.resolve()
+    ]
+
+
+async def _run_tests():
+    program = buffer_program(mode="tests", options={"files": test_files(), "timeout": TEST_TIMEOUT})
+    table = reports.ReportTable(reports.TEST_COLUMNS, [], _select_test)
+    outcomes: Dict[str, int] = {}
+    total = 0
+
+    def summary() -> str:
+        finished = ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items()))
+        return f"{sum(outcomes.values())} of {total} tests finished: {finished or 'none yet'}"
+
+    def on_result(kind, result):
+        nonlocal total
+        if kind == "tests":
+            total = result
+            show_output(table, "Tests")
+        else:
+            name, filename, line, outcome, duration, test_output = result
+            if filename != program.filename:
+                line = None
+            table.add(reports.TestRow(name, filename, line, outcome, duration, test_output))
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            output_frame.title = f"Tests ({summary()})"
+        app.invalidate()
+
+    feedback("Running tests...")
+    await run_program(program, on_result)
+    if total:
+        feedback(summary())
+
+
+def _select_test(row: reports.TestRow):
+    """Jumps to a test in this program, and shows the end of what it printed."""
+    if row.line is not None:
+        jump_to_row(row)
+    output_lines = row.output.strip().splitlines()[-4:]
+    feedback("\n".join(output_lines) or f"{row.function} {row.outcome}")
+
+
+async def _attach_fixtures() -> bool:
+    global fixtures_directory
+
+    from quickpython import fixtures
+
+    dialog = TextInputDialog(
+        title="Attach fixtures",
+        label_text="Enter the directory of the input fixtures to run the program against:",
+        completer=PathCompleter(only_directories=True),
+    )
+    directory = await show_dialog_as_float(dialog)
+    if not directory:
+        return False
+
+    path = Path(directory).expanduser().resolve()
+    if not path.is_dir():
+        feedback(f"Error: {path} is not a directory")
+        return False
+    fixtures_directory = path
+    feedback(f"Attached {len(fixtures.find(path))} fixtures from {path}")
+    return True
+
+
+async def _run_fixtures():
+    from quickpython import fixtures, storage
+
+    if fixtures_directory is None and not await _attach_fixtures():
+        return
+    assert fixtures_directory is not None  # nosec
+    loop = asyncio.get_event_loop()
+    found = await loop.run_in_executor(None, fixtures.find, fixtures_directory)
+    inputs = {path.stem: path for path in found}
+    if not inputs:
+        feedback(f"No {fixtures.INPUT_SUFFIX} files found in {fixtures_directory}")
+        return
+
+    options = {
+        "fixtures": [(name, str(path)) for name, path in inputs.items()],
+        "timeout": FIXTURE_TIMEOUT,
+    }
+    program = buffer_program(mode="fixtures", options=options)
+    table = reports.ReportTable(reports.FIXTURE_COLUMNS, [], _select_fixture)
+    outcomes: Dict[str, int] = {}
+
+    def summary() -> str:
+        finished = ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items()))
+        return f"{sum(outcomes.values())} of {len(inputs)} fixtures finished: {finished}"
+
+    def check(name: str, exit_code: Optional[int], fixture_output: str) -> Tuple[str, str]:
+        """Returns the fixture's outcome and how its output differed from what was expected,
+        recording the output if nothing is expected yet. It reads and writes files, so it runs
+        off the event loop.
+        """
+        if exit_code is None:
+            return "timed out", ""
+        expected = fixtures.expected_output(inputs[name])
+        if expected is None:
+            storage.atomic_write(fixtures.expected_path(inputs[name]), fixture_output)
+            return "recorded", ""
+        diff = fixtures.compare(expected, fixture_output, name)
+        return ("failed" if diff else "passed"), diff
+
+    async def add_result(result, previous: Optional[asyncio.Future]):
+        name, exit_code, duration, fixture_output = result
+        outcome, diff = await loop.run_in_executor(None, check, name, exit_code, fixture_output)
+        if previous is not None:  # Rows are added in the order the fixtures finished.
+            await previous
+        row = reports.FixtureRow(
+            name, program.filename, None, outcome, duration, exit_code, fixture_output, diff
+        )
+        if not outcomes:
+            show_output(table, "Fixtures")
+        table.add(row)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        output_frame.title = f"Fixtures ({summary()})"
+        app.invalidate()
+
+    added: List[asyncio.Future] = []
+
+    def on_result(kind, result):
+        added.append(asyncio.ensure_future(add_result(result, added[-1] if added else None)))
+
+    feedback(f"Running {len(inputs)} fixtures...")
+    await run_program(program, on_result)
+    await asyncio.gather(*added)
+    if outcomes:
+        feedback(summary())
+
+
+def _select_fixture(row: reports.FixtureRow):
+    """Shows how a fixture's output differed from what was expected, or all of it if it didn't."""
+    output_buffer.clear()
+    output_control.cursor_line = None
+    output_buffer.write((row.diff or row.output).encode("utf8"))
+    show_output(title=f"Fixture {row.function}: {'diff' if row.diff else 'output'}")
+
+
+async def _time_selection():
+    import statistics
+    import textwrap
+
+    document = code.buffer.document
+    if document.selection is not None:
+        start, end = document.selection_range()
+    else:
+        start = document.cursor_position + document.get_start_of_line_position()
+        end = document.cursor_position + document.get_end_of_line_position()
+    statement = textwrap.dedent(document.text[start:end]).strip()
+    if not statement:
+        feedback("Select the code to time first")
+        return
+
+    program = buffer_program(mode="timeit", options={"statement": statement})
+    setup = document.text[:start] + document.text[end:]
+    try:  # The rest of the buffer is the setup, unless it doesn't make sense without the selection.
+        compile(setup, program.filename, "exec")
+    except SyntaxError:
+        pass
+    else:
+        program.source = setup
+
+    results = []
+    feedback(f"Timing {statement.splitlines()[0]}...")
+    await run_program(program, lambda kind, result: results.append(result))
+    if results:
+        loops, timings = results[-1]
+        summary = ", ".join(
+            f"{name} {reports.format_duration(value)}"
+            for name, value in (
+                ("min", min(timings)),
+                ("median", statistics.median(timings)),
+                ("stddev", statistics.stdev(timings) if len(timings) > 1 else 0.0),
+            )
+        )
+        feedback(f"{loops} loops, {len(timings)} runs: {summary} per loop")
+
+
+def jump_to_row(row):
+    """Moves the cursor to the line of the program a report row is about."""
+    if row.line is None:
+        feedback(f"{row.function} isn't part of this program")
+        return
+
+    code.buffer.cursor_position = code.buffer.document.translate_row_col_to_index(row.line - 1, 0)
+    focus_editor()
+
+
+def send_program_input(buffer) -> bool:
+    if debug_paused and current_run is not None:
+        current_run.request(("evaluate", buffer.text))
+        return False
+
+    output_buffer.feed(buffer.text + "\n")  # Echo the input, as a terminal would.
+    if current_run is not None:
+        current_run.send(buffer.text + "\n")
+    elif smart_session is not None and smart_session.busy:
+        smart_session.kernel.send(buffer.text + "\n")
+    else:
+        get_program_kernel().send(buffer.text + "\n")
+    return False
+
+
+def show_output(report: Optional[UIControl] = None, title: str = "Output", with_input=False):
+    """Shows the output pane, or a report in its place, optionally above the program input."""
+    global output_visible
+
+    output_visible = True
+    output_frame.title = title
+    if report is None:
+        output_frame.body = output_body
+    elif with_input:
+        output_frame.body = HSplit([Window(report, style="class:output"), program_input])
+        app.layout.focus(program_input)
+    else:
+        output_frame.body = Window(report, style="class:output")
+        app.layout.focus(output_frame)
+
+
+def stop_program(event=None):
+    if current_run is not None:
+        current_run.interrupt()
+    else:
+        if program_kernel is not None:
+            program_kernel.interrupt()
+        if smart_session is not None:
+            smart_session.kernel.interrupt()
 
 
 @kb.add("c-r")
 @kb.add("f5")
 def run_buffer(event=None):
-    asyncio.ensure_future(_run_buffer())
+    if debug_paused:
+        debugger_command("continue")
+    elif not is_read_only():
+        asyncio.ensure_future(_run_buffer())
+
+
+def debugger_command(command: str):
+    if debug_paused and current_run is not None:
+        current_run.request((command,))
+
+
+@kb.add("f8")
+def step(event=None):
+    """Steps into the next line, starting the program paused on its first if it isn't running."""
+    if debug_paused:
+        debugger_command("step")
+    elif current_run is None and not is_read_only():
+        asyncio.ensure_future(_debug_buffer(step=True))
+
+
+@kb.add("f10")
+def step_over(event=None):
+    debugger_command("next")
+
+
+@kb.add("f11")
+def step_out(event=None):
+    debugger_command("out")
+
+
+@kb.add("f9")
+def toggle_breakpoint(event=None):
+    line = code.buffer.document.cursor_position_row + 1
+    added = breakpoints.toggle(line)
+    if current_program is not None and current_program.mode == "debug":
+        assert current_run is not None  # nosec
+        current_run.request(("breakpoints", sorted(breakpoints.breakpoints)))
+    feedback(f"Breakpoint {'set' if added else 'cleared'} on line {line}")
+
+
+@kb.add("f6")
+def run_cell(event=None):
+    if not is_read_only():
+        asyncio.ensure_future(_run_cell())
+
+
+@kb.add("f7")
+def reload_changes(event=None):
+    """Swaps the functions and classes edited since the running program started into it."""
+    from quickpython import hot_reload
+
+    if current_run is None or current_program is None or current_program.mode != "run":
+        feedback("Start the program first to reload changes into it")
+        return
+
+    try:
+        request, other_changes = hot_reload.changes(
+            current_program.source, buffer_program().source, current_program.filename
+        )
+    except SyntaxError as error:
+        feedback(f"Can't reload until the syntax error on line {error.lineno} is fixed")
+        return
+
+    if request is None:
+        if other_changes:
+            feedback("Only functions and classes can be reloaded, restart to run other changes")
+        else:
+            feedback("No functions or classes have changed since the program started")
+    elif current_run.request(request):
+        pending_reloads.append((request, other_changes))
+        feedback(f"Reloading {', '.join(request.names)}...")
+
+
+def restart_kernel():
+    asyncio.ensure_future(_restart_kernel())
+
+
+def smart_run():
+    """Runs only the top level statements that changed since the last Smart Run, along with
+    those that depend on them, replaying what the others printed.
+    """
+    if not is_read_only():
+        asyncio.ensure_future(_smart_run())
 
 
 def debug():
-    asyncio.ensure_future(_run_buffer(debug=True))
+    """Runs the program until a breakpoint, or paused on its first line if there are none."""
+    if not is_read_only():
+        asyncio.ensure_future(_debug_buffer(step=not breakpoints.breakpoints))
+
+
+def profile():
+    if not is_read_only():
+        asyncio.ensure_future(_profile_buffer())
+
+
+def profile_lines():
+    if not is_read_only():
+        asyncio.ensure_future(_profile_buffer_lines())
+
+
+def sample_profile():
+    if not is_read_only():
+        asyncio.ensure_future(_sample_buffer())
+
+
+def export_samples():
+    asyncio.ensure_future(_export_samples())
+
+
+def show_run_history():
+    asyncio.ensure_future(_show_run_history())
+
+
+def run_with_coverage():
+    if not is_read_only():
+        asyncio.ensure_future(_run_with_coverage())
+
+
+def toggle_coverage():
+    """Hides the coverage margin, or shows it again, running the program if it hasn't been run
+    with coverage since it last changed.
+    """
+    from quickpython import storage
+
+    if coverage.shown:
+        coverage.clear()
+        return
+
+    results = coverage_results.get(storage.content_hash(buffer_program().source))
+    if results is not None:
+        _show_coverage(*results)
+    else:
+        run_with_coverage()
+
+
+def run_tests():
+    if not is_read_only():
+        asyncio.ensure_future(_run_tests())
+
+
+def attach_fixtures():
+    asyncio.ensure_future(_attach_fixtures())
+
+
+def run_fixtures():
+    if not is_read_only():
+        asyncio.ensure_future(_run_fixtures())
+
+
+def time_selection():
+    if not is_read_only():
+        asyncio.ensure_future(_time_selection())
+
+
+def memory_profile():
+    if not is_read_only():
+        asyncio.ensure_future(_memory_profile_buffer())
 
 
 def view_buffer(event=None):
-    asyncio.ensure_future(_view_buffer())
+    global output_visible
+
+    output_visible = not output_visible
+    if not output_visible and app.layout.has_focus(output_frame):
+        focus_editor()
+
+
+def format_cache_statistics():
+    feedback(str(format_scheduler.cache))
 
 
 @kb.add("c-z")
@@ -415,6 +1398,31 @@ code = TextArea(
 )
 code.window.right_margins[0].up_arrow_symbol = "↑"  # type: ignore
 code.window.right_margins[0].down_arrow_symbol = "↓"  # type: ignore
+line_heat = reports.LineHeatMargin()
+code.window.left_margins.append(line_heat)
+coverage = reports.CoverageMargin()
+code.window.left_margins.append(coverage)
+breakpoints = reports.BreakpointMargin()
+code.window.left_margins.insert(0, breakpoints)
+buffer_version = 0
+
+
+def _count_buffer_version(_buffer):
+    global buffer_version
+    buffer_version += 1
+
+
+def _clear_line_heat(_buffer):
+    # The measurements no longer match the lines they are shown next to.
+    if line_heat.hits:
+        line_heat.clear()
+    if coverage.shown:
+        coverage.clear()
+
+
+code.buffer.on_text_changed += _count_buffer_version
+code.buffer.on_text_changed += _clear_line_heat
+format_scheduler = formatting.FormatScheduler(lambda: buffer_version, ready=formatting_ready)
 
 
 class CodeFrame:
@@ -574,21 +1582,18 @@ class ImmediateFrame:
         return self.container
 
 
-open_file_frame = CodeFrame(
-    HSplit(
-        [
-            # One window that holds the BufferControl with the default buffer on
-            # the left.
-            code,
-            # A vertical line in the middle. We explicitly specify the width, to
-            # make sure that the layout engine will not try to divide the whole
-            # width by three for all these windows. The window will simply fill its
-            # content by repeating this character.
-        ],
-    ),
-    title="Untitled",
-    style="class:code-frame",
+code_pane = HSplit(
+    [
+        # One window that holds the BufferControl with the default buffer on
+        # the left.
+        code,
+        # A vertical line in the middle. We explicitly specify the width, to
+        # make sure that the layout engine will not try to divide the whole
+        # width by three for all these windows. The window will simply fill its
+        # content by repeating this character.
+    ],
 )
+open_file_frame = CodeFrame(code_pane, title="Untitled", style="class:code-frame")
 
 
 @kb.add("c-g")
@@ -605,6 +1610,10 @@ def goto(event=None):
         except ValueError:
             feedback("Invalid line number")
         else:
+            if large_file is not None:
+                large_file.goto(line_number - 1)
+                return
+
             code.buffer.cursor_position = code.buffer.document.translate_row_col_to_index(
                 line_number - 1, 0
             )
@@ -625,7 +1634,8 @@ def replace_text():
         if replacement is None:
             return
 
-        code.buffer.text = format_code(code.buffer.text.replace(to_replace, replacement))
+        code.buffer.text = code.buffer.text.replace(to_replace, replacement)
+        await format_buffer()
 
     ensure_future(coroutine())
 
@@ -651,7 +1661,7 @@ def {function_name}():
     pass
 """
         )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer()
 
     ensure_future(coroutine())
 
@@ -671,7 +1681,7 @@ class {class_name}:
         pass
 """
         )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer()
 
     ensure_future(coroutine())
 
@@ -691,12 +1701,7 @@ class {class_name}:
     """Comment"""
 '''
         )
-        code.buffer.text = isort.code(
-            code.buffer.text,
-            add_imports=["from dataclasses import dataclass"],
-            float_to_top=True,
-        )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer(add_imports=["from dataclasses import dataclass"])
 
     ensure_future(coroutine())
 
@@ -715,7 +1720,7 @@ def add_method():
         pass
 """
         )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer()
 
     ensure_future(coroutine())
 
@@ -735,7 +1740,7 @@ def add_static_method():
         pass
 """
         )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer()
 
     ensure_future(coroutine())
 
@@ -755,17 +1760,39 @@ def add_class_method():
         pass
 """
         )
-        code.buffer.text = format_code(code.buffer.text)
+        await format_buffer()
 
     ensure_future(coroutine())
 
 
 @kb.add("c-f")
 def search(event=None):
+    if large_file is not None:
+        ensure_future(search_large_file())
+        return
+
     start_search(code.control)
 
 
+async def search_large_file(text: Optional[str] = None):
+    global last_search
+
+    if text is None:
+        text = await show_dialog_as_float(TextInputDialog(title="Find", label_text="Find:"))
+        if not text:
+            return
+        last_search = text
+
+    if large_file is not None and not large_file.search(text):
+        feedback(f"{text} not found")
+
+
 def search_next(event=None):
+    if large_file is not None:
+        if last_search:
+            ensure_future(search_large_file(last_search))
+        return
+
     search_state = app.current_search_state
 
     cursor_position = code.buffer.get_search_position(search_state, include_current_position=False)
@@ -784,6 +1811,8 @@ def example(game_name: str):
 
 
 def built_in_functions():
+    import pydoc
+
     docs = [
         pydoc.render_doc(builtin, renderer=pydoc.plaintext).split("\n", 1)[1]
         for builtin_name, builtin in vars(builtins).items()
@@ -797,11 +1826,27 @@ QLabel = partial(Label, dont_extend_width=True)
 SPACE = QLabel(" ")
 
 immediate = TextArea()
+output_buffer = output.OutputBuffer()
+output_control = output.OutputControl(output_buffer)
+program_input = TextArea(
+    multiline=False, prompt="> ", accept_handler=send_program_input, style="class:program-input"
+)
+output_bindings = KeyBindings()
+output_bindings.add("c-c")(stop_program)
+output_body = HSplit([Window(output_control, style="class:output"), program_input])
+output_frame = ImmediateFrame(
+    output_body,
+    title="Output",
+    height=12,
+    style="fg:#AAAAAA bold",
+    key_bindings=output_bindings,
+)
 root_container = MenuContainer(
     body=HSplit(
         [
             open_file_frame,
             search_toolbar,
+            ConditionalContainer(output_frame, filter=Condition(lambda: output_visible)),
             ImmediateFrame(
                 immediate,
                 title="Immediate",
@@ -815,6 +1860,8 @@ root_container = MenuContainer(
                     QLabel("<F5=Run>"),
                     SPACE,
                     QLabel("<CTRL+R=Run>"),
+                    SPACE,
+                    QLabel("<F6=Run Cell>"),
                 ],
                 style="bg:#00AAAA fg:white bold",
                 height=1,
@@ -856,7 +1903,10 @@ root_container = MenuContainer(
         ),
         MenuItem(
             " View ",
-            children=[MenuItem("Output Screen", handler=view_buffer)],
+            children=[
+                MenuItem("Output Screen", handler=view_buffer),
+                MenuItem("Format Cache Statistics", handler=format_cache_statistics),
+            ],
         ),
         MenuItem(
             " Search ",
@@ -870,7 +1920,29 @@ root_container = MenuContainer(
             " Run ",
             children=[
                 MenuItem("Start (F5)", handler=run_buffer),
+                MenuItem("Stop (CTRL+C in Output)", handler=stop_program),
+                MenuItem("Run Cell (F6)", handler=run_cell),
+                MenuItem("Smart Run", handler=smart_run),
+                MenuItem("Reload Changes (F7)", handler=reload_changes),
+                MenuItem("Restart Kernel", handler=restart_kernel),
                 MenuItem("Debug", handler=debug),
+                MenuItem("Toggle Breakpoint (F9)", handler=toggle_breakpoint),
+                MenuItem("Continue (F5)", handler=run_buffer),
+                MenuItem("Step (F8)", handler=step),
+                MenuItem("Step Over (F10)", handler=step_over),
+                MenuItem("Step Out (F11)", handler=step_out),
+                MenuItem("Profile", handler=profile),
+                MenuItem("Profile Lines", handler=profile_lines),
+                MenuItem("Run with Sampling Profile", handler=sample_profile),
+                MenuItem("Export Samples...", handler=export_samples),
+                MenuItem("Time Selection", handler=time_selection),
+                MenuItem("Run with Coverage", handler=run_with_coverage),
+                MenuItem("Toggle Coverage", handler=toggle_coverage),
+                MenuItem("Run Tests", handler=run_tests),
+                MenuItem("Run History", handler=show_run_history),
+                MenuItem("Run Fixtures", handler=run_fixtures),
+                MenuItem("Attach Fixtures...", handler=attach_fixtures),
+                MenuItem("Run with Memory Profile", handler=memory_profile),
             ],
         ),
         MenuItem(
@@ -922,33 +1994,59 @@ app: Application = Application(
 def start(argv=None):
     global current_file
     global isort_config
-    global black_config
+    global program_limits
+    global regression_threshold
+
+    from quickpython import child
 
     argv = sys.argv if argv is None else argv
+    try:
+        program_limits = child.Limits.from_environ(dict(os.environ))
+    except ValueError as error:
+        sys.exit(f"Invalid limit: {error}")
+    if os.environ.get(REGRESSION_THRESHOLD_VARIABLE):
+        try:
+            regression_threshold = float(os.environ[REGRESSION_THRESHOLD_VARIABLE]) / 100
+        except ValueError:
+            sys.exit(f"{REGRESSION_THRESHOLD_VARIABLE} must be a percentage")
     if len(sys.argv) > 2:
         sys.exit("Usage: qpython [filename]")
     elif len(sys.argv) == 2:
         current_file = Path(sys.argv[1]).resolve()
-        isort_config = isort.Config(settings_path=current_file.parent)
-        black_config_file = black.find_pyproject_toml((str(current_file),))
-        if black_config_file:
-            black_config = black.parse_pyproject_toml(black_config_file)
-        else:
-            black_config = {}
+        isort_config = None
 
         open_file_frame.title = current_file.name
         if current_file.exists():
-            with current_file.open(encoding="utf8") as open_file:
-                code.buffer.text = open_file.read()
+            load_file(current_file)
     else:
+        from prompt_toolkit.shortcuts import message_dialog
+
         message_dialog(
             title="Welcome to",
             text=ABOUT_MESSAGE,
             style=style,
         ).run()
 
-    app.layout.focus(code.buffer)
-    app.run()
+    focus_editor()
+
+    def prewarm_after_first_render(_app):
+        prewarm()
+        # Unsubscribed once this render's handlers have run, as they are being iterated over.
+        asyncio.get_event_loop().call_soon(
+            app.after_render.remove_handler, prewarm_after_first_render
+        )
+
+    app.after_render += prewarm_after_first_render
+    try:
+        app.run()
+    finally:
+        format_scheduler.shutdown()
+        if program_runner is not None:
+            program_runner.shutdown()
+        if program_kernel is not None:
+            program_kernel.shutdown()
+        if smart_session is not None:
+            smart_session.shutdown()
 
 
 if __name__ == "__main__":
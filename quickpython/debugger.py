@@ -0,0 +1,132 @@
+"""A debugger that runs inside programs started from QuickPython and is controlled from the editor.
+
+The editor sends breakpoints and commands over the connection the program reports results on, and
+is sent where the program paused, its call stack and its variables in return. Breakpoints can be
+changed at any time, even while the program runs.
+
+Lines are watched with `quickpython.line_events`, switched on just for the code objects holding a
+breakpoint, and each line without one switched off again after its first event, so everything
+else runs at full speed. Stepping switches them back on for all of the program's code until it
+pauses again.
+"""
+import reprlib
+import sys
+import types
+from queue import Queue
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+from quickpython import line_events
+
+STEPS = ("step", "next", "out")  # Into calls, over them, and out of the current function.
+
+Report = Callable[[str, Any], None]
+
+variable_repr = reprlib.Repr()
+variable_repr.maxstring = variable_repr.maxother = 200
+
+
+def describe(value: Any) -> str:
+    try:
+        return variable_repr.repr(value)
+    except Exception as error:
+        return f"<repr failed: {type(error).__name__}: {error}>"
+
+
+class Debugger:
+    """Runs a program, pausing it at breakpoints or after steps until the editor says to go on."""
+
+    def __init__(
+        self,
+        filename: str,
+        code: types.CodeType,
+        report: Report,
+        breakpoints: Sequence[int] = (),
+        step: bool = False,
+    ):
+        self.filename = filename
+        self.report = report
+        self.breakpoints: Set[int] = set(breakpoints)
+        self.commands: "Queue[Tuple[Any, ...]]" = Queue()
+        self.stepping = step
+        # The frames to pause in while stepping, or None to pause in any.
+        self.stop_in: Optional[Tuple[types.FrameType, ...]] = None
+        self.events = line_events.LineEvents(code, "DEBUGGER_ID", self._on_line)
+        self._watch_lines()
+
+    def receive(self, connection: Any) -> None:
+        """Takes breakpoints and commands from the editor until it disconnects."""
+        while True:
+            try:
+                request = connection.recv()
+            except (EOFError, OSError):
+                return
+            if request[0] == "breakpoints":
+                self.set_breakpoints(request[1])
+            else:
+                self.commands.put(request)
+
+    def set_breakpoints(self, lines: Sequence[int]) -> None:
+        self.breakpoints = set(lines)
+        self._watch_lines()
+
+    def run(self, code: types.CodeType, namespace: dict) -> None:
+        self.events.run(code, namespace)
+
+    def _on_line(self, code: types.CodeType, line: int) -> Any:
+        frame = sys._getframe(1)
+        while frame.f_code is not code:  # Passing over the tracer, when falling back to one.
+            frame = frame.f_back  # type: ignore
+        if self._should_pause(frame, line):
+            self._pause(frame, line)
+        elif not self.stepping:
+            return line_events.DISABLE  # Until the breakpoints change or a step starts.
+        return None
+
+    def _should_pause(self, frame: types.FrameType, line: int) -> bool:
+        if not self.stepping:
+            return line in self.breakpoints
+        return self.stop_in is None or frame in self.stop_in
+
+    def _pause(self, frame: types.FrameType, line: int) -> None:
+        callers: List[types.FrameType] = []
+        caller = frame.f_back
+        while caller is not None:
+            if caller.f_code.co_filename == self.filename:
+                callers.append(caller)
+            caller = caller.f_back
+        stack = [(each.f_code.co_name, each.f_lineno) for each in [frame] + callers]
+        variables = [(name, describe(value)) for name, value in sorted(frame.f_locals.items())]
+        self.report("paused", (line, stack, variables))
+
+        command, *arguments = self.commands.get()
+        while command == "evaluate":
+            self.report("evaluated", (arguments[0], self._evaluate(frame, arguments[0])))
+            command, *arguments = self.commands.get()
+
+        self.stepping = command in STEPS
+        if command == "next":
+            self.stop_in = (frame, *callers)
+        elif command == "out":
+            self.stop_in = tuple(callers)
+        else:
+            self.stop_in = None
+        self._watch_lines()
+        self.report("resumed", None)
+
+    def _evaluate(self, frame: types.FrameType, expression: str) -> str:
+        try:
+            return describe(eval(expression, frame.f_globals, frame.f_locals))  # nosec
+        except Exception as error:
+            return f"{type(error).__name__}: {error}"
+
+    def _watch_lines(self) -> None:
+        """Switches line events on for the code that can pause, and back on for lines they were
+        switched off for.
+        """
+        self.events.watch(
+            [
+                code
+                for code, lines in self.events.lines.items()
+                if self.stepping or not self.breakpoints.isdisjoint(lines)
+            ]
+        )
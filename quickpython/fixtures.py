@@ -0,0 +1,39 @@
+"""Runs a program against a directory of stdin fixtures, comparing what it prints each time with
+what it printed before.
+
+Each `NAME.in` file in the directory is one fixture: the input typed into the program, one answer
+per line. The output the program is expected to show for it, stdout and stderr together as the
+output pane shows them, is kept next to it in `NAME.out`. Fixtures without one yet record the
+output they get, so the first run of a new fixture sets what later runs are compared with.
+"""
+import difflib
+from pathlib import Path
+from typing import List, Optional
+
+INPUT_SUFFIX = ".in"
+EXPECTED_SUFFIX = ".out"
+
+
+def find(directory: Path) -> List[Path]:
+    """Returns the input files of the fixtures in directory, sorted by name."""
+    return sorted(path for path in directory.glob(f"*{INPUT_SUFFIX}") if path.is_file())
+
+
+def expected_path(input_path: Path) -> Path:
+    return input_path.with_suffix(EXPECTED_SUFFIX)
+
+
+def expected_output(input_path: Path) -> Optional[str]:
+    """Returns the output expected for the fixture, or None if it hasn't been recorded."""
+    try:
+        return expected_path(input_path).read_text(encoding="utf8")
+    except FileNotFoundError:
+        return None
+
+
+def compare(expected: str, output: str, name: str) -> str:
+    """Returns a unified diff of how output differs from expected, which is empty if it doesn't."""
+    diff = difflib.unified_diff(
+        expected.splitlines(), output.splitlines(), f"{name}{EXPECTED_SUFFIX}", f"{name} output"
+    )
+    return "".join(line if line.endswith("\n") else line + "\n" for line in diff)
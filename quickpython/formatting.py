@@ -0,0 +1,466 @@
+"""Code formatting for QuickPython, designed to stay off of the UI thread.
+
+black and isort are only imported when first used, so importing this module is cheap.
+"""
+import asyncio
+import bisect
+import dataclasses
+import hashlib
+import io
+import os
+import sys
+import tokenize
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import ProcessPoolExecutor
+
+    import black
+    import isort
+
+CLAUSE_KEYWORDS = ("else", "elif", "except", "finally")
+IMPORT_KEYWORDS = ("import", "from")
+OPENING_BRACKETS = ("(", "[", "{")
+CLOSING_BRACKETS = (")", "]", "}")
+# Tokens that don't start a logical line, or that are all it has.
+IGNORED_TOKENS = {
+    tokenize.NL,
+    tokenize.COMMENT,
+    tokenize.INDENT,
+    tokenize.DEDENT,
+    tokenize.ENDMARKER,
+}
+CONFIG_FILE_NAMES = (".isort.cfg", "pyproject.toml", "setup.cfg", "tox.ini", ".editorconfig")
+PROJECT_ROOT_MARKERS = (".git", ".hg")
+MAX_CONFIG_SEARCH_DEPTH = 25
+
+# The text top_level_lines last tokenized, along with what it found, to carry on from.
+_tokenized: Tuple[str, List[Tuple[int, str]]] = ("", [])
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if second.startswith(first[low:middle], low):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def top_level_lines(text: str) -> List[Tuple[int, str]]:
+    """Returns the offset and first token of each logical line of text that starts at column 0.
+
+    Those are the top-level statements along with their decorators and `else` style clauses, but
+    not lines continuing a statement inside brackets or strings or after a backslash, wherever
+    they start. Tokenizing carries on from the last of the lines found for the text of the
+    previous call that is unchanged, so only the edited part of the text is tokenized again.
+    """
+    global _tokenized
+
+    previous_text, previous_lines = _tokenized
+    unchanged = _common_prefix_length(previous_text, text)
+    # Everything before an unchanged line is too, so the tokenizer would be in the same state.
+    kept = bisect.bisect_right(previous_lines, (unchanged, "\uffff"))
+    resume_at = previous_lines[kept - 1][0] if kept else 0
+    lines = previous_lines[: max(kept - 1, 0)]
+
+    source = io.StringIO(text[resume_at:])
+    row_offsets = [resume_at]
+
+    def readline() -> str:
+        line = source.readline()
+        row_offsets.append(row_offsets[-1] + len(line))
+        return line
+
+    line_start = True
+    depth = 0
+    try:
+        for token in tokenize.generate_tokens(readline):
+            if token.type == tokenize.NEWLINE:
+                line_start = True
+            elif token.type in IGNORED_TOKENS:
+                continue
+            elif line_start:
+                line_start = False
+                row, column = token.start
+                if column == 0:
+                    lines.append((row_offsets[row - 1], token.string))
+            if token.type == tokenize.OP and token.string in OPENING_BRACKETS:
+                depth += 1
+            elif token.type == tokenize.OP and token.string in CLOSING_BRACKETS:
+                depth -= 1
+                if depth < 0:  # The tokenizer would carry the stray bracket on to later lines.
+                    break
+    except (tokenize.TokenError, SyntaxError):  # The text ends partway through a statement.
+        pass
+    _tokenized = (text, lines)
+    return lines
+
+
+def block_start(text: str, end: int) -> int:
+    """Returns the offset where the top-level statement block containing `text[:end]` starts.
+
+    Consecutive top-level imports are kept together so isort can sort them as one section, and
+    decorators or comments directly above the block are included in it.
+    """
+    lines = top_level_lines(text[:end])
+    index = len(lines) - 1
+    while index >= 0 and lines[index][1] in CLAUSE_KEYWORDS:
+        index -= 1
+    if index < 0:
+        return 0
+
+    while index > 0 and lines[index - 1][1] == "@":
+        index -= 1
+    if lines[index][1] in IMPORT_KEYWORDS:
+        while (
+            index > 0
+            and lines[index - 1][1] in IMPORT_KEYWORDS
+            and "\n#" not in text[lines[index - 1][0] : lines[index][0]]
+        ):
+            index -= 1
+
+    start = lines[index][0]
+    while start > 0:
+        line_start = text.rfind("\n", 0, start - 1) + 1
+        if not text.startswith("#", line_start):
+            break
+        start = line_start
+    return start
+
+
+def black_mode(black_config: dict) -> "black.FileMode":
+    import black
+
+    allowed_keys = {field.name for field in dataclasses.fields(black.FileMode)}
+    return black.FileMode(**{k: v for k, v in black_config.items() if k in allowed_keys})
+
+
+def _stable(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted((_stable(item) for item in value), key=repr)
+    if isinstance(value, dict):
+        return sorted(((key, _stable(item)) for key, item in value.items()), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_stable(item) for item in value]
+    return value
+
+
+def config_fingerprint(isort_config: "isort.Config", black_config: dict) -> str:
+    """Returns a digest of the formatting configuration that is stable between sessions."""
+    import black
+    import isort
+
+    settings = [isort.__version__, black.__version__]
+    for config in (isort_config, black_mode(black_config)):
+        settings.extend(
+            (field.name, _stable(getattr(config, field.name)))
+            for field in dataclasses.fields(config)
+        )
+    return hashlib.sha256(repr(settings).encode("utf8")).hexdigest()
+
+
+class ConfigResolver:
+    """Finds the isort and black configuration that applies to a directory.
+
+    Results are cached per directory along with the modification times of every config file
+    isort or black could have read for it, so resolving the config again is a handful of stat
+    calls until one of those files is created, changed, or removed.
+    """
+
+    def __init__(self):
+        self._configs: Dict[Path, Tuple[tuple, "isort.Config", dict]] = {}
+
+    @staticmethod
+    def _config_files(directory: Path):
+        for tries, parent in enumerate((directory, *directory.parents)):
+            for name in CONFIG_FILE_NAMES:
+                yield parent / name
+            if tries >= MAX_CONFIG_SEARCH_DEPTH or any(
+                (parent / marker).is_dir() for marker in PROJECT_ROOT_MARKERS
+            ):
+                break
+
+        if sys.platform == "win32":
+            yield Path.home() / ".black"
+        else:
+            yield Path(os.environ.get("XDG_CONFIG_HOME", "~/.config")).expanduser() / "black"
+
+    def _stamp(self, directory: Path) -> tuple:
+        stamp = []
+        for config_file in self._config_files(directory):
+            try:
+                stamp.append((config_file, config_file.stat().st_mtime_ns))
+            except OSError:
+                pass
+        return tuple(stamp)
+
+    def resolve(self, directory: Path) -> Tuple["isort.Config", dict]:
+        """Returns the (isort_config, black_config) to use for files within directory."""
+        stamp = self._stamp(directory)
+        cached = self._configs.get(directory)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+
+        import black
+        import isort
+
+        # Newer versions of black memoize parsed config files by path.
+        cached_toml = getattr(getattr(black, "files", None), "_load_toml", None)
+        if hasattr(cached_toml, "cache_clear"):
+            cached_toml.cache_clear()
+
+        black_config_file = black.find_pyproject_toml((str(directory),))
+        isort_config = isort.Config(settings_path=str(directory))
+        black_config = black.parse_pyproject_toml(black_config_file) if black_config_file else {}
+        self._configs[directory] = (stamp, isort_config, black_config)
+        return isort_config, black_config
+
+
+def format_code(
+    contents: str,
+    isort_config: "isort.Config",
+    black_config: dict,
+    add_imports: Sequence[str] = (),
+) -> Tuple[str, str]:
+    """Formats the given code using isort and then black.
+
+    Returns the formatted code along with the error that stopped formatting, if any.
+    """
+    import black
+    import isort
+
+    try:
+        if add_imports:
+            contents = isort.code(contents, add_imports=add_imports, float_to_top=True)
+        contents = isort.code(contents, config=isort_config)
+        return black.format_file_contents(contents, fast=True, mode=black_mode(black_config)), ""
+    except black.NothingChanged:
+        return contents, ""
+    except Exception as error:
+        return contents, str(error)
+
+
+def _warm_worker():
+    import isort
+
+    format_code("import os\n", isort.Config(), {})
+
+
+@dataclass
+class FormatRequest:
+    """A snapshot of code to format, taken at buffer `version`."""
+
+    version: int
+    contents: str
+    isort_config: "isort.Config"
+    black_config: dict
+    add_imports: Sequence[str] = ()
+    apply: Optional[Callable[[str, str], None]] = None
+
+
+class FormatCache:
+    """A bounded, least recently used cache of format_code results.
+
+    Requests are looked up by a digest of their contents, so only the results are kept, and those
+    are limited to `max_characters` in all as well as to `max_size` entries.
+    """
+
+    def __init__(self, max_size: int = 256, max_characters: int = 16 * 1024 * 1024):
+        self.max_size = max_size
+        self.max_characters = max_characters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.characters = 0
+        self._results: Dict[Hashable, Tuple[str, str]] = OrderedDict()
+        # The configs last fingerprinted, along with their fingerprint.
+        self._configs: Optional[Tuple["isort.Config", dict, str]] = None
+
+    def key(self, request: "FormatRequest") -> Hashable:
+        return (
+            hashlib.sha256(request.contents.encode("utf8")).digest(),
+            self.fingerprint(request.isort_config, request.black_config),
+            tuple(request.add_imports),
+        )
+
+    def fingerprint(self, isort_config: "isort.Config", black_config: dict) -> str:
+        """Returns config_fingerprint for the configs, working it out again only once they
+        change.
+        """
+        if (
+            self._configs is None
+            or self._configs[0] is not isort_config
+            or self._configs[1] != black_config
+        ):
+            fingerprint = config_fingerprint(isort_config, black_config)
+            self._configs = (isort_config, dict(black_config), fingerprint)
+        return self._configs[2]
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, str]]:
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end(key)  # type: ignore
+        return result
+
+    def put(self, key: Hashable, result: Tuple[str, str]) -> None:
+        size = _result_size(result)
+        if size > self.max_characters:
+            return
+
+        replaced = self._results.pop(key, None)
+        if replaced is not None:
+            self.characters -= _result_size(replaced)
+        self._results[key] = result
+        self.characters += size
+        while len(self._results) > self.max_size or self.characters > self.max_characters:
+            _, evicted = self._results.popitem(last=False)  # type: ignore
+            self.characters -= _result_size(evicted)
+            self.evictions += 1
+
+    def __str__(self) -> str:
+        lookups = self.hits + self.misses
+        return (
+            f"Format cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions "
+            f"({self.hits / lookups if lookups else 0:.0%} hit rate), "
+            f"{len(self._results)}/{self.max_size} entries, "
+            f"{self.characters}/{self.max_characters} characters"
+        )
+
+
+def _result_size(result: Tuple[str, str]) -> int:
+    formatted_code, error = result
+    return len(formatted_code) + len(error)
+
+
+class FormatScheduler:
+    """Runs format requests in a pre-warmed worker process, off of the UI event loop.
+
+    Requests scheduled under the same key within `delay` seconds of each other are merged into
+    a single format job, and results are only applied if the buffer is still at the version the
+    request was taken from.
+    """
+
+    def __init__(
+        self,
+        current_version: Callable[[], int],
+        delay: float = 0.15,
+        cache: Optional[FormatCache] = None,
+        ready: Optional[Callable[[], Awaitable]] = None,
+    ):
+        self.current_version = current_version
+        self.ready = ready
+        self.delay = delay
+        self.cache = FormatCache() if cache is None else cache
+        self._executor: Optional["ProcessPoolExecutor"] = None
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._running: Dict[str, asyncio.Future] = {}
+
+    def warm(self) -> None:
+        """Starts the worker process and imports the formatters within it ahead of time."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+            self._executor.submit(_warm_worker)
+
+    def shutdown(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._close_executor()
+
+    def _close_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def format(self, request: FormatRequest) -> Tuple[str, str]:
+        """Formats the request in the worker process, returning (formatted_code, error).
+
+        Results are memoized, so formatting text that was recently formatted is instant. If the
+        worker process has died it is replaced, and the contents are returned unformatted along
+        with an error if the new one dies as well.
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        key = self.cache.key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        for attempt in range(2):  # The worker may have died since the last request.
+            self.warm()
+            try:
+                formatted = await asyncio.get_event_loop().run_in_executor(
+                    self._executor,
+                    format_code,
+                    request.contents,
+                    request.isort_config,
+                    request.black_config,
+                    request.add_imports,
+                )
+                break
+            except BrokenProcessPool:
+                self._close_executor()
+                if attempt:
+                    return request.contents, "The formatter stopped unexpectedly"
+        self.cache.put(key, formatted)
+        formatted_code, error = formatted
+        if not error and formatted_code != request.contents:
+            # Formatting is idempotent, so the output is known to be formatted already as well.
+            formatted_request = dataclasses.replace(request, contents=formatted_code)
+            self.cache.put(self.cache.key(formatted_request), formatted)
+        return formatted
+
+    def is_stale(self, request: FormatRequest) -> bool:
+        """Returns True if the buffer has changed since the request was taken."""
+        return request.version != self.current_version()
+
+    def schedule(self, key: str, make_request: Callable[[], Optional[FormatRequest]]) -> None:
+        """Debounces a format request: `make_request` is called once typing pauses."""
+        if key in self._timers:
+            self._timers[key].cancel()
+        self._timers[key] = asyncio.get_event_loop().call_later(
+            self.delay, self._start, key, make_request
+        )
+
+    def _start(self, key: str, make_request: Callable[[], Optional[FormatRequest]]) -> None:
+        del self._timers[key]
+        if key in self._running:
+            self._running[key].cancel()
+        self._running[key] = running = asyncio.ensure_future(self._run(make_request))
+        running.add_done_callback(
+            lambda done: self._running.pop(key) if self._running.get(key) is done else None
+        )
+
+    async def _run(self, make_request: Callable[[], Optional[FormatRequest]]) -> None:
+        if self.ready is not None:
+            await self.ready()
+        request = make_request()
+        if request is None:
+            return
+
+        formatted = await self.format(request)
+        if not self.is_stale(request) and request.apply is not None:
+            request.apply(*formatted)
@@ -0,0 +1,88 @@
+"""Finds the functions and classes edited since a program started, to swap into it while it runs.
+
+Only top level definitions are compared. Each runs from its first decorator up to the next top
+level statement, so the program doesn't have to be valid on Python versions without end line
+numbers. The changes are compiled here, which reports syntax errors before anything is sent, at
+their own line numbers so tracebacks from the running program still point at the right lines.
+"""
+import ast
+import marshal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from quickpython import child
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def statements(source: str) -> List[Tuple[Optional[str], int, str]]:
+    """Returns the name each top level statement in source defines, if it is a function or
+    class, along with its first line and text, in order.
+    """
+    lines = source.splitlines(True)
+    nodes = ast.parse(source).body
+    starts = [
+        min([node.lineno] + [each.lineno for each in getattr(node, "decorator_list", ())])
+        for node in nodes
+    ]
+    return [
+        (
+            node.name if isinstance(node, DEFINITIONS) else None,  # type: ignore
+            start,
+            "".join(lines[start - 1 : end - 1]),
+        )
+        for node, start, end in zip(nodes, starts, starts[1:] + [len(lines) + 1])
+    ]
+
+
+def definitions(source: str) -> Tuple[Dict[str, Tuple[int, str]], List[str]]:
+    """Returns the first line and text of each top level function and class in source, by name,
+    along with the text of every other top level statement.
+    """
+    found: Dict[str, Tuple[int, str]] = {}
+    others = []
+    for name, start, text in statements(source):
+        if name is None:
+            others.append(text.strip())
+        else:
+            found[name] = (start, text)
+    return found, others
+
+
+def changes(started: str, edited: str, filename: str) -> Tuple[Optional[child.Reload], bool]:
+    """Compares the source a program started with to the edited source, returning a Reload of
+    the definitions that changed or were added, if any, and whether anything else changed too.
+
+    Raises SyntaxError if the edited source doesn't parse.
+    """
+    old_definitions, old_others = definitions(started)
+    new_definitions, new_others = definitions(edited)
+    changed = {
+        name: (line, text)
+        for name, (line, text) in new_definitions.items()
+        if name not in old_definitions or old_definitions[name][1] != text
+    }
+    if not changed:
+        return None, old_others != new_others
+
+    lines = [""] * len(edited.splitlines())
+    for line, text in changed.values():
+        for offset, text_line in enumerate(text.splitlines()):
+            lines[line - 1 + offset] = text_line
+    code = compile("\n".join(lines) + "\n", filename, "exec")
+    reload = child.Reload(marshal.dumps(code), list(changed), filename, edited)
+    return reload, old_others != new_others
+
+
+def applied(started: str, edited: str, names: Sequence[str]) -> str:
+    """Returns the source a program that started with `started` now runs, once the definitions
+    of names from edited have been reloaded into it. Everything else stays as it started, so it
+    still counts as changed.
+
+    Raises SyntaxError if either source doesn't parse.
+    """
+    new_definitions, _ = definitions(edited)
+    found = statements(started)
+    texts = [new_definitions[name][1] if name in names else text for name, _line, text in found]
+    defined = {name for name, _line, _text in found}
+    texts.extend(new_definitions[name][1] for name in names if name not in defined)
+    return "".join(text if text.endswith("\n") else text + "\n" for text in texts)
@@ -0,0 +1,302 @@
+"""Runs a program again by running just the top level statements that changed since it last ran.
+
+The program is split into its top level statements, and the names each one defines and reads are
+worked out from its syntax. A statement's identity is its source together with the identities of
+the statements that defined the names it reads, so changing one statement changes the identity of
+every statement downstream of it too. Functions read the names in their bodies when they are
+called rather than when they are defined, so those count towards the identity of the statements
+that use them.
+
+Statements run in a kernel (see `quickpython.kernel`) whose namespace keeps what they did from one
+run to the next. Those with an identity the kernel has already run are skipped, and what they
+printed is replayed from a cache instead. Statements that change a name in place, such as
+`data.append(row)`, `data["total"] = 0` or `total += 1`, count as defining it as well as reading
+it. Running one of them again runs the statements that made the name what it was before it, back
+to the one that assigned it outright, so the change isn't made twice. Calling a function of the
+program counts as making the changes its body makes to names outside of it, whether declared
+`global` or changed in place, along with those of the functions it calls in turn.
+
+Like `quickpython.hot_reload`, each statement runs from its first decorator up to the next top
+level statement, so the program doesn't have to be valid on Python versions without end line
+numbers.
+"""
+import ast
+import hashlib
+from dataclasses import dataclass, field
+from typing import Callable, Collection, Dict, List, Optional, Set
+
+from quickpython import child, kernel
+
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+
+
+@dataclass
+class Statement:
+    """A top level statement, or several that share a line."""
+
+    line: int  # The line it starts on, counting from 1.
+    source: str = ""
+    defines: Set[str] = field(default_factory=set)
+    reads: Set[str] = field(default_factory=set)  # As it runs.
+    deferred: Set[str] = field(default_factory=set)  # By the functions it defines, once called.
+    changes: Set[str] = field(default_factory=set)  # Likewise, the names those functions change.
+
+
+def statements(source: str) -> List[Statement]:
+    """Returns the top level statements of source, in order.
+
+    Raises SyntaxError if source doesn't parse.
+    """
+    lines = source.splitlines(True)
+    found: List[Statement] = []
+    # Names imported, and not assigned anything else since. Statements using them, such as
+    # os.makedirs("out"), don't count as changing them, since importing them again wouldn't undo
+    # what they did.
+    modules: Set[str] = set()
+    for node in ast.parse(source).body:
+        line = min([node.lineno] + [each.lineno for each in getattr(node, "decorator_list", ())])
+        if not found or found[-1].line != line:
+            found.append(Statement(line))
+        defines = set(found[-1].defines)
+        _add_names(found[-1], node, modules)
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules |= found[-1].defines - defines
+        else:
+            modules -= found[-1].defines - defines
+    for statement, end in zip(found, [each.line for each in found[1:]] + [len(lines) + 1]):
+        statement.source = "".join(lines[statement.line - 1 : end - 1])
+    _add_calls(found)
+    return found
+
+
+def _add_calls(program: List[Statement]) -> None:
+    """Counts each statement that uses a function of the program as making its changes too."""
+    providers: Dict[str, Statement] = {}
+
+    def changes(name: str, seen: Set[int]) -> Set[str]:
+        provider = providers.get(name)
+        if provider is None or id(provider) in seen:
+            return set()
+        seen.add(id(provider))
+        found = set(provider.changes)
+        for each in provider.deferred:
+            found |= changes(each, seen)
+        return found
+
+    for statement in program:
+        seen: Set[int] = set()
+        changed = set().union(*(changes(name, seen) for name in statement.reads))
+        statement.defines |= changed
+        statement.reads |= changed
+        providers.update((name, statement) for name in statement.defines)
+
+
+def _add_names(statement: Statement, node: ast.stmt, modules: Set[str]) -> None:
+    if isinstance(node, DEFINITIONS):
+        statement.defines.add(node.name)
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        statement.defines.update(
+            alias.asname or alias.name.split(".")[0] for alias in node.names if alias.name != "*"
+        )
+
+    def visit(node: ast.AST, scope: str) -> None:
+        if isinstance(node, FUNCTIONS):
+            statement.changes |= _changes(node, modules)
+            arguments = node.args
+            for each in getattr(node, "decorator_list", []) + arguments.defaults:
+                visit(each, scope)
+            for each in arguments.kw_defaults:
+                if each is not None:
+                    visit(each, scope)
+            for each in node.body if isinstance(node.body, list) else [node.body]:
+                visit(each, "function")
+            return
+        if isinstance(node, ast.ClassDef):
+            for each in node.decorator_list + node.bases + node.keywords:
+                visit(each, scope)
+            for each in node.body:
+                visit(each, "class" if scope == "module" else scope)
+            return
+        if isinstance(node, ast.comprehension):  # Its target is local to the comprehension.
+            for each in [node.iter] + node.ifs:
+                visit(each, scope)
+            return
+
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                (statement.deferred if scope == "function" else statement.reads).add(node.id)
+            elif scope == "module":
+                statement.defines.add(node.id)
+                if isinstance(node.ctx, ast.Del):
+                    statement.reads.add(node.id)
+        elif scope == "module":
+            if isinstance(node, (ast.Attribute, ast.Subscript)) and not isinstance(
+                node.ctx, ast.Load
+            ):
+                name = _base_name(node)
+                if name is not None and name not in modules:
+                    statement.defines.add(name)
+            elif (
+                isinstance(node, ast.Expr)
+                and isinstance(node.value, ast.Call)
+                and isinstance(node.value.func, ast.Attribute)
+            ):  # Calling a method of a name on its own, such as data.sort(), may change it.
+                name = _base_name(node.value.func)
+                if name is not None and name not in modules:
+                    statement.defines.add(name)
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+                statement.reads.add(node.target.id)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                statement.defines.add(node.name)
+        for each in ast.iter_child_nodes(node):
+            visit(each, scope)
+
+    visit(node, "module")
+
+
+def _changes(function: ast.AST, modules: Set[str]) -> Set[str]:
+    """Returns the names outside of a function that calling it may assign or change in place."""
+    declared = {
+        name for node in ast.walk(function) if isinstance(node, ast.Global) for name in node.names
+    }
+    local = {node.arg for node in ast.walk(function) if isinstance(node, ast.arg)}
+    local.update(
+        node.id
+        for node in ast.walk(function)
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load)
+    )
+    local -= declared
+    changed = set(declared)
+    for node in ast.walk(function):
+        name = None
+        if isinstance(node, (ast.Attribute, ast.Subscript)) and not isinstance(node.ctx, ast.Load):
+            name = _base_name(node)
+        elif (
+            isinstance(node, ast.Expr)
+            and isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Attribute)
+        ):
+            name = _base_name(node.value.func)
+        if name is not None:
+            changed.add(name)
+    return changed - local - modules
+
+
+def _base_name(node: ast.expr) -> Optional[str]:
+    """Returns the name an attribute or item is looked up on, such as data for data.rows[0]."""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _providers(program: List[Statement]) -> List[Dict[str, int]]:
+    """Returns the index of the statement that last defined each name, as each statement starts."""
+    providers: Dict[str, int] = {}
+    found = []
+    for index, statement in enumerate(program):
+        found.append(dict(providers))
+        providers.update((name, index) for name in statement.defines)
+    return found
+
+
+def identities(program: List[Statement]) -> List[str]:
+    """Returns the identity of each statement, which changes along with anything it depends on."""
+    found: List[str] = []
+
+    def resolve(name: str, providers: Dict[str, int], seen: Set[int]) -> str:
+        index = providers.get(name)
+        if index is None or index in seen:
+            return ""
+        seen.add(index)
+        called = (resolve(each, providers, seen) for each in sorted(program[index].deferred))
+        return f"{name}={found[index]}({','.join(called)})"
+
+    for statement, providers in zip(program, _providers(program)):
+        seen: Set[int] = set()
+        digest = hashlib.sha256(statement.source.strip().encode("utf8"))
+        for name in sorted(statement.reads):
+            digest.update(resolve(name, providers, seen).encode("utf8"))
+        found.append(digest.hexdigest())
+    return found
+
+
+def plan(program: List[Statement], keys: List[str], ran: Collection[str]) -> List[bool]:
+    """Returns whether each statement has to run, given the identities of the statements whose
+    effects the namespace already has.
+    """
+    runs = [key not in ran for key in keys]
+    for index, providers in reversed(list(enumerate(_providers(program)))):
+        if runs[index]:
+            for name in program[index].reads & program[index].defines:
+                if name in providers:
+                    runs[providers[name]] = True
+    return runs
+
+
+@dataclass
+class Result:
+    ran: int = 0  # How many statements ran.
+    replayed: int = 0  # How many were skipped, with what they printed replayed.
+    failed: Optional[int] = None  # The line of the statement that failed, if one did.
+    exited: bool = False  # Whether the kernel exited, losing its namespace.
+
+
+class Session:
+    """Runs programs a statement at a time in a kernel of its own, skipping the statements it has
+    already run.
+    """
+
+    def __init__(self, on_output: Callable[[bytes], None]):
+        self.on_output = on_output
+        self.kernel = kernel.Kernel(on_output)
+        self.filename: Optional[str] = None
+        # What each statement whose effects are in the kernel's namespace printed, by identity.
+        self.printed: Dict[str, str] = {}
+        self.busy = False
+
+    async def run(self, source: str, filename: str) -> Result:
+        """Runs the statements of source that changed, or that depend on ones that did, since the
+        last run.
+
+        Raises SyntaxError if source doesn't parse.
+        """
+        program = statements(source)
+        if filename != self.filename:
+            await self.restart()
+            self.filename = filename
+        if not self.kernel.running:
+            self.printed = {}
+        keys = identities(program)
+        result = Result()
+        printed: Dict[str, str] = {}
+        self.busy = True
+        try:
+            for statement, key, runs in zip(program, keys, plan(program, keys, self.printed)):
+                if not runs:
+                    self.on_output(self.printed[key].encode("utf8"))
+                    printed[key] = self.printed[key]
+                    result.replayed += 1
+                    continue
+
+                cell = child.Cell(statement.source, filename, statement.line, source, capture=True)
+                succeeded = await self.kernel.execute(cell)
+                if not succeeded:
+                    result.failed = statement.line
+                    result.exited = succeeded is None
+                    break
+                printed[key] = self.kernel.printed
+                result.ran += 1
+        finally:
+            self.busy = False
+            # Statements after one that failed may depend on what it would have done.
+            self.printed = printed if self.kernel.running else {}
+        return result
+
+    async def restart(self) -> None:
+        """Stops the kernel, so the next run runs every statement in a fresh namespace."""
+        await self.kernel.restart()
+        self.printed = {}
+
+    def shutdown(self) -> None:
+        self.kernel.shutdown()
@@ -0,0 +1,113 @@
+"""Runs programs a cell at a time in a kernel that keeps its namespace between runs.
+
+Cells are the parts of a program between `# %%` marker comments. Running one sends just that cell
+to a long-lived program in the kernel mode (see `quickpython.child`), so whatever earlier cells
+loaded or defined is still there and doesn't have to be run again. The kernel has a runner of
+its own, since a runner only runs one program at a time.
+"""
+import asyncio
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from quickpython import child, runner
+
+CELL_MARKER = re.compile(r"^\s*#\s*%%")
+
+
+def cell_at(lines: List[str], row: int) -> Tuple[int, int]:
+    """Returns the first row of the cell containing row and the row after its last, leaving out
+    the marker that starts it.
+    """
+    start = row
+    while start >= 0 and not CELL_MARKER.match(lines[start]):
+        start -= 1
+    end = row + 1
+    while end < len(lines) and not CELL_MARKER.match(lines[end]):
+        end += 1
+    return start + 1, end
+
+
+class Kernel:
+    """A program that runs the cells sent to it in one namespace, started by the first cell."""
+
+    def __init__(self, on_output: Callable[[bytes], None]):
+        self.on_output = on_output
+        self.runner = runner.Runner()
+        self.run: Optional[runner.Run] = None
+        self._starting: Optional[asyncio.Future] = None
+        self._exited: Optional[asyncio.Future] = None
+        self._pending: Deque[asyncio.Future] = deque()  # One for each cell yet to finish.
+        self.printed = ""  # What the last cell that captured its output printed.
+
+    @property
+    def running(self) -> bool:
+        return self.run is not None and self.run.returncode is None
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._pending)
+
+    async def start(self, filename: str, environ: Optional[Dict[str, str]] = None) -> None:
+        program = child.Program("", filename, environ or {}, mode="kernel")
+        self.run = await self.runner.launch(program, self.on_output, self._on_result)
+        self._exited = asyncio.ensure_future(self._wait(self.run))
+
+    async def execute(self, cell: child.Cell) -> Optional[bool]:
+        """Runs cell, starting the kernel first if it isn't running.
+
+        Returns whether the cell ran without error, or None if the kernel exited before it
+        finished.
+        """
+        if not self.running:
+            if self._starting is None or self._starting.done():  # Cells sent meanwhile wait.
+                self._starting = asyncio.ensure_future(self.start(cell.filename))
+            await self._starting
+        assert self.run is not None  # nosec
+        finished = asyncio.get_event_loop().create_future()
+        self._pending.append(finished)
+        if not self.run.request(cell):
+            self._pending.remove(finished)
+            return None
+        return await finished
+
+    def interrupt(self) -> None:
+        """Stops the cell that is running, keeping the kernel and its namespace."""
+        if self.running and self.busy:
+            assert self.run is not None  # nosec
+            self.run.interrupt()
+
+    async def restart(self) -> None:
+        """Stops the kernel, losing its namespace. The next cell run starts a fresh one."""
+        if self.run is not None:
+            self.run.kill()
+        if self._exited is not None:
+            await self._exited
+
+    def send(self, text: str) -> None:
+        """Writes text to the kernel's stdin."""
+        if self.running:
+            assert self.run is not None  # nosec
+            self.run.send(text)
+
+    def shutdown(self) -> None:
+        if self.run is not None:
+            self.run.kill()
+        self.runner.shutdown()
+
+    def _on_result(self, kind: str, result: Any) -> None:
+        if kind == "printed":
+            self.printed = result
+        elif kind == "cell" and self._pending:
+            finished = self._pending.popleft()
+            if not finished.done():
+                finished.set_result(result)
+
+    async def _wait(self, run: runner.Run) -> None:
+        await run.wait()
+        if self.run is run:
+            self.run = None
+        while self._pending:
+            finished = self._pending.popleft()
+            if not finished.done():
+                finished.set_result(None)
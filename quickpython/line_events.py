@@ -0,0 +1,182 @@
+"""Calls back as the lines of a program's own code run, for the debugger, line coverage and the
+line profiler.
+
+Only the code objects compiled from the program are watched. On Python 3.12+ this uses
+`sys.monitoring` with events switched on for just those code objects, so everything else runs at
+full speed. A line callback can return DISABLE to not be called for that line again until the
+code objects to watch next change. Older versions fall back to `sys.settrace`, tracing only the
+program's frames, and stop tracing a frame once every line of its code has been disabled.
+"""
+import dis
+import sys
+import types
+from typing import Any, Callable, Collection, Dict, Iterator, Optional, Set, Tuple
+
+HAS_MONITORING = hasattr(sys, "monitoring")
+DISABLE: Any = sys.monitoring.DISABLE if HAS_MONITORING else object()  # type: ignore
+
+OnLine = Callable[[types.CodeType, int], Any]
+# Called with a code object, followed by whatever else sys.monitoring passes for the event.
+OnCode = Callable[..., Any]
+
+
+def code_objects(code: types.CodeType) -> Iterator[types.CodeType]:
+    """Yields code and every code object defined within it, such as functions and classes."""
+    yield code
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            yield from code_objects(constant)
+
+
+class LineEvents:
+    """Runs code, calling on_line with each line of it that runs, and of the code defined within it.
+
+    on_call is called as a frame of that code starts or resumes, and on_return as one returns,
+    yields or is unwound by an exception. tool names the `sys.monitoring` tool id to use, such as
+    "COVERAGE_ID".
+    """
+
+    def __init__(
+        self,
+        code: types.CodeType,
+        tool: str,
+        on_line: OnLine,
+        on_call: Optional[OnCode] = None,
+        on_return: Optional[OnCode] = None,
+    ):
+        self.tool = tool
+        self.on_line = on_line
+        self.on_call = on_call
+        self.on_return = on_return
+        self.lines: Dict[types.CodeType, Set[int]] = {
+            code_object: {line for _, line in dis.findlinestarts(code_object) if line}
+            for code_object in code_objects(code)
+        }
+        self.watched: Set[types.CodeType] = set(self.lines)
+        self.running = False
+        # The lines of each watched code object not yet disabled, when falling back to tracing.
+        self._remaining: Dict[types.CodeType, Set[int]] = {}
+
+    def watch(self, codes: Collection[types.CodeType]) -> None:
+        """Switches events on for just codes, and back on for every line disabled so far."""
+        self.watched = set(codes)
+        if not self.running:
+            return
+        if HAS_MONITORING:
+            self._set_local_events()
+            sys.monitoring.restart_events()  # type: ignore
+        else:
+            self._retrace()
+
+    def run(self, code: types.CodeType, namespace: dict) -> None:
+        start, stop = self._monitor() if HAS_MONITORING else self._trace()
+        start()
+        self.running = True
+        try:
+            exec(code, namespace)  # nosec
+        finally:
+            self.running = False
+            stop()
+
+    def _set_local_events(self) -> None:
+        monitoring = sys.monitoring  # type: ignore
+        events = monitoring.events
+        tool = getattr(monitoring, self.tool)
+        local_events = events.LINE
+        if self.on_call is not None:
+            local_events |= events.PY_START | events.PY_RESUME
+        if self.on_return is not None:
+            local_events |= events.PY_RETURN | events.PY_YIELD
+        for code in self.lines:
+            monitoring.set_local_events(tool, code, local_events if code in self.watched else 0)
+
+    def _monitor(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        monitoring = sys.monitoring  # type: ignore
+        events = monitoring.events
+        tool = getattr(monitoring, self.tool)
+        on_call = self.on_call
+        on_return = self.on_return
+        callbacks: Dict[int, Optional[OnCode]] = {events.LINE: self.on_line}
+        global_events = 0
+
+        # Unwinding and throwing into generators can't be switched on per code object, so they're
+        # filtered here instead.
+        def thrown(code, *args):
+            if code in self.watched:
+                on_call(code, *args)  # type: ignore
+
+        def unwound(code, *args):
+            if code in self.watched:
+                on_return(code, *args)  # type: ignore
+
+        if on_call is not None:
+            callbacks.update({events.PY_START: on_call, events.PY_RESUME: on_call})
+            callbacks[events.PY_THROW] = thrown
+            global_events |= events.PY_THROW
+        if on_return is not None:
+            callbacks.update({events.PY_RETURN: on_return, events.PY_YIELD: on_return})
+            callbacks[events.PY_UNWIND] = unwound
+            global_events |= events.PY_UNWIND
+
+        def start_monitoring():
+            monitoring.use_tool_id(tool, "quickpython")
+            for event, callback in callbacks.items():
+                monitoring.register_callback(tool, event, callback)
+            self._set_local_events()
+            monitoring.set_events(tool, global_events)
+
+        def stop_monitoring():
+            monitoring.set_events(tool, 0)
+            for code in self.lines:
+                monitoring.set_local_events(tool, code, 0)
+            for event in callbacks:
+                monitoring.register_callback(tool, event, None)
+            monitoring.free_tool_id(tool)
+
+        return start_monitoring, stop_monitoring
+
+    def _trace(self) -> Tuple[Callable[[], None], Callable[[], None]]:
+        on_line = self.on_line
+        on_call = self.on_call
+        on_return = self.on_return
+
+        def trace_calls(frame, event, arg):
+            code = frame.f_code
+            if not self._remaining.get(code):
+                return None
+            if on_call is not None:
+                on_call(code)
+            return trace_lines
+
+        def trace_lines(frame, event, arg):
+            code = frame.f_code
+            if event == "line":
+                remaining = self._remaining.get(code)
+                line = frame.f_lineno
+                if remaining and line in remaining and on_line(code, line) is DISABLE:
+                    remaining.discard(line)
+                    if not remaining and on_return is None:
+                        return None
+            elif event == "return" and on_return is not None:
+                on_return(code)
+            return trace_lines
+
+        self._trace_lines = trace_lines
+        self._remaining = {code: set(self.lines[code]) for code in self.watched}
+
+        def start_tracing():
+            sys.settrace(trace_calls)
+
+        def stop_tracing():
+            sys.settrace(None)
+
+        return start_tracing, stop_tracing
+
+    def _retrace(self) -> None:
+        """Traces every line of the watched code again, including in the frames already running."""
+        self._remaining = {code: set(self.lines[code]) for code in self.watched}
+        for frame in sys._current_frames().values():
+            while frame is not None:
+                if frame.f_code in self._remaining and frame.f_trace is None:
+                    frame.f_trace = self._trace_lines
+                frame = frame.f_back
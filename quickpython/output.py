@@ -0,0 +1,257 @@
+"""The output pane that shows what programs run from QuickPython print.
+
+Output arrives as raw bytes in whatever size chunks the pipe delivers. It is decoded and split
+into lines incrementally, with ANSI colour codes turned into prompt_toolkit styles along the way.
+Only the last MAX_LINES lines are kept, so a program printing without end can't grow the
+editor's memory.
+"""
+import codecs
+import re
+from collections import deque
+from typing import Deque, List, Optional
+
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.key_binding.key_bindings import KeyBindings
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
+
+MAX_LINES = 10000
+MAX_LINE_LENGTH = 4096
+
+ANSI_COLORS = (
+    "ansiblack",
+    "ansired",
+    "ansigreen",
+    "ansiyellow",
+    "ansiblue",
+    "ansimagenta",
+    "ansicyan",
+    "ansigray",
+)
+ANSI_BRIGHT_COLORS = (
+    "ansibrightblack",
+    "ansibrightred",
+    "ansibrightgreen",
+    "ansibrightyellow",
+    "ansibrightblue",
+    "ansibrightmagenta",
+    "ansibrightcyan",
+    "ansiwhite",
+)
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+ATTRIBUTES = {1: "bold", 3: "italic", 4: "underline", 7: "reverse", 9: "strike"}
+RESET_ATTRIBUTES = {22: "bold", 23: "italic", 24: "underline", 27: "reverse", 29: "strike"}
+
+# Escape sequences and the control characters that affect layout, captured so they're kept when
+# splitting. Anything else is passed through as text.
+CONTROL = re.compile(r"(\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-_]|\n|\r|[\x00-\x08\x0b-\x1f\x7f])")
+INCOMPLETE_ESCAPE = re.compile(r"\x1b(\[[0-?]*[ -/]*)?$")
+
+
+def color_256(number: int) -> str:
+    """Returns the prompt_toolkit colour for an entry of the xterm 256 colour palette."""
+    if number < 8:
+        return ANSI_COLORS[number]
+    elif number < 16:
+        return ANSI_BRIGHT_COLORS[number - 8]
+    elif number < 232:
+        number -= 16
+        red, green, blue = number // 36, number // 6 % 6, number % 6
+        return "#{:02x}{:02x}{:02x}".format(
+            CUBE_LEVELS[red], CUBE_LEVELS[green], CUBE_LEVELS[blue]
+        )
+    gray = 8 + (number - 232) * 10
+    return "#{0:02x}{0:02x}{0:02x}".format(gray)
+
+
+class OutputBuffer:
+    """A bounded scrollback of styled lines, fed with raw program output as it arrives."""
+
+    def __init__(self, max_lines: int = MAX_LINES):
+        self.lines: Deque[StyleAndTextTuples] = deque(maxlen=max_lines)
+        self.clear()
+
+    def clear(self) -> None:
+        self.lines.clear()
+        self.current: StyleAndTextTuples = []  # The line still being written.
+        self.current_length = 0
+        self.pending_return = False
+        self.partial_escape = ""
+        self.foreground = ""
+        self.background = ""
+        self.attributes: List[str] = []
+        self.style = ""
+        self._decoder = codecs.getincrementaldecoder("utf8")(errors="replace")
+
+    def __len__(self) -> int:
+        return len(self.lines) + 1
+
+    def __getitem__(self, line: int) -> StyleAndTextTuples:
+        return self.current if line == len(self.lines) else self.lines[line]
+
+    def write(self, data: bytes) -> None:
+        self.feed(self._decoder.decode(data))
+
+    def feed(self, text: str) -> None:
+        text = self.partial_escape + text
+        incomplete = INCOMPLETE_ESCAPE.search(text)
+        if incomplete:  # Wait for the rest of the escape sequence to arrive.
+            self.partial_escape = text[incomplete.start() :]
+            text = text[: incomplete.start()]
+        else:
+            self.partial_escape = ""
+
+        for part in CONTROL.split(text):
+            if not part:
+                continue
+            elif self.pending_return and part != "\n":
+                # A carriage return on its own starts overwriting the line, as progress bars do.
+                self.current = []
+                self.current_length = 0
+            self.pending_return = False
+
+            if part == "\n":
+                self.new_line()
+            elif part == "\r":
+                self.pending_return = True
+            elif part.startswith("\x1b["):
+                self._escape(part)
+            elif part[0] >= " " and part != "\x7f":
+                self._text(part)
+
+    def new_line(self) -> None:
+        self.lines.append(self.current)
+        self.current = []
+        self.current_length = 0
+
+    def _text(self, text: str) -> None:
+        while text:
+            room = MAX_LINE_LENGTH - self.current_length
+            self.current.append((self.style, text[:room]))
+            self.current_length += min(len(text), room)
+            text = text[room:]
+            if text:
+                self.new_line()
+
+    def _escape(self, sequence: str) -> None:
+        command = sequence[-1]
+        if command == "m":
+            self._select_graphic_rendition(sequence[2:-1])
+        elif command == "J" and sequence[2:-1] in ("2", "3"):
+            self.lines.clear()
+            self.current = []
+            self.current_length = 0
+
+    def _select_graphic_rendition(self, parameters: str) -> None:
+        codes = [int(code) if code.isdigit() else 0 for code in parameters.split(";")]
+        while codes:
+            code = codes.pop(0)
+            if code == 0:
+                self.foreground = self.background = ""
+                self.attributes = []
+            elif code in ATTRIBUTES:
+                if ATTRIBUTES[code] not in self.attributes:
+                    self.attributes.append(ATTRIBUTES[code])
+            elif code in RESET_ATTRIBUTES:
+                if RESET_ATTRIBUTES[code] in self.attributes:
+                    self.attributes.remove(RESET_ATTRIBUTES[code])
+            elif 30 <= code <= 37:
+                self.foreground = ANSI_COLORS[code - 30]
+            elif 90 <= code <= 97:
+                self.foreground = ANSI_BRIGHT_COLORS[code - 90]
+            elif 40 <= code <= 47:
+                self.background = ANSI_COLORS[code - 40]
+            elif 100 <= code <= 107:
+                self.background = ANSI_BRIGHT_COLORS[code - 100]
+            elif code == 39:
+                self.foreground = ""
+            elif code == 49:
+                self.background = ""
+            elif code in (38, 48) and codes:
+                color = ""
+                if codes[0] == 5 and len(codes) >= 2:
+                    color = color_256(min(codes[1], 255))
+                    del codes[:2]
+                elif codes[0] == 2 and len(codes) >= 4:
+                    color = "#{:02x}{:02x}{:02x}".format(*(min(part, 255) for part in codes[1:4]))
+                    del codes[:4]
+                if code == 38:
+                    self.foreground = color
+                else:
+                    self.background = color
+
+        style = self.attributes[:]
+        if self.foreground:
+            style.append(f"fg:{self.foreground}")
+        if self.background:
+            style.append(f"bg:{self.background}")
+        self.style = " ".join(style)
+
+
+class OutputControl(UIControl):
+    """A prompt_toolkit control that shows an OutputBuffer, following new output as it arrives
+    unless scrolled back.
+    """
+
+    def __init__(self, output: OutputBuffer):
+        self.output = output
+        self.cursor_line: Optional[int] = None  # None keeps showing the end of the output.
+        self.height = 1
+        self.key_bindings = self._create_key_bindings()
+
+    def is_focusable(self) -> bool:
+        return True
+
+    def scroll(self, lines: int) -> None:
+        last_line = len(self.output) - 1
+        cursor_line = last_line if self.cursor_line is None else self.cursor_line
+        cursor_line = max(min(cursor_line + lines, last_line), 0)
+        self.cursor_line = None if cursor_line == last_line else cursor_line
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.height = height
+        output = self.output
+        line_count = len(output)
+        if self.cursor_line is not None:
+            self.cursor_line = min(self.cursor_line, line_count - 1)
+
+        def get_line(line: int) -> StyleAndTextTuples:
+            return [(style, text.expandtabs()) for style, text in output[line]]
+
+        return UIContent(
+            get_line=get_line,
+            line_count=line_count,
+            cursor_position=Point(
+                x=0, y=line_count - 1 if self.cursor_line is None else self.cursor_line
+            ),
+            show_cursor=False,
+        )
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        if mouse_event.event_type == MouseEventType.SCROLL_UP:
+            self.scroll(-3)
+        elif mouse_event.event_type == MouseEventType.SCROLL_DOWN:
+            self.scroll(3)
+        else:
+            return NotImplemented
+        return None
+
+    def get_key_bindings(self) -> KeyBindings:
+        return self.key_bindings
+
+    def _create_key_bindings(self) -> KeyBindings:
+        key_bindings = KeyBindings()
+
+        def move(keys: str, lines):
+            @key_bindings.add(keys)
+            def _(event):
+                self.scroll(lines())
+
+        move("up", lambda: -1)
+        move("down", lambda: 1)
+        move("pageup", lambda: -self.height)
+        move("pagedown", lambda: self.height)
+        move("c-home", lambda: -len(self.output))
+        move("c-end", lambda: len(self.output))
+        return key_bindings
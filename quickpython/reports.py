@@ -0,0 +1,709 @@
+"""Tables of measurements taken while running programs, such as profiles.
+
+Each row can point at a line of the program, which the editor jumps to when the row is chosen.
+Sampled call stacks are shown as a FlameGraph instead.
+Measurements of every line are shown next to the code instead, in a LineHeatMargin or a
+CoverageMargin, much as breakpoints and where the debugger paused are in a BreakpointMargin.
+"""
+import marshal
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.key_binding.key_bindings import KeyBindings
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from prompt_toolkit.layout.margins import Margin
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
+
+if TYPE_CHECKING:
+    from prompt_toolkit.layout.containers import WindowRenderInfo
+
+    from quickpython import storage
+
+HEAT_LEVELS = 5  # Styled as line-heat.0, the coolest, to line-heat.4.
+FLAME_COLORS = 4  # Styled as flame.0 to flame.3, picked by each frame's name.
+
+
+@dataclass
+class Column:
+    title: str
+    width: int
+    value: Callable[[Any], Any]  # Gets the value to sort this column by from a row.
+    text: Optional[Callable[[Any], str]] = None  # Shows a row's cell, its value by default.
+    descending: bool = True  # Whether sorting by this column puts the largest values first.
+
+    def cell(self, row: Any) -> str:
+        return self.text(row) if self.text is not None else str(self.value(row))
+
+
+@dataclass
+class ProfileRow:
+    function: str
+    filename: str
+    line: Optional[int]  # The line of the program the function starts at, if it is in it.
+    calls: int
+    total_time: float
+    cumulative_time: float
+
+
+@dataclass
+class MemoryRow:
+    line: int
+    size: int  # The bytes allocated by the line that were still in use.
+    count: int  # The number of blocks they were allocated in.
+    text: str
+
+
+@dataclass
+class TestRow:
+    function: str  # The test's name.
+    filename: str
+    line: Optional[int]  # The line of the program the test starts on, if it is in it.
+    outcome: str
+    duration: float
+    output: str
+
+
+@dataclass
+class FixtureRow:
+    function: str  # The fixture's name.
+    filename: str
+    line: Optional[int]
+    outcome: str
+    duration: float
+    exit_code: Optional[int]  # None if the run timed out.
+    output: str
+    diff: str  # How the output differs from what was expected.
+
+
+@dataclass
+class HistoryRow:
+    started: float  # Seconds since the epoch.
+    version: str  # The start of the hash of the source run, marked if it is the current source.
+    exit_code: int
+    wall_seconds: float
+    cpu_seconds: Optional[float]
+    peak_rss: Optional[int]
+    time_change: Optional[float]  # As a fraction of the previous version's, if there was one.
+    memory_change: Optional[float]
+    flag: str  # What got notably worse or better.
+
+
+@dataclass
+class VariableRow:
+    name: str
+    value: str  # As repr shows it, shortened.
+    line: int  # The line the program is paused on.
+
+
+MEMORY_COLUMNS = (
+    Column("size", 11, lambda row: row.size, lambda row: format_size(row.size)),
+    Column("blocks", 9, lambda row: row.count),
+    Column(
+        "line", 0, lambda row: row.line, lambda row: f"{row.line}: {row.text}", descending=False
+    ),
+)
+
+TEST_COLUMNS = (
+    Column("duration", 11, lambda row: row.duration, lambda row: format_duration(row.duration)),
+    Column("outcome", 9, lambda row: row.outcome, descending=False),
+    Column("test", 0, lambda row: row.function, descending=False),
+)
+
+FIXTURE_COLUMNS = (
+    Column("duration", 11, lambda row: row.duration, lambda row: format_duration(row.duration)),
+    Column("outcome", 9, lambda row: row.outcome, descending=False),
+    Column(
+        "exit",
+        5,
+        lambda row: -1 if row.exit_code is None else row.exit_code,
+        lambda row: "" if row.exit_code is None else str(row.exit_code),
+    ),
+    Column("fixture", 0, lambda row: row.function, descending=False),
+)
+
+HISTORY_COLUMNS = (
+    Column(
+        "started",
+        19,
+        lambda row: row.started,
+        lambda row: datetime.fromtimestamp(row.started).strftime("%Y-%m-%d %H:%M:%S"),
+    ),
+    Column("version", 9, lambda row: row.version, descending=False),
+    Column("exit", 4, lambda row: row.exit_code),
+    Column("wall", 10, lambda row: row.wall_seconds, lambda row: format_duration(row.wall_seconds)),
+    Column(
+        "cpu",
+        10,
+        lambda row: row.cpu_seconds or 0.0,
+        lambda row: "" if row.cpu_seconds is None else format_duration(row.cpu_seconds),
+    ),
+    Column(
+        "peak RSS",
+        10,
+        lambda row: row.peak_rss or 0,
+        lambda row: "" if row.peak_rss is None else format_size(row.peak_rss),
+    ),
+    Column(
+        "time",
+        6,
+        lambda row: row.time_change or 0.0,
+        lambda row: "" if row.time_change is None else f"{row.time_change:+.0%}",
+    ),
+    Column(
+        "memory",
+        6,
+        lambda row: row.memory_change or 0.0,
+        lambda row: "" if row.memory_change is None else f"{row.memory_change:+.0%}",
+    ),
+    Column("compared with the previous version", 0, lambda row: row.flag, descending=False),
+)
+
+VARIABLE_COLUMNS = (
+    Column("name", 20, lambda row: row.name, descending=False),
+    Column("value", 0, lambda row: row.value, descending=False),
+)
+
+PROFILE_COLUMNS = (
+    Column(
+        "cumulative", 11, lambda row: row.cumulative_time, lambda row: f"{row.cumulative_time:.6f}"
+    ),
+    Column("total", 11, lambda row: row.total_time, lambda row: f"{row.total_time:.6f}"),
+    Column("calls", 9, lambda row: row.calls),
+    Column("function", 0, lambda row: row.function, descending=False),
+)
+
+
+def format_duration(seconds: float) -> str:
+    """Formats a duration in the most readable unit, as `python -m timeit` does."""
+    for unit, scale in (("sec", 1.0), ("msec", 1e-3), ("usec", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} nsec"
+
+
+def format_size(size: float) -> str:
+    """Formats a number of bytes in the most readable binary unit."""
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ("KiB", "MiB"):
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GiB"
+
+
+def format_count(count: int) -> str:
+    """Formats a count in at most five characters."""
+    for unit, scale in (("G", 10**9), ("M", 10**6), ("k", 10**3)):
+        if count >= scale - scale // 2000:  # Rather than 1000 of the unit below.
+            return f"{count / scale:.3g}{unit}"
+    return str(count)
+
+
+def history_rows(
+    runs: Sequence["storage.RunEntry"], current_hash: bytes, threshold: float
+) -> List[HistoryRow]:
+    """Turns a program's runs, oldest first, into rows.
+
+    Each successful run is compared with the fastest time and smallest peak memory of those of the
+    last other version of the program run before it, and flagged where either changed by more
+    than threshold, as a fraction.
+    """
+    rows = []
+    best: Dict[bytes, Tuple[float, Optional[int]]] = {}  # Among each version's successful runs.
+    previous: Optional[bytes] = None
+    last: Optional[bytes] = None
+    for _filename, source_hash, started, wall, cpu, peak_rss, exit_code in runs:
+        if source_hash != last:
+            if last in best:
+                previous = last
+            last = source_hash
+
+        time_change = memory_change = None
+        flags = []
+        if exit_code == 0 and previous is not None and previous != source_hash:
+            best_wall, best_peak = best[previous]
+            time_change = wall / best_wall - 1 if best_wall else None
+            if peak_rss is not None and best_peak:
+                memory_change = peak_rss / best_peak - 1
+            if time_change is not None and time_change > threshold:
+                flags.append("slower")
+            elif time_change is not None and time_change < -threshold:
+                flags.append("faster")
+            if memory_change is not None and memory_change > threshold:
+                flags.append("more memory")
+            elif memory_change is not None and memory_change < -threshold:
+                flags.append("less memory")
+
+        if exit_code == 0:
+            best_wall, best_peak = best.get(source_hash, (wall, peak_rss))
+            if best_peak is not None and peak_rss is not None:
+                best_peak = min(best_peak, peak_rss)
+            best[source_hash] = (min(best_wall, wall), best_peak)
+
+        version = source_hash.hex()[:8] + ("*" if source_hash == current_hash else "")
+        rows.append(
+            HistoryRow(
+                started,
+                version,
+                exit_code,
+                wall,
+                cpu,
+                peak_rss,
+                time_change,
+                memory_change,
+                ", ".join(flags),
+            )
+        )
+    return rows
+
+
+def memory_rows(lines: List[Tuple[int, int, int]], source: str) -> List[MemoryRow]:
+    """Turns the lines reported by a memory profile into rows showing the code on each line."""
+    source_lines = source.splitlines()
+    return [
+        MemoryRow(line, size, count, "".join(source_lines[line - 1 : line]).strip())
+        for line, size, count in lines
+    ]
+
+
+def profile_rows(stats: bytes, filename: str) -> List[ProfileRow]:
+    """Turns marshalled cProfile stats into rows, one per function that was called."""
+    rows = []
+    for (function_file, line, name), timings in marshal.loads(stats).items():  # nosec
+        _primitive_calls, calls, total_time, cumulative_time, _callers = timings
+        if function_file == filename:
+            label, row_line = f"{name} (line {line})", line
+        elif function_file == "~":
+            label, row_line = name, None
+        else:
+            label, row_line = f"{name} ({function_file}:{line})", None
+        rows.append(ProfileRow(label, function_file, row_line, calls, total_time, cumulative_time))
+    return rows
+
+
+class ReportTable(UIControl):
+    """A prompt_toolkit control showing rows under a header of sortable columns.
+
+    Clicking a column title, or pressing Tab, changes the column rows are sorted by. Clicking a
+    row, or pressing Enter on it, calls on_select with it.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[Column],
+        rows: Sequence[Any],
+        on_select: Callable[[Any], None],
+        limit: int = 500,
+    ):
+        self.columns = columns
+        self.rows = list(rows)
+        self.on_select = on_select
+        self.limit = limit
+        self.cursor_line = 0
+        self.height = 1
+        self.sort(columns[0])
+        self.key_bindings = self._create_key_bindings()
+
+    def sort(self, column: Column) -> None:
+        self.sort_column = column
+        self.rows.sort(key=column.value, reverse=column.descending)
+        self.shown = self.rows[: self.limit]
+        self.cursor_line = 0
+
+    def add(self, row: Any) -> None:
+        """Adds a row where the current sort puts it, keeping the same row selected."""
+        selected = self.shown[self.cursor_line] if self.shown else None
+        self.rows.append(row)
+        self.rows.sort(key=self.sort_column.value, reverse=self.sort_column.descending)
+        self.shown = self.rows[: self.limit]
+        if selected is not None and selected in self.shown:
+            self.cursor_line = self.shown.index(selected)
+
+    def is_focusable(self) -> bool:
+        return True
+
+    def select(self, line: int) -> None:
+        self.cursor_line = max(min(line, len(self.shown) - 1), 0)
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.height = height
+
+        def header() -> StyleAndTextTuples:
+            fragments: StyleAndTextTuples = []
+            for column in self.columns:
+                style = "class:report.header"
+                if column is self.sort_column:
+                    style += " underline"
+                title = column.title + (" ▼" if column is self.sort_column else "")
+                if column.width:
+                    title = title.rjust(column.width) + " "
+                fragments.append((style, title))
+            return fragments
+
+        def get_line(line: int) -> StyleAndTextTuples:
+            if line == 0:
+                return header()
+
+            row = self.shown[line - 1]
+            style = "reverse" if line - 1 == self.cursor_line else ""
+            cells = []
+            for column in self.columns:
+                cell = column.cell(row)
+                cells.append(cell.rjust(column.width) + " " if column.width else cell)
+            return [(style, "".join(cells))]
+
+        return UIContent(
+            get_line=get_line,
+            line_count=len(self.shown) + 1,
+            cursor_position=Point(x=0, y=self.cursor_line + 1),
+            show_cursor=False,
+        )
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        if mouse_event.event_type == MouseEventType.SCROLL_UP:
+            self.select(self.cursor_line - 3)
+        elif mouse_event.event_type == MouseEventType.SCROLL_DOWN:
+            self.select(self.cursor_line + 3)
+        elif mouse_event.event_type == MouseEventType.MOUSE_UP:
+            if mouse_event.position.y == 0:
+                self._sort_by_position(mouse_event.position.x)
+            elif self.shown:
+                self.select(mouse_event.position.y - 1)
+                self.on_select(self.shown[self.cursor_line])
+        else:
+            return NotImplemented
+        return None
+
+    def _sort_by_position(self, x: int) -> None:
+        for column in self.columns:
+            if not column.width or x <= column.width:
+                self.sort(column)
+                return
+            x -= column.width + 1
+
+    def get_key_bindings(self) -> KeyBindings:
+        return self.key_bindings
+
+    def _create_key_bindings(self) -> KeyBindings:
+        key_bindings = KeyBindings()
+
+        def move(keys: str, lines):
+            @key_bindings.add(keys)
+            def _(event):
+                self.select(self.cursor_line + lines())
+
+        move("up", lambda: -1)
+        move("down", lambda: 1)
+        move("pageup", lambda: -self.height)
+        move("pagedown", lambda: self.height)
+
+        @key_bindings.add("tab")
+        def _(event):
+            columns = list(self.columns)
+            self.sort(columns[(columns.index(self.sort_column) + 1) % len(columns)])
+
+        @key_bindings.add("enter")
+        def _(event):
+            if self.shown:
+                self.on_select(self.shown[self.cursor_line])
+
+        return key_bindings
+
+
+@dataclass
+class FlameNode:
+    """A frame in a tree of the sampled call stacks, merging the stacks that share a beginning."""
+
+    name: str
+    count: int = 0  # The samples that saw this frame, called from its parents.
+    parent: Optional["FlameNode"] = field(default=None, repr=False, compare=False)
+    children: Dict[str, "FlameNode"] = field(default_factory=dict)
+
+    @property
+    def callees(self) -> List["FlameNode"]:
+        """Returns the frames called from this one, the most sampled first."""
+        return sorted(self.children.values(), key=lambda child: -child.count)
+
+
+def flame_tree(stacks: Dict[Tuple[str, ...], int]) -> FlameNode:
+    """Merges sampled call stacks, each listed from the outermost frame in, into a tree under a
+    root frame seen by every sample.
+    """
+    root = FlameNode("all")
+    for stack, count in stacks.items():
+        root.count += count
+        node = root
+        for name in stack:
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = FlameNode(name, parent=node)
+            child.count += count
+            node = child
+    return root
+
+
+def flame_rows(root: FlameNode, width: int) -> List[List[Tuple[FlameNode, int, int]]]:
+    """Lays out root and the frames below it in rows width characters wide, one per call depth,
+    returning the frames in each row with the column each starts at and the one after its end.
+
+    Frames are as wide as their share of root's samples, and those that would be narrower than a
+    character are left out.
+    """
+    rows = []
+    row = [(root, 0, width)]
+    while row:
+        rows.append(row)
+        below = []
+        for node, start, end in row:
+            seen = 0
+            for child in node.callees:
+                child_start = start + seen * (end - start) // node.count
+                seen += child.count
+                child_end = start + seen * (end - start) // node.count
+                if child_end > child_start:
+                    below.append((child, child_start, child_end))
+        row = below
+    return rows
+
+
+class FlameGraph(UIControl):
+    """A prompt_toolkit control showing sampled call stacks as an icicle graph: what the program
+    was running across the top, and what each of those frames called below it.
+
+    The arrow keys move between frames, calling on_select with each one moved to. Enter, or
+    clicking a frame that is already selected, zooms in so it fills the width, and Backspace
+    zooms back out.
+    """
+
+    def __init__(self, stacks: Dict[Tuple[str, ...], int], on_select: Callable[[FlameNode], None]):
+        self.root = self.zoomed = self.selected = flame_tree(stacks)
+        self.on_select = on_select
+        self.rows: List[List[Tuple[FlameNode, int, int]]] = []
+        self.key_bindings = self._create_key_bindings()
+
+    def is_focusable(self) -> bool:
+        return True
+
+    def select(self, node: FlameNode) -> None:
+        self.selected = node
+        self.on_select(node)
+
+    def zoom(self, node: FlameNode) -> None:
+        self.zoomed = node
+        self.select(node)
+
+    def _depth(self, node: FlameNode) -> int:
+        depth = 0
+        while node is not self.zoomed and node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
+
+    def _position(self, node: FlameNode) -> Optional[Tuple[int, int]]:
+        """Returns the row node is shown in and its index within it, if it is shown."""
+        depth = self._depth(node)
+        if depth < len(self.rows):
+            for index, (shown, _start, _end) in enumerate(self.rows[depth]):
+                if shown is node:
+                    return depth, index
+        return None
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.rows = flame_rows(self.zoomed, width)
+
+        def get_line(line: int) -> StyleAndTextTuples:
+            fragments: StyleAndTextTuples = []
+            column = 0
+            for node, start, end in self.rows[line]:
+                if start > column:
+                    fragments.append(("", " " * (start - column)))
+                if node is self.selected:
+                    style = "reverse"
+                else:
+                    style = f"class:flame.{zlib.crc32(node.name.encode('utf8')) % FLAME_COLORS}"
+                label_width = end - start - 1
+                fragments.append((style, node.name[:label_width].ljust(label_width) + "│"))
+                column = end
+            return fragments
+
+        position = self._position(self.selected)
+        cursor = Point(x=0, y=0)
+        if position is not None:
+            depth, index = position
+            cursor = Point(x=self.rows[depth][index][1], y=depth)
+        return UIContent(
+            get_line=get_line, line_count=len(self.rows), cursor_position=cursor, show_cursor=False
+        )
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        if mouse_event.event_type != MouseEventType.MOUSE_UP:
+            return NotImplemented
+
+        x, y = mouse_event.position.x, mouse_event.position.y
+        for node, start, end in self.rows[y] if y < len(self.rows) else ():
+            if start <= x < end:
+                if node is self.selected:
+                    self.zoom(node)
+                else:
+                    self.select(node)
+        return None
+
+    def get_key_bindings(self) -> KeyBindings:
+        return self.key_bindings
+
+    def _create_key_bindings(self) -> KeyBindings:
+        key_bindings = KeyBindings()
+
+        @key_bindings.add("up")
+        def _(event):
+            if self.selected is not self.zoomed and self.selected.parent is not None:
+                self.select(self.selected.parent)
+
+        @key_bindings.add("down")
+        def _(event):
+            position = self._position(self.selected)
+            if position is not None and position[0] + 1 < len(self.rows):
+                for node, _start, _end in self.rows[position[0] + 1]:
+                    if node.parent is self.selected:
+                        self.select(node)
+                        return
+
+        def sideways(keys: str, step: int):
+            @key_bindings.add(keys)
+            def _(event):
+                position = self._position(self.selected)
+                if position is not None:
+                    depth, index = position
+                    if 0 <= index + step < len(self.rows[depth]):
+                        self.select(self.rows[depth][index + step][0])
+
+        sideways("left", -1)
+        sideways("right", 1)
+
+        @key_bindings.add("enter")
+        def _(event):
+            self.zoom(self.selected)
+
+        @key_bindings.add("backspace")
+        def _(event):
+            if self.zoomed.parent is not None:
+                self.zoomed = self.zoomed.parent
+
+        return key_bindings
+
+
+class LineHeatMargin(Margin):
+    """A margin showing how many times each line ran and for how long, shaded from the coolest to
+    the hottest line. It takes no room until there are times to show.
+    """
+
+    def __init__(self):
+        self.hits: List[int] = []
+        self.times: List[int] = []  # Nanoseconds, indexed by line number like hits.
+        self.hottest = 0
+
+    def show(self, hits: List[int], times: List[int]) -> None:
+        self.hits = hits
+        self.times = times
+        self.hottest = max(times, default=0)
+
+    def clear(self) -> None:
+        self.show([], [])
+
+    def get_width(self, get_ui_content: Callable[[], UIContent]) -> int:
+        return 17 if self.hits else 0
+
+    def create_margin(
+        self, window_render_info: "WindowRenderInfo", width: int, height: int
+    ) -> StyleAndTextTuples:
+        result: StyleAndTextTuples = []
+        last_row = None
+        for row in window_render_info.displayed_lines:
+            line = row + 1
+            if row != last_row and line < len(self.hits) and self.hits[line]:
+                time = self.times[line]
+                level = min(HEAT_LEVELS * time // (self.hottest or 1), HEAT_LEVELS - 1)
+                text = f"{format_count(self.hits[line]):>5} {format_duration(time / 1e9):>10}"
+                result.append((f"class:line-heat.{level}", text.ljust(width)))
+            last_row = row
+            result.append(("", "\n"))
+        return result
+
+
+class BreakpointMargin(Margin):
+    """A margin marking the lines with breakpoints and the line a program being debugged is
+    paused on. It takes no room while there are neither.
+    """
+
+    def __init__(self):
+        self.breakpoints: Set[int] = set()  # Line numbers, counting from 1.
+        self.paused_line: Optional[int] = None
+
+    def toggle(self, line: int) -> bool:
+        """Adds or removes a breakpoint on line, returning whether there is one now."""
+        self.breakpoints ^= {line}
+        return line in self.breakpoints
+
+    def get_width(self, get_ui_content: Callable[[], UIContent]) -> int:
+        return 2 if self.breakpoints or self.paused_line is not None else 0
+
+    def create_margin(
+        self, window_render_info: "WindowRenderInfo", width: int, height: int
+    ) -> StyleAndTextTuples:
+        result: StyleAndTextTuples = []
+        last_row = None
+        for row in window_render_info.displayed_lines:
+            line = row + 1
+            if row != last_row:
+                if line == self.paused_line:
+                    result.append(("class:paused-line", "▶ "))
+                elif line in self.breakpoints:
+                    result.append(("class:breakpoint", "● "))
+            last_row = row
+            result.append(("", "\n"))
+        return result
+
+
+class CoverageMargin(Margin):
+    """A margin marking which lines ran and which could have but didn't. It takes no room until
+    there are lines to mark.
+    """
+
+    def __init__(self):
+        self.executed: Set[int] = set()  # Line numbers, counting from 1.
+        self.missed: Set[int] = set()
+
+    def show(self, executed: Sequence[int], executable: Sequence[int]) -> None:
+        self.executed = set(executed)
+        self.missed = set(executable) - self.executed
+
+    def clear(self) -> None:
+        self.show([], [])
+
+    @property
+    def shown(self) -> bool:
+        return bool(self.executed or self.missed)
+
+    def get_width(self, get_ui_content: Callable[[], UIContent]) -> int:
+        return 1 if self.shown else 0
+
+    def create_margin(
+        self, window_render_info: "WindowRenderInfo", width: int, height: int
+    ) -> StyleAndTextTuples:
+        result: StyleAndTextTuples = []
+        last_row = None
+        for row in window_render_info.displayed_lines:
+            line = row + 1
+            if row != last_row:
+                if line in self.executed:
+                    result.append(("class:covered", "▐"))
+                elif line in self.missed:
+                    result.append(("class:not-covered", "▐"))
+            last_row = row
+            result.append(("", "\n"))
+        return result
@@ -0,0 +1,320 @@
+"""Runs programs for QuickPython, keeping a warm interpreter around to start them from.
+
+On platforms that support fork a server process (see `quickpython.child`) is started in the
+background with the modules QuickPython programs commonly use already imported. Each run forks a
+clean child from it instead of starting a new interpreter. Elsewhere, or if the server can't be
+reached, every run falls back to starting `sys.executable`.
+
+Programs are handed over as source code through a connection rather than a file. Their standard
+streams are connected to the editor through pipes (`Runner.launch`), which are read without
+blocking the event loop. They also get a connection their mode reports results over, and can be
+sent requests on.
+"""
+import asyncio
+import os
+import signal
+import subprocess  # nosec
+import sys
+import threading
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection, Listener
+from multiprocessing.reduction import send_handle
+from queue import Empty, Queue
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from quickpython import child
+
+CAN_FORK = hasattr(os, "fork")
+CHUNK_SIZE = 256 * 1024
+OUTPUT_GRACE_PERIOD = 0.5  # How long to keep reading output after a program has exited.
+
+OnResult = Callable[[str, Any], None]
+
+
+class Run:
+    """A program started by `Runner.launch`, with its stdin and output connected to the editor."""
+
+    def __init__(
+        self,
+        pid: int,
+        exited: Awaitable[Tuple[int, Optional[child.Usage]]],
+        stdin: asyncio.WriteTransport,
+        output_closed: Awaitable[None],
+        close_output: Callable[[], None],
+        results: Optional[Connection] = None,
+        session: bool = False,
+    ):
+        self.pid = pid
+        self.session = session  # Whether the program leads a session, so its pid is its group's.
+        self.returncode: Optional[int] = None
+        self.usage: Optional[child.Usage] = None  # Known once it exits, where it can be measured.
+        self._exited = asyncio.ensure_future(exited)
+        self._stdin = stdin
+        self._results = results
+        self._output_closed = asyncio.ensure_future(output_closed)
+        self._close_output = close_output
+
+    def send(self, text: str) -> None:
+        """Writes text to the program's stdin."""
+        if not self._stdin.is_closing():
+            self._stdin.write(text.encode("utf8"))
+
+    def close_stdin(self) -> None:
+        self._stdin.close()
+
+    def request(self, message: Any) -> bool:
+        """Sends message to the program's mode, returning whether it could be sent."""
+        if self._results is None or self._results.closed:
+            return False
+        try:
+            self._results.send(message)
+        except OSError:
+            return False
+        return True
+
+    def interrupt(self) -> None:
+        """Sends the program a KeyboardInterrupt, as Ctrl+C would in a terminal."""
+        self._signal(signal.SIGINT)
+
+    def kill(self) -> None:
+        """Stops the program, along with any processes it started where it leads a session."""
+        self._signal(getattr(signal, "SIGKILL", signal.SIGTERM), group=self.session)
+
+    def _signal(self, signal_number: int, group: bool = False) -> None:
+        if self.returncode is not None:
+            return
+        if group:
+            try:
+                os.killpg(self.pid, signal_number)
+                return
+            except OSError:  # It may not have started its session yet.
+                pass
+        try:
+            os.kill(self.pid, signal_number)
+        except OSError:  # pragma: no cover
+            pass
+
+    async def wait(self) -> int:
+        """Waits for the program to exit and its output to be read, returning its exit code."""
+        self.returncode, self.usage = await self._exited
+        try:
+            # Anything the program started may still hold the output open.
+            await asyncio.wait_for(asyncio.shield(self._output_closed), OUTPUT_GRACE_PERIOD)
+        except asyncio.TimeoutError:
+            self._close_output()
+        self._stdin.close()
+        return self.returncode
+
+
+class _OutputProtocol(asyncio.Protocol):
+    def __init__(self, on_output: Callable[[bytes], None]):
+        self.on_output = on_output
+        self.closed = asyncio.get_event_loop().create_future()
+
+    def data_received(self, data: bytes) -> None:
+        self.on_output(data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+class Runner:
+    """Starts runs, reusing one fork server for all of them where the platform allows.
+
+    Only one program runs at a time.
+    """
+
+    def __init__(self):
+        self.server: Optional[subprocess.Popen] = None
+        self.connection: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """Starts the fork server if it isn't already running. Returns without waiting for it."""
+        if not CAN_FORK:
+            return
+
+        with self._lock:
+            if self.server is not None and self.server.poll() is None:
+                return
+
+            self._close()
+            self.connection, server_connection = Pipe()
+            self.server = subprocess.Popen(  # nosec
+                [sys.executable, "-m", "quickpython.child", "--serve"]
+                + [str(server_connection.fileno())],
+                pass_fds=(server_connection.fileno(),),
+            )
+            server_connection.close()
+
+    async def launch(
+        self,
+        program: child.Program,
+        on_output: Callable[[bytes], None],
+        on_result: Optional[OnResult] = None,
+    ) -> Run:
+        """Starts the program in the background, calling on_output with everything it writes to
+        stdout or stderr as it arrives, and on_result with the kind and value of anything its
+        mode reports.
+        """
+        loop = asyncio.get_event_loop()
+        if CAN_FORK:
+            stdin_read, stdin_write = os.pipe()
+            output_read, output_write = os.pipe()
+            results, child_results = Pipe()
+            try:
+                pid = await loop.run_in_executor(
+                    None,
+                    self._start_forked,
+                    program,
+                    (stdin_read, output_write, child_results.fileno()),
+                )
+            finally:
+                os.close(stdin_read)
+                os.close(output_write)
+                child_results.close()
+
+            if pid is not None:
+                output, protocol = await loop.connect_read_pipe(
+                    lambda: _OutputProtocol(on_output), os.fdopen(output_read, "rb", buffering=0)
+                )
+                stdin, _ = await loop.connect_write_pipe(
+                    asyncio.Protocol, os.fdopen(stdin_write, "wb", buffering=0)
+                )
+                exited = loop.run_in_executor(None, self._wait_forked)
+                closed = asyncio.gather(protocol.closed, _read_results(results, on_result))
+                return Run(pid, exited, stdin, closed, output.close, results, session=True)
+
+            os.close(output_read)
+            os.close(stdin_write)
+            results.close()
+
+        return await self._launch_spawned(program, on_output, on_result)
+
+    async def _launch_spawned(
+        self,
+        program: child.Program,
+        on_output: Callable[[bytes], None],
+        on_result: Optional[OnResult],
+    ) -> Run:
+        authkey = os.urandom(32)
+        with Listener(authkey=authkey) as listener:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                "-m",
+                "quickpython.child",
+                "--connect",
+                listener.address,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env={**os.environ, child.AUTHKEY_VARIABLE: authkey.hex()},
+            )
+            results = await asyncio.get_event_loop().run_in_executor(
+                None, _send_program, listener, program, lambda: process.returncode is not None
+            )
+
+        async def read_output():
+            assert process.stdout is not None  # nosec
+            data = await process.stdout.read(CHUNK_SIZE)
+            while data:
+                on_output(data)
+                data = await process.stdout.read(CHUNK_SIZE)
+
+        reading = asyncio.gather(read_output(), _read_results(results, on_result))
+        stdin: asyncio.WriteTransport = process.stdin  # type: ignore
+        exited = _unmeasured(process.wait())
+        return Run(process.pid, exited, stdin, reading, reading.cancel, results)
+
+    def _start_forked(self, program: child.Program, stdio: Tuple[int, int, int]) -> Optional[int]:
+        """Asks the fork server to start program, returning its process id, or None if the
+        server couldn't be reached.
+        """
+        for _attempt in range(2):  # The server may have died since the last run.
+            self.warm()
+            assert self.connection is not None and self.server is not None  # nosec
+            try:
+                self.connection.send(program)
+                for fd in stdio:
+                    send_handle(self.connection, fd, self.server.pid)
+                _, pid = self.connection.recv()
+                return pid
+            except (EOFError, OSError):
+                self._close()
+        return None
+
+    def _wait_forked(self) -> Tuple[int, Optional[child.Usage]]:
+        assert self.connection is not None  # nosec
+        usage = None
+        try:
+            _, code, measured = self.connection.recv()
+            usage = child.Usage(*measured)
+        except (EOFError, OSError):
+            self._close()
+            code = -1
+        return code, usage
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.server is not None:
+            self.server.wait()
+            self.server = None
+
+    def shutdown(self) -> None:
+        """Stops the fork server. It exits on its own once its connection is closed."""
+        with self._lock:
+            self._close()
+
+
+async def _unmeasured(exited: Awaitable[int]) -> Tuple[int, Optional[child.Usage]]:
+    return await exited, None
+
+
+async def _read_results(results: Optional[Connection], on_result: Optional[OnResult]) -> None:
+    """Passes everything reported over results to on_result until the program closes it."""
+    if results is None:
+        return
+
+    loop = asyncio.get_event_loop()
+
+    def read():
+        with results:
+            while True:
+                try:
+                    kind, result = results.recv()
+                except (EOFError, OSError):
+                    return
+                if on_result is not None:
+                    loop.call_soon_threadsafe(on_result, kind, result)
+
+    await loop.run_in_executor(None, read)
+
+
+def _send_program(
+    listener: Listener, program: child.Program, exited: Callable[[], bool]
+) -> Optional[Connection]:
+    """Sends program to the process connecting to listener, giving up if it exits first.
+
+    Returns the connection, which the process goes on to report its results over.
+    """
+    accepted: "Queue[Connection]" = Queue()
+
+    def accept():
+        try:
+            accepted.put(listener.accept())
+        except OSError:  # The listener was closed after giving up.
+            pass
+
+    threading.Thread(target=accept, daemon=True).start()
+    while True:
+        try:
+            connection = accepted.get(timeout=0.05)
+        except Empty:
+            if exited():
+                return None
+        else:
+            connection.send(program)
+            return connection
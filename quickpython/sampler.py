@@ -0,0 +1,69 @@
+"""A sampling profiler for programs that run too long, or too interactively, to profile every call.
+
+A thread of its own looks at the call stack of the thread the program runs on at a fixed interval,
+and counts how often each stack is seen. Nothing is done on the program's own thread, so however
+long it runs it runs much as it would unprofiled, and the counts show where its time went by the
+clock, including time spent waiting for input or sleeping. The stacks are written out in the
+collapsed form flame graph tools read: one line per stack, its frames from the outermost in,
+separated by semicolons and followed by how many samples saw it.
+"""
+import os
+import sys
+import threading
+import time
+import types
+from typing import Dict, List, Optional, Tuple
+
+Stack = Tuple[str, ...]  # The frames of a call stack, from the outermost in.
+
+
+class Sampler:
+    """Counts the stacks the program code is seen in, sampling every interval seconds."""
+
+    def __init__(self, filename: str, interval: float):
+        self.filename = filename
+        self.interval = interval
+        self.stacks: Dict[Stack, int] = {}
+        self._labels: Dict[types.CodeType, str] = {}
+        self._stopped = threading.Event()
+
+    def run(self, code: types.CodeType, namespace: dict) -> None:
+        thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(), code), daemon=True
+        )
+        thread.start()
+        try:
+            exec(code, namespace)  # nosec
+        finally:
+            self._stopped.set()
+            thread.join()
+
+    def _sample(self, thread_id: int, code: types.CodeType) -> None:
+        next_sample = time.perf_counter() + self.interval
+        while not self._stopped.wait(max(next_sample - time.perf_counter(), 0)):
+            next_sample += self.interval
+            frame: Optional[types.FrameType] = sys._current_frames().get(thread_id)
+            stack: List[str] = []
+            while frame is not None and frame.f_code is not code:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if frame is not None:  # Only count samples taken while the program was running.
+                stack.append(self._label(code))
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def _label(self, code: types.CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            if code.co_filename == self.filename:
+                label = f"{code.co_name} (line {code.co_firstlineno})"
+            else:
+                filename = os.path.basename(code.co_filename)
+                label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+
+def collapsed(stacks: Dict[Stack, int]) -> str:
+    """Returns stacks in the collapsed form, one per line."""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items()))
@@ -0,0 +1,255 @@
+"""Small on-disk stores QuickPython keeps between editor sessions.
+
+The stores are JSON files, so that one planted in a shared cache directory can't run code when
+read, and are shared between QuickPython processes: each update rereads the file and writes it
+back while holding a lock on a lock file next to it, so no process loses what another recorded.
+"""
+import hashlib
+import json
+import os
+import stat
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+FormattedFileEntry = Tuple[int, int, bytes, str]  # (size, mtime_ns, sha256, config fingerprint)
+# (filename, sha256 of the source, started, wall seconds, CPU seconds, peak RSS, exit code)
+RunEntry = Tuple[str, bytes, float, float, Optional[float], Optional[int], int]
+
+
+def cache_dir() -> Path:
+    """Returns the directory QuickPython keeps its caches in."""
+    if "QUICKPYTHON_CACHE_DIR" in os.environ:
+        return Path(os.environ["QUICKPYTHON_CACHE_DIR"])
+    elif sys.platform == "win32":
+        return Path(os.environ.get("LOCALAPPDATA", "~")).expanduser() / "quickpython"
+    return Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser() / "quickpython"
+
+
+def atomic_write(path: Path, data: Union[bytes, str], encoding: str = "utf8") -> None:
+    """Writes data to path so that readers only ever see the old or the complete new contents,
+    even if QuickPython or the machine crashes partway through.
+
+    The data is written and fsynced to a temporary file next to path, which is then renamed over
+    it. Existing files keep their permissions.
+    """
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    if hasattr(os, "O_DIRECTORY"):  # Make sure the rename itself survives a crash as well.
+        directory = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        except OSError:  # pragma: no cover
+            pass
+        finally:
+            os.close(directory)
+
+
+def write_if_changed(path: Path, contents: str) -> bool:
+    """Atomically saves contents to path as UTF-8 text, using the platform's line endings,
+    unless the file already holds exactly that. Returns True if the file was written.
+    """
+    data = contents.replace("\n", os.linesep).encode("utf8")
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+
+    atomic_write(path, data)
+    return True
+
+
+def content_hash(contents: str) -> bytes:
+    return hashlib.sha256(contents.encode("utf8")).digest()
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """Holds an exclusive lock for updating path, waiting for other processes to release it.
+
+    Raises OSError if the lock file can't be created.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.with_name(f"{path.name}.lock").open("a+b") as lock_file:
+        try:
+            import fcntl
+        except ImportError:  # pragma: no cover
+            import msvcrt
+
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)  # type: ignore
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)  # type: ignore
+            return
+
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def read_json(path: Path) -> Any:
+    """Returns the JSON value stored at path, or None if it is missing or can't be read."""
+    try:
+        with path.open("rb") as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def update_json(path: Path, update: Callable[[Any], Any]) -> None:
+    """Replaces the JSON value stored at path, or None if there isn't one, with what update
+    returns for it, without losing updates other processes make at the same time. Errors
+    reading or writing the file are ignored, as the stores are only caches.
+    """
+    try:
+        with locked(path):
+            atomic_write(path, json.dumps(update(read_json(path)), separators=(",", ":")))
+    except OSError:
+        pass
+
+
+class FormattedFiles:
+    """A persistent record of files known to already be formatted, similar to black's cache.
+
+    Entries are keyed on the resolved path and remember the size, modification time, content
+    hash and formatting config fingerprint the file was formatted with. The cache is bounded to
+    `max_size` entries, dropping the least recently recorded first.
+    """
+
+    def __init__(self, path: Path, max_size: int = 4096):
+        self.path = path
+        self.max_size = max_size
+        self._entries: Dict[str, FormattedFileEntry] = {}
+        self._loaded = False
+
+    def _read(self) -> Dict[str, FormattedFileEntry]:
+        return _formatted_file_entries(read_json(self.path))
+
+    def _load(self) -> None:
+        if not self._loaded:
+            self._entries = self._read()
+            self._loaded = True
+
+    def is_formatted(self, file_path: Path, contents: str, fingerprint: str) -> bool:
+        """Returns True if contents matches what is on disk at file_path and is formatted."""
+        self._load()
+        entry = self._entries.get(str(file_path))
+        if entry is None:
+            return False
+
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return False
+        return entry == (stat.st_size, stat.st_mtime_ns, content_hash(contents), fingerprint)
+
+    def record(self, file_path: Path, contents: str, fingerprint: str) -> None:
+        """Records that file_path was just written out formatted with the given contents."""
+        stat = file_path.stat()
+        key = str(file_path)
+        entry = (stat.st_size, stat.st_mtime_ns, content_hash(contents), fingerprint)
+
+        def update(stored: Any) -> Dict[str, list]:
+            self._entries = _formatted_file_entries(stored)
+            self._loaded = True
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            for stale_key in list(self._entries)[: max(len(self._entries) - self.max_size, 0)]:
+                del self._entries[stale_key]
+            return {
+                key: [size, mtime_ns, digest.hex(), fingerprint]
+                for key, (size, mtime_ns, digest, fingerprint) in self._entries.items()
+            }
+
+        update_json(self.path, update)
+
+
+def _formatted_file_entries(stored: Any) -> Dict[str, FormattedFileEntry]:
+    """Returns the entries in a FormattedFiles store as read from JSON, skipping malformed ones."""
+    entries: Dict[str, FormattedFileEntry] = {}
+    for key, entry in (stored if isinstance(stored, dict) else {}).items():
+        try:
+            size, mtime_ns, digest, fingerprint = entry
+            entries[key] = (int(size), int(mtime_ns), bytes.fromhex(digest), str(fingerprint))
+        except (TypeError, ValueError):
+            continue
+    return entries
+
+
+class RunHistory:
+    """A persistent record of how long recent runs took and how much memory they used.
+
+    Entries are RunEntry tuples, kept in the order they were recorded. The history is bounded to
+    `max_size` entries, dropping the oldest first.
+    """
+
+    def __init__(self, path: Path, max_size: int = 2000):
+        self.path = path
+        self.max_size = max_size
+
+    def _read(self) -> List[RunEntry]:
+        return _run_entries(read_json(self.path))
+
+    def runs(self, filename: str) -> List[RunEntry]:
+        """Returns the recorded runs of the program saved as filename, oldest first."""
+        return [entry for entry in self._read() if entry[0] == filename]
+
+    def record(self, entry: RunEntry) -> None:
+        """Adds a run to the end of the history, dropping the oldest if it is full."""
+        filename, source_hash, *measurements = entry
+
+        def update(stored: Any) -> list:
+            entries = stored if isinstance(stored, list) else []
+            return (entries + [[filename, source_hash.hex(), *measurements]])[-self.max_size :]
+
+        update_json(self.path, update)
+
+
+def _run_entries(stored: Any) -> List[RunEntry]:
+    """Returns the entries in a RunHistory store as read from JSON, skipping malformed ones."""
+    entries: List[RunEntry] = []
+    for entry in stored if isinstance(stored, list) else []:
+        try:
+            filename, source_hash, started, wall, cpu, peak_rss, exit_code = entry
+            entries.append(
+                (
+                    str(filename),
+                    bytes.fromhex(source_hash),
+                    float(started),
+                    float(wall),
+                    None if cpu is None else float(cpu),
+                    None if peak_rss is None else int(peak_rss),
+                    int(exit_code),
+                )
+            )
+        except (TypeError, ValueError):
+            continue
+    return entries
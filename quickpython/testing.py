@@ -0,0 +1,188 @@
+"""Finds and runs the tests of programs started from QuickPython, reporting each as it finishes.
+
+Tests are the top level `test_*` functions of a module and the doctests in its docstrings. The
+modules are run once, and where fork is available each test then runs in a process forked from
+them, several at a time, and is killed if it takes longer than the timeout. That keeps a test that
+hangs or crashes the interpreter from taking the others with it. Elsewhere they run one after the
+other in the same process, without timeouts. `run_all` runs anything else that is best kept
+apart the same way, such as a program run once for each of its fixtures.
+"""
+import contextlib
+import doctest
+import io
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+import types
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from quickpython import child
+
+CAN_FORK = hasattr(os, "fork")
+READ_SIZE = 64 * 1024
+
+Report = Callable[[str, Any], None]
+
+
+class DocTestFailure(AssertionError):
+    """Raised by doctests that failed, once doctest has already shown why."""
+
+
+@dataclass
+class Test:
+    name: str
+    filename: str
+    line: int
+    run: Callable[[], Optional[int]]  # Raises if the test fails, or returns an exit code.
+    stdin: str = os.devnull  # Where the test's input comes from. By default, input() fails.
+
+
+def collect(module: types.ModuleType) -> List[Test]:
+    """Returns the tests defined in module, in the order they appear."""
+    filename = module.__file__ or ""
+    tests = []
+    for name, value in vars(module).items():
+        if (
+            name.startswith("test")
+            and isinstance(value, types.FunctionType)
+            and value.__code__.co_filename == filename
+        ):
+            tests.append(Test(name, filename, value.__code__.co_firstlineno, value))
+
+    for doc_test in doctest.DocTestFinder().find(module, module.__name__):
+        if doc_test.examples:
+            tests.append(
+                Test(
+                    f"doctest {doc_test.name}",
+                    filename,
+                    (doc_test.lineno or 0) + 1,
+                    _doc_test_runner(doc_test),
+                )
+            )
+    tests.sort(key=lambda test: test.line)
+    return tests
+
+
+def _doc_test_runner(doc_test: doctest.DocTest) -> Callable[[], None]:
+    def run():
+        runner = doctest.DocTestRunner(optionflags=doctest.ELLIPSIS)
+        if runner.run(doc_test, out=sys.stdout.write).failed:
+            raise DocTestFailure(doc_test.name)
+
+    return run
+
+
+def run_tests(tests: List[Test], report: Report, workers: int, timeout: float) -> None:
+    """Runs tests, reporting the name, file, line, outcome, duration and output of each one as
+    "test" once it has finished.
+    """
+    for test, exit_code, duration, output in run_all(tests, workers, timeout):
+        if exit_code is None:
+            outcome = "timed out"
+        else:
+            outcome = "passed" if exit_code == 0 else "failed"
+        report("test", (test.name, test.filename, test.line, outcome, duration, output))
+
+
+def run_all(
+    tests: List[Test], workers: int, timeout: float
+) -> Iterator[Tuple[Test, Optional[int], float, str]]:
+    """Runs tests, yielding each one once it has finished along with its exit code, which is None
+    if it timed out, how long it took in seconds and what it printed.
+    """
+    if not CAN_FORK:
+        for test in tests:
+            yield (test, *_run_in_process(test))
+        return
+
+    pending = list(tests)
+    running: Dict[int, Any] = {}  # The test, its process, start time and output, by output fd.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                test = pending.pop(0)
+                output_read, output_write = os.pipe()
+                pid = os.fork()
+                if pid == 0:  # pragma: no cover
+                    os.close(output_read)
+                    _run_test_process(test, output_write)
+                os.close(output_write)
+                running[output_read] = (test, pid, time.perf_counter(), [])
+
+            readable, _, _ = select.select(list(running), [], [], 0.05)
+            for fd in readable:
+                data = os.read(fd, READ_SIZE)
+                if data:
+                    running[fd][3].append(data)
+                    continue
+                test, pid, started, output = running.pop(fd)
+                os.close(fd)
+                _, status = os.waitpid(pid, 0)
+                duration = time.perf_counter() - started
+                yield test, child.exit_code(status), duration, _decode(output)
+
+            now = time.perf_counter()
+            for fd, (test, pid, started, output) in list(running.items()):
+                if now - started > timeout:
+                    _stop(pid, fd)
+                    del running[fd]
+                    yield test, None, now - started, _decode(output)
+    finally:
+        for fd, (_test, pid, _started, _output) in running.items():
+            _stop(pid, fd)
+
+
+def _decode(output: List[bytes]) -> str:
+    return b"".join(output).decode("utf8", "replace")
+
+
+def _run_in_process(test: Test) -> Tuple[int, float, str]:
+    started = time.perf_counter()
+    output = io.StringIO()
+    stdin = sys.stdin
+    try:
+        with open(test.stdin, encoding="utf8") as sys.stdin:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                exit_code = _run_test(test)
+    finally:
+        sys.stdin = stdin
+    return exit_code, time.perf_counter() - started, output.getvalue()
+
+
+def _run_test(test: Test) -> int:
+    try:
+        return test.run() or 0
+    except DocTestFailure:
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+def _stop(pid: int, fd: int) -> None:
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    os.close(fd)
+
+
+def _run_test_process(test: Test, output_fd: int) -> None:  # pragma: no cover
+    code = 1
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.dup2(os.open(test.stdin, os.O_RDONLY), 0)
+        os.dup2(output_fd, 1)
+        os.dup2(output_fd, 2)
+        os.close(output_fd)
+        # In case the program swapped them.
+        sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+        code = _run_test(test)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
@@ -0,0 +1,186 @@
+"""A read-only viewer for files too large to comfortably load into the editor.
+
+The file is memory-mapped rather than read, and only the lines currently on screen are ever
+decoded. Line offsets are found through a lazily built index that records how many lines start
+before each fixed size block of the file, so jumping to a line only scans as far as needed.
+"""
+import mmap
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional, Union
+
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.formatted_text import StyleAndTextTuples
+from prompt_toolkit.key_binding.key_bindings import KeyBindings
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
+
+BLOCK_SIZE = 1 << 16
+MAX_LINE_LENGTH = 4096
+
+
+class LineIndex:
+    """Maps line numbers to byte offsets within a memory-mapped file, scanning it lazily."""
+
+    def __init__(self, data: Union[mmap.mmap, bytes]):
+        self.data = data
+        self.size = len(data)
+        self.block_lines = array("Q", [0])  # Newlines found before the start of each block.
+        self.complete = self.size == 0
+
+    def _index_block(self) -> None:
+        start = (len(self.block_lines) - 1) * BLOCK_SIZE
+        end = min(start + BLOCK_SIZE, self.size)
+        self.block_lines.append(self.block_lines[-1] + self.data[start:end].count(b"\n"))
+        if end == self.size:
+            self.complete = True
+
+    def line_count(self) -> int:
+        """Returns the number of lines in the file, indexing the whole file if needed."""
+        while not self.complete:
+            self._index_block()
+        last_line_open = self.size and self.data[self.size - 1 : self.size] != b"\n"
+        return self.block_lines[-1] + (1 if last_line_open else 0)
+
+    def line_offset(self, line: int) -> Optional[int]:
+        """Returns the byte offset where the 0 based line starts, or None past the end."""
+        if line == 0:
+            return 0 if self.size else None
+
+        while self.block_lines[-1] < line and not self.complete:
+            self._index_block()
+
+        block = bisect_left(self.block_lines, line) - 1
+        if block + 1 == len(self.block_lines):
+            return None
+
+        offset = block * BLOCK_SIZE
+        for _ in range(line - self.block_lines[block]):
+            offset = self.data.find(b"\n", offset) + 1
+        return offset if offset < self.size else None
+
+    def line_of(self, offset: int) -> int:
+        """Returns the 0 based line that contains the given byte offset."""
+        block = offset // BLOCK_SIZE
+        while len(self.block_lines) <= block and not self.complete:
+            self._index_block()
+        return self.block_lines[block] + self.data[block * BLOCK_SIZE : offset].count(b"\n")
+
+    def lines(self, first_line: int, count: int) -> List[str]:
+        """Returns the decoded text of up to count lines starting at first_line, each truncated
+        to MAX_LINE_LENGTH characters.
+        """
+        lines: List[str] = []
+        start = self.line_offset(first_line)
+        while start is not None and len(lines) < count:
+            end = self.data.find(b"\n", start)
+            if end == -1:
+                end = self.size
+            line = self.data[start : min(end, start + MAX_LINE_LENGTH)]
+            lines.append(line.decode("utf8", errors="replace").rstrip("\r"))
+            start = end + 1 if end + 1 < self.size else None
+        return lines
+
+    def line(self, line: int) -> Optional[str]:
+        lines = self.lines(line, 1)
+        return lines[0] if lines else None
+
+
+class LargeFileViewer(UIControl):
+    """A prompt_toolkit control that displays a memory-mapped file one screen at a time."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = path.open("rb")
+        self.data: Union[mmap.mmap, bytes] = b""
+        if path.stat().st_size:  # Empty files can't be mapped.
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = LineIndex(self.data)
+        self.cursor_line = 0
+        self.top_line = 0
+        self.height = 1
+        self.key_bindings = self._create_key_bindings()
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def is_focusable(self) -> bool:
+        return True
+
+    def goto(self, line: int) -> None:
+        """Moves the cursor to the given 0 based line, stopping at the end of the file."""
+        line = max(line, 0)
+        if self.index.line_offset(line) is None:
+            line = max(self.index.line_count() - 1, 0)
+        self.cursor_line = line
+
+    def search(self, text: str) -> bool:
+        """Moves the cursor to the next line after the current one containing text."""
+        start = self.index.line_offset(self.cursor_line + 1)
+        found = -1 if start is None else self.data.find(text.encode("utf8"), start)
+        if found == -1:
+            return False
+        self.goto(self.index.line_of(found))
+        return True
+
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.height = height
+        if self.cursor_line < self.top_line:
+            self.top_line = self.cursor_line
+        elif self.cursor_line >= self.top_line + height:
+            self.top_line = self.cursor_line - height + 1
+
+        lines = self.index.lines(self.top_line, height)
+        gutter_width = len(str(self.top_line + len(lines)))
+
+        def get_line(row: int) -> StyleAndTextTuples:
+            line_number = self.top_line + row
+            style = "reverse" if line_number == self.cursor_line else ""
+            return [
+                ("class:line-number", f"{line_number + 1:>{gutter_width}} "),
+                (style, lines[row].expandtabs() or " "),
+            ]
+
+        return UIContent(
+            get_line=get_line,
+            line_count=len(lines),
+            cursor_position=Point(x=0, y=self.cursor_line - self.top_line),
+            show_cursor=False,
+        )
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        if mouse_event.event_type == MouseEventType.SCROLL_UP:
+            self.goto(self.cursor_line - 3)
+        elif mouse_event.event_type == MouseEventType.SCROLL_DOWN:
+            self.goto(self.cursor_line + 3)
+        elif mouse_event.event_type == MouseEventType.MOUSE_UP:
+            self.goto(self.top_line + mouse_event.position.y)
+        else:
+            return NotImplemented
+        return None
+
+    def get_key_bindings(self) -> KeyBindings:
+        return self.key_bindings
+
+    def _create_key_bindings(self) -> KeyBindings:
+        key_bindings = KeyBindings()
+
+        def move(keys: str, lines):
+            @key_bindings.add(keys)
+            def _(event):
+                self.goto(self.cursor_line + lines())
+
+        move("up", lambda: -1)
+        move("down", lambda: 1)
+        move("pageup", lambda: -self.height)
+        move("pagedown", lambda: self.height)
+        move("c-home", lambda: -self.cursor_line)
+
+        @key_bindings.add("c-end")
+        def _(event):
+            self.goto(self.index.line_count() - 1)
+
+        return key_bindings
@@ -0,0 +1,66 @@
+"""Compares the cost of formatting on Enter when formatting the whole buffer vs only the
+top-level block around the cursor.
+
+Usage: poetry run python scripts/benchmark_enter.py [line counts...]
+"""
+
+import sys
+import timeit
+from functools import partial
+
+import isort
+
+from quickpython import formatting
+
+DEFAULT_SIZES = (100, 1_000, 5_000, 10_000, 50_000)
+FUNCTION = '''
+
+def function_{index}(words, guesses):
+    """Returns how many of the guessed letters appear in the given words."""
+    found = 0
+    for word in words:
+        for letter in guesses:
+            if letter in word:
+                found += 1
+    return found
+'''
+
+
+def make_buffer(lines: int) -> str:
+    functions = [FUNCTION.format(index=index) for index in range(lines // FUNCTION.count("\n"))]
+    return (
+        "import os\nimport sys\n" + "".join(functions) + "\n\ndef typed():\n    value = [1,2,3]\n"
+    )
+
+
+ISORT_CONFIG = isort.Config(profile="black", float_to_top=True)
+
+
+def format_code(text: str) -> str:
+    return formatting.format_code(text, ISORT_CONFIG, {})[0]
+
+
+def full(text: str) -> str:
+    return format_code(text)
+
+
+def block(text: str) -> str:
+    start = formatting.block_start(text, len(text))
+    return text[:start] + format_code(text[start:])
+
+
+def main(sizes=DEFAULT_SIZES):
+    print(f"{'lines':>8} {'full (ms)':>12} {'block (ms)':>12}")
+    for size in sizes:
+        text = make_buffer(size)
+        assert block(text).endswith("value = [1, 2, 3]\n")
+        number = 1 if size > 5_000 else 5
+        results = []
+        for function in (full, block):
+            timer = timeit.Timer(partial(function, text))
+            results.append(min(timer.repeat(repeat=3, number=number)) / number * 1000)
+        print(f"{size:>8} {results[0]:>12.1f} {results[1]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
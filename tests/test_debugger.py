@@ -0,0 +1,55 @@
+import threading
+from queue import Queue
+
+import pytest
+
+from quickpython import debugger, line_events
+
+SOURCE = """def add(a, b):
+    total = a + b
+    return total
+
+x = 1
+for i in range(3):
+    x = add(x, i)
+y = x * 2
+"""
+
+
+@pytest.mark.parametrize("has_monitoring", [True, False])
+def test_breakpoints_and_stepping(monkeypatch, has_monitoring):
+    monkeypatch.setattr(
+        line_events, "HAS_MONITORING", line_events.HAS_MONITORING and has_monitoring
+    )
+    code = compile(SOURCE, "<buffer>", "exec")
+    events: Queue = Queue()
+    program_debugger = debugger.Debugger(
+        "<buffer>", code, lambda kind, result: events.put((kind, result)), breakpoints=[2]
+    )
+    namespace: dict = {}
+    program = threading.Thread(target=program_debugger.run, args=(code, namespace), daemon=True)
+    program.start()
+
+    def send(*command):
+        program_debugger.commands.put(command)
+        kind, result = events.get(timeout=5)
+        if kind == "resumed":
+            kind, result = events.get(timeout=5)
+        return kind, result
+
+    assert events.get(timeout=5) == (
+        "paused",
+        (2, [("add", 2), ("<module>", 7)], [("a", "1"), ("b", "0")]),
+    )
+    assert send("evaluate", "a + b * 10") == ("evaluated", ("a + b * 10", "1"))
+    assert send("out")[1][0] == 6
+    assert send("next")[1][0] == 7
+    assert send("next")[1][0] == 6
+    assert send("step")[1][0] == 7
+    assert send("step")[1][:2] == (2, [("add", 2), ("<module>", 7)])
+
+    program_debugger.set_breakpoints([])
+    program_debugger.commands.put(("continue",))
+    program.join(5)
+    assert not program.is_alive()
+    assert namespace["y"] == 8
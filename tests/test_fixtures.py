@@ -0,0 +1,15 @@
+from quickpython import fixtures
+
+
+def test_find_and_compare(tmp_path):
+    (tmp_path / "b.in").write_text("2\n")
+    (tmp_path / "a.in").write_text("1\n")
+    (tmp_path / "a.out").write_text("one\n")
+    (tmp_path / "notes.txt").write_text("")
+    inputs = fixtures.find(tmp_path)
+    assert [path.name for path in inputs] == ["a.in", "b.in"]
+    assert fixtures.expected_output(inputs[0]) == "one\n"
+    assert fixtures.expected_output(inputs[1]) is None
+
+    assert fixtures.compare("one\n", "one\n", "a") == ""
+    assert fixtures.compare("one\n", "two", "a").splitlines()[-2:] == ["-one", "+two"]
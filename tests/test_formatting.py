@@ -0,0 +1,155 @@
+import asyncio
+import os
+
+import isort
+
+from quickpython import formatting
+
+CODE = '''import os
+import sys
+
+WORDS = """
+alpha
+beta
+"""
+
+
+@decorator
+def function(a, b):
+    if a:
+        return b
+    else:
+        return a
+'''
+
+
+def test_block_start():
+    assert CODE[formatting.block_start(CODE, len(CODE)) :].startswith("@decorator\ndef function")
+    after_string = CODE.index("\n\n\n@") + 1
+    assert CODE[formatting.block_start(CODE, after_string) :].startswith('WORDS = """')
+    after_imports = CODE.index("WORDS")
+    assert formatting.block_start(CODE, after_imports) == 0
+    assert formatting.block_start("    indented\n", 13) == 0
+
+
+def test_block_start_continuations():
+    def block(text):
+        return text[formatting.block_start(text, len(text)) :]
+
+    assert block("import os\nx = [\n1,\n2]\n") == "x = [\n1,\n2]\n"
+    assert block("total = 1 + \\\n2\n") == "total = 1 + \\\n2\n"
+    assert block('# a """ in a comment\ny = 1\nz = 2\n') == "z = 2\n"
+    assert block("if x:\n    pass\nelse:\n    pass\n") == "if x:\n    pass\nelse:\n    pass\n"
+    # Tokenizing carries on from the first change, finding what tokenizing from scratch would.
+    starts = [(CODE.index(text), text.split()[0]) for text in ("import os", "import sys", "WORDS")]
+    starts += [(CODE.index("@"), "@"), (CODE.index("def"), "def")]
+    assert formatting.top_level_lines(CODE) == starts
+    assert formatting.top_level_lines(CODE.replace("if a:", "if (\na):")) == starts
+    unclosed = CODE.replace("@decorator", "x = (\n@decorator")
+    assert formatting.top_level_lines(unclosed) == starts[:3] + [(starts[3][0], "x")]
+
+
+def test_format_scheduler_merges_requests():
+    version = 0
+    applied = []
+
+    def make_request():
+        return formatting.FormatRequest(
+            version,
+            "import sys,os\nx=[1,2]\n",
+            isort.Config(),
+            {},
+            apply=lambda formatted_code, error: applied.append(formatted_code),
+        )
+
+    async def type_quickly():
+        scheduler = formatting.FormatScheduler(lambda: version, delay=0.01)
+        try:
+            for _ in range(5):
+                scheduler.schedule("enter", make_request)
+            await asyncio.sleep(0.05)
+            while scheduler._running:
+                await asyncio.sleep(0.05)
+        finally:
+            scheduler.shutdown()
+
+    asyncio.run(type_quickly())
+    assert applied == ["import os\nimport sys\n\nx = [1, 2]\n"]
+
+
+def crash(*args):
+    os._exit(1)
+
+
+def test_format_scheduler_replaces_dead_worker(monkeypatch):
+    async def format_after_crashes():
+        scheduler = formatting.FormatScheduler(lambda: 0)
+        try:
+            scheduler.warm()
+            scheduler._executor.submit(crash)
+            results = [
+                await scheduler.format(formatting.FormatRequest(0, "x=1\n", isort.Config(), {}))
+            ]
+            monkeypatch.setattr(formatting, "format_code", crash)
+            results.append(
+                await scheduler.format(formatting.FormatRequest(0, "y=2\n", isort.Config(), {}))
+            )
+            return results
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(format_after_crashes()) == [
+        ("x = 1\n", ""),
+        ("y=2\n", "The formatter stopped unexpectedly"),
+    ]
+
+
+def test_format_cache():
+    cache = formatting.FormatCache(max_size=2)
+    requests = [
+        formatting.FormatRequest(0, f"x = {index}\n", isort.Config(), {}) for index in range(3)
+    ]
+    for request in requests:
+        assert cache.get(cache.key(request)) is None
+        cache.put(cache.key(request), (request.contents, ""))
+
+    assert cache.get(cache.key(requests[2])) == ("x = 2\n", "")
+    assert cache.get(cache.key(requests[0])) is None
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 4, 1)
+    assert "1 hits, 4 misses, 1 evictions" in str(cache)
+
+    # Equal configs share results, even as different objects.
+    request = formatting.FormatRequest(0, "x = 2\n", isort.Config(), {})
+    assert cache.get(cache.key(request)) == ("x = 2\n", "")
+    request = formatting.FormatRequest(0, "x = 2\n", isort.Config(), {"line_length": 80})
+    assert cache.get(cache.key(request)) is None
+
+    # Results are limited by their size as well as their number.
+    cache = formatting.FormatCache(max_characters=10)
+    cache.put("first", ("x = 1\n", ""))
+    cache.put("second", ("y = 2\n", ""))
+    assert cache.get("first") is None
+    assert cache.get("second") == ("y = 2\n", "")
+    cache.put("large", ("z" * 11, ""))
+    assert cache.get("large") is None
+    assert cache.characters == 6
+
+
+def test_config_resolver(tmp_path):
+    (tmp_path / ".git").mkdir()
+    pyproject = tmp_path / "pyproject.toml"
+    pyproject.write_text("[tool.black]\nline-length = 80\n[tool.isort]\nprofile = 'black'\n")
+    package = tmp_path / "package"
+    package.mkdir()
+
+    resolver = formatting.ConfigResolver()
+    isort_config, black_config = resolver.resolve(package)
+    assert black_config == {"line_length": 80}
+    assert isort_config.profile == "black"
+    assert resolver.resolve(package)[0] is isort_config
+
+    pyproject.write_text("[tool.black]\nline-length = 120\n")
+    os.utime(pyproject, ns=(0, 0))
+    isort_config, black_config = resolver.resolve(package)
+    assert black_config == {"line_length": 120}
+    assert isort_config.profile == ""
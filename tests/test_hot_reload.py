@@ -0,0 +1,60 @@
+from quickpython import child, hot_reload
+
+SOURCE = """import time
+
+class Greeter:
+    def greet(self):
+        return "hello"
+
+@main
+def start():
+    pass
+
+def count(n):
+    return n
+"""
+
+
+def test_changes():
+    assert hot_reload.changes(SOURCE, SOURCE, "<buffer>") == (None, False)
+    assert hot_reload.changes(SOURCE, SOURCE.replace("time", "json"), "<buffer>") == (None, True)
+
+    edited = SOURCE.replace("return n", "return n + 1") + "\ndef added():\n    return 1\n"
+    reload, other_changes = hot_reload.changes(SOURCE, edited, "<buffer>")
+    assert reload.names == ["count", "added"]
+    assert not other_changes
+    assert reload.text == edited
+
+
+def test_reload_updates_in_place():
+    started = []
+    namespace = {"__name__": "__main__", "main": lambda function: started.append(function)}
+    exec(compile(SOURCE, "<buffer>", "exec"), namespace)
+    greeter, count = namespace["Greeter"](), namespace["count"]
+    callbacks = [count]
+
+    edited = (
+        SOURCE.replace('"hello"', '"bonjour"')
+        .replace("pass", "return 'restarted'")
+        .replace("return n", "return n * 2")
+    )
+    reload, _ = hot_reload.changes(SOURCE, edited, "<buffer>")
+    assert child.reload(reload, namespace) == []
+    assert greeter.greet() == "bonjour"
+    assert callbacks[0](2) == 4
+    assert namespace["count"] is count
+    assert len(started) == 1
+
+
+def test_applied():
+    edited = (
+        SOURCE.replace("time", "json").replace('"hello"', '"hi"').replace("return n", "return 0")
+        + "\ndef added():\n    return 1\n"
+    )
+    source = hot_reload.applied(SOURCE, edited, ["Greeter", "added"])
+    reload, other_changes = hot_reload.changes(source, edited, "<buffer>")
+    # What didn't reload, or can't be, still counts as changed.
+    assert reload.names == ["count"]
+    assert other_changes
+    assert '"hi"' in source
+    assert "import time" in source
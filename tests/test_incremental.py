@@ -0,0 +1,112 @@
+import asyncio
+
+from quickpython import incremental
+
+SOURCE = """import os, time
+data = [3, 1, 2]
+
+def total():
+    return sum(data) + offset
+
+offset = 10
+data.sort()
+print("sorted", data)
+os.environ["SORTED"] = "yes"
+print(total())
+"""
+
+
+def plan(source, ran):
+    program = incremental.statements(source)
+    return incremental.plan(program, incremental.identities(program), ran)
+
+
+def test_statements():
+    program = incremental.statements(SOURCE + "a = 1; b = a\n")
+    assert [
+        (statement.line, statement.defines, statement.reads, statement.deferred)
+        for statement in program
+    ] == [
+        (1, {"os", "time"}, set(), set()),
+        (2, {"data"}, set(), set()),
+        (4, {"total"}, set(), {"sum", "data", "offset"}),
+        (7, {"offset"}, set(), set()),
+        (8, {"data"}, {"data"}, set()),
+        (9, set(), {"print", "data"}, set()),
+        (10, set(), {"os"}, set()),
+        (11, set(), {"print", "total"}, set()),
+        (12, {"a", "b"}, {"a"}, set()),
+    ]
+    assert program[2].source == "def total():\n    return sum(data) + offset\n\n"
+
+
+def test_plan():
+    program = incremental.statements(SOURCE)
+    ran = incremental.identities(program)
+    assert not any(plan(SOURCE, ran))
+    # Changing data in place runs it again from where it was assigned.
+    assert plan(SOURCE.replace("sort()", "sort(reverse=True)"), ran) == [
+        False,
+        True,
+        False,
+        False,
+        True,
+        True,
+        False,
+        True,
+    ]
+    # Functions depend on what they read when they are called.
+    assert plan(SOURCE.replace("offset = 10", "offset = 11"), ran) == [False] * 3 + [True] + [
+        False
+    ] * 3 + [True]
+    assert plan(SOURCE.replace('"yes"', '"no"'), ran) == [False] * 6 + [True, False]
+
+
+def test_plan_function_calls():
+    source = "items = []\ndef add(x):\n    items.append(x)\nadd(1)\nprint(items)\n"
+    ran = incremental.identities(incremental.statements(source))
+    # Calling a function counts as making the changes it makes.
+    assert plan(source.replace("add(1)", "add(2)"), ran) == [True, False, True, True]
+
+    source = "n = 0\ndef bump():\n    global n\n    n += 1\ndef twice():\n    bump()\n    bump()\n"
+    source += "twice()\nprint(n)\n"
+    ran = incremental.identities(incremental.statements(source))
+    assert plan(source.replace("twice()\n", "twice()\ntwice()\n"), ran) == [
+        True,
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+
+
+def test_session():
+    output = []
+    filename = "<buffer>"
+    source = "import time\ntime.sleep(0.5)\nloaded = [1, 2]\nprint('loaded')\n"
+
+    async def run():
+        session = incremental.Session(output.append)
+        try:
+            results = [await session.run(source + "print(sum(loaded))\n", filename)]
+            results.append(await session.run(source + "print(max(loaded))\n", filename))
+            results.append(await session.run(source + "1 / 0\n", filename))
+            await session.restart()
+            results.append(await session.run(source, filename))
+            return results
+        finally:
+            await session.restart()
+            session.shutdown()
+
+    results = asyncio.run(run())
+    assert [(result.ran, result.replayed, result.failed) for result in results] == [
+        (5, 0, None),
+        (1, 4, None),
+        (0, 4, 5),
+        (4, 0, None),
+    ]
+    printed = b"".join(output).decode("utf8")
+    assert printed.startswith("loaded\n3\nloaded\n2\nloaded\nTraceback")
+    assert printed.count("loaded\n") == 4
+    assert 'File "<buffer>", line 5' in printed
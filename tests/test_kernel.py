@@ -0,0 +1,45 @@
+import asyncio
+
+from quickpython import child, kernel
+
+
+def test_cell_at():
+    lines = ["import json", "# %% Load", "data = 1", "", "#%%", "print(data)"]
+    assert kernel.cell_at(lines, 0) == (0, 1)
+    assert kernel.cell_at(lines, 1) == (2, 4)
+    assert kernel.cell_at(lines, 3) == (2, 4)
+    assert kernel.cell_at(lines, 5) == (5, 6)
+
+
+def test_kernel_keeps_namespace():
+    output = []
+    text = "data = [1, 2]\n# %%\nprint(sum(data))\n# %%\nimport time\ntime.sleep(10)\n"
+
+    def cell(start, end):
+        source = "".join(text.splitlines(True)[start - 1 : end - 1])
+        return child.Cell(source, "<buffer>", start, text)
+
+    async def run():
+        program_kernel = kernel.Kernel(output.append)
+        try:
+            results = [await program_kernel.execute(cell(1, 2))]
+            results.append(await program_kernel.execute(cell(3, 4)))
+            results.append(await program_kernel.execute(child.Cell("1 / 0\n", "<buffer>", 7, "")))
+            sleeping = asyncio.ensure_future(program_kernel.execute(cell(5, 7)))
+            await asyncio.sleep(0.3)
+            program_kernel.interrupt()
+            results.append(await sleeping)
+            results.append(await program_kernel.execute(cell(3, 4)))
+            await program_kernel.restart()
+            results.append(await program_kernel.execute(cell(3, 4)))
+            return results
+        finally:
+            await program_kernel.restart()
+            program_kernel.shutdown()
+
+    assert asyncio.run(run()) == [True, True, False, False, True, False]
+    printed = b"".join(output).decode("utf8")
+    assert printed.count("3\n") == 2
+    assert 'File "<buffer>", line 7' in printed
+    assert "KeyboardInterrupt" in printed
+    assert "NameError: name 'data' is not defined" in printed
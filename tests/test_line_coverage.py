@@ -0,0 +1,23 @@
+import pytest
+
+from quickpython import line_coverage, line_events
+
+SOURCE = """def sign(n):
+    if n < 0:
+        return -1
+    return 1
+
+for n in range(1000):
+    sign(n)
+"""
+
+
+@pytest.mark.parametrize("has_monitoring", [True, False])
+def test_line_coverage(monkeypatch, has_monitoring):
+    monkeypatch.setattr(
+        line_events, "HAS_MONITORING", line_events.HAS_MONITORING and has_monitoring
+    )
+    code = compile(SOURCE, "<buffer>", "exec")
+    coverage = line_coverage.LineCoverage(code)
+    coverage.run(code, {})
+    assert coverage.results() == ([1, 2, 4, 6, 7], [1, 2, 3, 4, 6, 7])
@@ -0,0 +1,39 @@
+from quickpython import output
+
+
+def text(line):
+    return "".join(text for _style, text in line)
+
+
+def test_lines_and_ring_buffer():
+    buffer = output.OutputBuffer(max_lines=4)
+    buffer.write(b"one\ntw")
+    buffer.write(b"o\r\nthree\n\xc3")
+    buffer.write(b"\xa9\n")
+    assert [text(buffer[line]) for line in range(len(buffer))] == ["one", "two", "three", "é", ""]
+    buffer.write(b"four\n")
+    assert [text(buffer[line]) for line in range(len(buffer))] == ["two", "three", "é", "four", ""]
+    buffer.feed("10%\r20%")
+    assert text(buffer[len(buffer) - 1]) == "20%"
+    buffer.feed("\x1b[H\x1b[2Jcleared")
+    assert [text(buffer[line]) for line in range(len(buffer))] == ["cleared"]
+
+
+def test_ansi_colors():
+    buffer = output.OutputBuffer()
+    buffer.feed("\x1b[31mred\x1b[1;4")
+    buffer.feed("4mbold\x1b[0m plain \x1b[38;5;196mcube\x1b[38;2;1;2;3mtrue\x1b[39m\a")
+    assert buffer.current == [
+        ("fg:ansired", "red"),
+        ("bold fg:ansired bg:ansiblue", "bold"),
+        ("", " plain "),
+        ("fg:#ff0000", "cube"),
+        ("fg:#010203", "true"),
+    ]
+
+
+def test_long_lines_are_wrapped(monkeypatch):
+    monkeypatch.setattr(output, "MAX_LINE_LENGTH", 4)
+    buffer = output.OutputBuffer()
+    buffer.feed("abcdefghij")
+    assert [text(buffer[line]) for line in range(len(buffer))] == ["abcd", "efgh", "ij"]
@@ -0,0 +1,101 @@
+import marshal
+
+import pytest
+
+from quickpython import reports
+
+
+def test_profile_rows():
+    stats = {
+        ("<buffer>", 4, "slow"): (3, 3, 0.5, 0.75, {}),
+        ("~", 0, "<built-in method builtins.sum>"): (3, 3, 0.25, 0.25, {}),
+        ("/lib/random.py", 10, "choice"): (1, 1, 0.125, 1.0, {}),
+    }
+    rows = reports.profile_rows(marshal.dumps(stats), "<buffer>")
+    assert [(row.function, row.line) for row in rows] == [
+        ("slow (line 4)", 4),
+        ("<built-in method builtins.sum>", None),
+        ("choice (/lib/random.py:10)", None),
+    ]
+
+    selected = []
+    table = reports.ReportTable(reports.PROFILE_COLUMNS, rows, selected.append)
+    assert [row.line for row in table.shown] == [None, 4, None]
+    table.sort(reports.PROFILE_COLUMNS[1])
+    assert [row.line for row in table.shown] == [4, None, None]
+
+    content = table.create_content(80, 10)
+    assert "".join(text for _style, text in content.get_line(0)).split() == [
+        "cumulative",
+        "total",
+        "▼",
+        "calls",
+        "function",
+    ]
+    assert "slow (line 4)" in content.get_line(1)[0][1]
+
+
+def test_format_duration():
+    assert reports.format_duration(2.5) == "2.5 sec"
+    assert reports.format_duration(0.0125) == "12.5 msec"
+    assert reports.format_duration(0.000002) == "2 usec"
+    assert reports.format_duration(0.00000005) == "50 nsec"
+
+
+def test_memory_rows():
+    rows = reports.memory_rows([(2, 2048, 3), (9, 10, 1)], "x = 1\n  y = [0] * 100\n")
+    assert [(row.line, row.text) for row in rows] == [(2, "y = [0] * 100"), (9, "")]
+    assert reports.format_size(100) == "100 B"
+    assert reports.format_size(2048) == "2.0 KiB"
+    assert reports.format_size(3 * 1024 ** 3) == "3.0 GiB"
+
+
+def test_format_count():
+    assert reports.format_count(999) == "999"
+    assert reports.format_count(12345) == "12.3k"
+    assert reports.format_count(999999) == "1M"
+
+
+def test_breakpoint_margin():
+    margin = reports.BreakpointMargin()
+    assert margin.get_width(lambda: None) == 0
+    assert margin.toggle(3)
+    assert margin.get_width(lambda: None) == 2
+    assert not margin.toggle(3)
+    assert margin.breakpoints == set()
+
+
+def test_coverage_margin():
+    margin = reports.CoverageMargin()
+    assert margin.get_width(lambda: None) == 0
+    margin.show([1, 2], [1, 2, 4])
+    assert margin.missed == {4}
+    assert margin.get_width(lambda: None) == 1
+    margin.clear()
+    assert not margin.shown
+
+
+def test_flame_rows():
+    root = reports.flame_tree({("start", "spin"): 6, ("start", "nap"): 2, ("start",): 2})
+    assert root.count == 10
+    rows = reports.flame_rows(root, 20)
+    assert [[(node.name, start, end) for node, start, end in row] for row in rows] == [
+        [("all", 0, 20)],
+        [("start", 0, 20)],
+        [("spin", 0, 12), ("nap", 12, 16)],
+    ]
+    assert len(reports.flame_rows(root, 2)[2]) == 1  # nap is too narrow to show.
+
+
+def test_history_rows():
+    runs = [
+        ("game.py", b"old", 1.0, 1.0, 0.9, 100, 0),
+        ("game.py", b"old", 2.0, 0.8, 0.7, 100, 0),
+        ("game.py", b"new", 3.0, 1.0, 0.9, 100, 0),
+        ("game.py", b"new", 4.0, 0.5, 0.4, 200, 1),
+        ("game.py", b"newer", 5.0, 0.4, 0.3, 80, 0),
+    ]
+    rows = reports.history_rows(runs, b"newer", 0.1)
+    assert [row.flag for row in rows] == ["", "", "slower", "", "faster, less memory"]
+    assert rows[2].time_change == pytest.approx(0.25)
+    assert rows[-1].version == b"newer".hex()[:8] + "*"
@@ -0,0 +1,229 @@
+import asyncio
+import marshal
+
+import pytest
+
+from quickpython import child, hot_reload, runner
+
+
+@pytest.fixture
+def program_runner():
+    program_runner = runner.Runner()
+    yield program_runner
+    program_runner.shutdown()
+
+
+def launch(program_runner, program, send="", interrupt=False):
+    output, results = [], []
+
+    async def run():
+        run = await program_runner.launch(
+            program, output.append, lambda kind, result: results.append((kind, result))
+        )
+        run.send(send)
+        if interrupt:
+            await asyncio.sleep(0.2)
+            run.interrupt()
+        return await run.wait()
+
+    return asyncio.run(run()), b"".join(output).decode("utf8"), results
+
+
+@pytest.mark.parametrize("can_fork", [True, False])
+def test_launch(tmp_path, program_runner, monkeypatch, can_fork):
+    monkeypatch.setattr(runner, "CAN_FORK", runner.CAN_FORK and can_fork)
+    source = "import sys\nprint('name?')\nprint('hi', input(), file=sys.stderr)\nprint('é' * 3)\n"
+    program = child.Program(source, str(tmp_path / "program.py"))
+    exit_code, output, _ = launch(program_runner, program, send="there\n")
+    assert exit_code == 0
+    assert output.splitlines() == ["name?", "hi there", "ééé"]
+
+
+@pytest.mark.parametrize("can_fork", [True, False])
+def test_launch_program(tmp_path, program_runner, monkeypatch, can_fork):
+    monkeypatch.setattr(runner, "CAN_FORK", runner.CAN_FORK and can_fork)
+    filename = str(tmp_path / "program.py")
+    source = (
+        "import os, sys\n"
+        "@main\n"
+        "def start():\n"
+        "    print('hello', os.environ['GREETING'], sys.argv == [__file__])\n"
+    )
+    program = child.Program(source, filename, {"GREETING": "world"})
+    assert launch(program_runner, program)[:2] == (0, "hello world True\n")
+    assert not (tmp_path / "program.py").exists()
+
+    assert launch(program_runner, child.Program("raise SystemExit(3)\n", filename))[0] == 3
+
+    exit_code, error, _ = launch(program_runner, child.Program("x = 1\n1 / 0\n", filename))
+    assert exit_code == 1
+    assert f'File "{filename}", line 2' in error
+    assert "1 / 0" in error
+    assert "ZeroDivisionError" in error
+
+    program = child.Program("print(__name__)\n", "<buffer>")
+    assert launch(program_runner, program)[:2] == (0, "__main__\n")
+
+
+@pytest.mark.skipif(not runner.CAN_FORK, reason="requires fork")
+def test_launch_restarts_server(tmp_path, program_runner):
+    program_runner.warm()
+    program_runner.server.kill()
+    program_runner.server.wait()
+    program = child.Program("print('ran')\n", str(tmp_path / "program.py"))
+    assert launch(program_runner, program)[:2] == (0, "ran\n")
+
+
+def test_launch_interrupt(tmp_path, program_runner):
+    program = child.Program("input()\n", str(tmp_path / "program.py"))
+    exit_code, output, _ = launch(program_runner, program, interrupt=True)
+    assert exit_code == 1
+    assert "KeyboardInterrupt" in output
+
+
+@pytest.mark.parametrize("can_fork", [True, False])
+def test_profile(program_runner, monkeypatch, can_fork):
+    monkeypatch.setattr(runner, "CAN_FORK", runner.CAN_FORK and can_fork)
+    source = "def slow():\n    return sum(range(10000))\n\nfor _ in range(3):\n    slow()\n"
+    program = child.Program(source, "<buffer>", mode="profile")
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    [(kind, stats)] = results
+    assert kind == "profile"
+    assert marshal.loads(stats)[("<buffer>", 1, "slow")][1] == 3
+
+
+def test_timeit(program_runner):
+    source = "@main\ndef start():\n    raise SystemExit(1)\n\nitems = list(range(100))\n"
+    program = child.Program(source, "<buffer>", mode="timeit", options={"statement": "sum(items)"})
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    [(kind, (loops, timings))] = results
+    assert kind == "timeit"
+    assert loops >= 1
+    assert len(timings) == 5
+
+
+def test_memory(program_runner):
+    source = "import time\nsmall = [0]\nlarge = [str(i) for i in range(100000)]\ntime.sleep(0.3)\n"
+    program = child.Program(source, "<buffer>", mode="memory", options={"interval": 0.1})
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    assert len(results) > 1
+    kind, (lines, current, peak, peak_rss) = results[-1]
+    assert kind == "memory"
+    assert lines[0][0] == 3
+    assert lines[0][1] > 1000000
+    assert peak >= current > 1000000
+
+
+def test_profile_lines(program_runner):
+    source = (
+        "import time\n"
+        "def wait():\n"
+        "    time.sleep(0.01)\n"
+        "for _ in range(5):\n"
+        "    wait()\n"
+        "x = 1\n"
+    )
+    exit_code, _, results = launch(program_runner, child.Program(source, "<buffer>", mode="lines"))
+    assert exit_code == 0
+    kind, (hits, times) = results[-1]
+    assert kind == "lines"
+    assert hits[:7] == [0, 1, 1, 5, 6, 5, 1]
+    assert times[3] >= 0.04e9
+    assert times[5] >= times[3]
+    assert times[6] < times[3]
+
+
+def test_reload_running_program(program_runner):
+    source = "import time\ndef value():\n    return 1\nwhile value() == 1:\n    time.sleep(0.01)\n"
+    results = []
+
+    async def run():
+        program = child.Program(source, "<buffer>")
+        run = await program_runner.launch(
+            program, lambda data: None, lambda *result: results.append(result)
+        )
+        reload, _ = hot_reload.changes(source, source.replace("return 1", "return 2"), "<buffer>")
+        run.request(reload)
+        return await asyncio.wait_for(run.wait(), 10)
+
+    assert asyncio.run(run()) == 0
+    assert results == [("reloaded", (["value"], []))]
+
+
+def test_tests(program_runner):
+    source = "import time\ndef test_passes():\n    pass\ndef test_hangs():\n    time.sleep(10)\n"
+    options = {"workers": 2, "timeout": 0.5, "files": [("test_other.py", "def test_b(): 1/0\n")]}
+    program = child.Program(source, "/tmp/program.py", mode="tests", options=options)
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    assert results[0] == ("tests", 3)
+    outcomes = {result[0]: result[3] for kind, result in results[1:]}
+    assert outcomes == {"test_passes": "passed", "test_hangs": "timed out", "test_b": "failed"}
+
+
+def test_fixtures(tmp_path, program_runner):
+    (tmp_path / "named.in").write_text("Ada\n")
+    (tmp_path / "empty.in").write_text("")
+    source = "@main\ndef start():\n    print('hi', input('name? '))\n"
+    options = {"fixtures": [(path.stem, str(path)) for path in sorted(tmp_path.glob("*.in"))]}
+    program = child.Program(source, "<buffer>", mode="fixtures", options=options)
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    runs = {name: (exit_code, output) for kind, (name, exit_code, _, output) in results}
+    assert runs["named"] == (0, "name? hi Ada\n")
+    assert runs["empty"][0] == 1
+    assert "EOFError" in runs["empty"][1]
+
+
+def test_coverage(program_runner):
+    source = "def sign(n):\n    if n < 0:\n        return -1\n    return 1\n\nsign(1)\n"
+    program = child.Program(source, "<buffer>", mode="coverage")
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    assert results == [("coverage", ([1, 2, 4, 6], [1, 2, 3, 4, 6]))]
+
+
+def test_sample(program_runner):
+    from quickpython import sampler
+
+    source = "import time\ndef nap():\n    time.sleep(0.2)\nnap()\n"
+    program = child.Program(source, "<buffer>", mode="sample", options={"interval": 0.01})
+    exit_code, _, results = launch(program_runner, program)
+    assert exit_code == 0
+    [(kind, stacks)] = results
+    assert kind == "samples"
+    assert stacks[("<module> (line 1)", "nap (line 2)")] > 5
+    assert sampler.collapsed(stacks).startswith("<module> (line 1)")
+
+
+def test_limits(program_runner):
+    source = "files = [open(__file__) for _ in range(100)]\n"
+    program = child.Program(source, __file__, limits=child.Limits(open_files=20))
+    exit_code, output, results = launch(program_runner, program)
+    assert exit_code == 1
+    assert "Too many open files" in output
+    assert results == [("limit", "open_files")]
+
+
+def test_limits_from_environ():
+    environ = {"QUICKPYTHON_CPU_LIMIT": "5", "QUICKPYTHON_WALL_LIMIT": "1.5"}
+    limits = child.Limits.from_environ({**environ, "QUICKPYTHON_FILES_LIMIT": ""})
+    assert limits == child.Limits(cpu_seconds=5, wall_seconds=1.5)
+    with pytest.raises(ValueError, match="QUICKPYTHON_MEMORY_LIMIT"):
+        child.Limits.from_environ({"QUICKPYTHON_MEMORY_LIMIT": "lots"})
+
+
+def test_usage(program_runner):
+    async def run():
+        program = child.Program("x = sum(range(10 ** 7))\n", "<buffer>")
+        run = await program_runner.launch(program, lambda data: None)
+        await run.wait()
+        return run.usage
+
+    usage = asyncio.run(run())
+    if runner.CAN_FORK:
+        assert usage.cpu_seconds > 0.01
+        assert usage.peak_rss > 1024 * 1024
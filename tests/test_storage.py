@@ -0,0 +1,64 @@
+import threading
+
+from quickpython import storage
+
+
+def test_formatted_files(tmp_path):
+    source = tmp_path / "example.py"
+    source.write_text("x = 1\n")
+    formatted_files = storage.FormattedFiles(tmp_path / "cache" / "formatted_files.json")
+    assert not formatted_files.is_formatted(source, "x = 1\n", "config")
+
+    formatted_files.record(source, "x = 1\n", "config")
+    assert formatted_files.is_formatted(source, "x = 1\n", "config")
+    assert not formatted_files.is_formatted(source, "x = 2\n", "config")
+    assert not formatted_files.is_formatted(source, "x = 1\n", "other config")
+
+    shared = storage.FormattedFiles(formatted_files.path, max_size=1)
+    assert shared.is_formatted(source, "x = 1\n", "config")
+    other_source = tmp_path / "other.py"
+    other_source.write_text("y = 1\n")
+    shared.record(other_source, "y = 1\n", "config")
+    assert not shared.is_formatted(source, "x = 1\n", "config")
+    assert shared.is_formatted(other_source, "y = 1\n", "config")
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path / "example.py"
+    assert storage.write_if_changed(path, "x = 1\n")
+    path.chmod(0o640)
+    assert not storage.write_if_changed(path, "x = 1\n")
+    assert storage.write_if_changed(path, "x = 2\n")
+    assert path.read_text() == "x = 2\n"
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert [child.name for child in tmp_path.iterdir()] == ["example.py"]
+
+
+def test_run_history(tmp_path):
+    history = storage.RunHistory(tmp_path / "cache" / "run_history.json", max_size=2)
+    assert history.runs("game.py") == []
+    history.record(("game.py", b"1", 1.0, 0.5, 0.4, 1024, 0))
+    history.record(("other.py", b"2", 2.0, 0.5, None, None, 1))
+    history.record(("game.py", b"3", 3.0, 0.6, 0.5, 2048, 0))
+    assert history.runs("game.py") == [("game.py", b"3", 3.0, 0.6, 0.5, 2048, 0)]
+
+
+def test_run_history_shared(tmp_path):
+    path = tmp_path / "run_history.json"
+    threads = [
+        threading.Thread(
+            target=storage.RunHistory(path).record,
+            args=(("game.py", bytes([index]), float(index), 0.5, None, None, 0),),
+        )
+        for index in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(entry[2] for entry in storage.RunHistory(path).runs("game.py")) == [
+        float(index) for index in range(20)
+    ]
+
+    path.write_text('[["game.py", "zz", 1, 2, 3, 4, 5], "planted"]')
+    assert storage.RunHistory(path).runs("game.py") == []
@@ -0,0 +1,54 @@
+import types
+
+import pytest
+
+from quickpython import testing
+
+SOURCE = '''def double(n):
+    """
+    >>> double(2)
+    4
+    """
+    return n * 2
+
+def test_double():
+    assert double(2) == 4
+
+def test_broken():
+    print("checking")
+    assert double(3) == 7
+
+def helper():
+    pass
+'''
+
+
+def module():
+    module = types.ModuleType("game")
+    module.__file__ = "game.py"
+    exec(compile(SOURCE, "game.py", "exec"), vars(module))
+    return module
+
+
+def test_collect():
+    tests = testing.collect(module())
+    assert [(test.name, test.line) for test in tests] == [
+        ("doctest game.double", 2),
+        ("test_double", 8),
+        ("test_broken", 11),
+    ]
+
+
+@pytest.mark.parametrize("can_fork", [True, False])
+def test_run_tests(monkeypatch, can_fork):
+    monkeypatch.setattr(testing, "CAN_FORK", testing.CAN_FORK and can_fork)
+    results = {}
+    tests = testing.collect(module())
+    testing.run_tests(tests, lambda kind, result: results.update({result[0]: result}), 2, 10.0)
+    assert {name: result[3] for name, result in results.items()} == {
+        "doctest game.double": "passed",
+        "test_double": "passed",
+        "test_broken": "failed",
+    }
+    assert "checking" in results["test_broken"][5]
+    assert "AssertionError" in results["test_broken"][5]
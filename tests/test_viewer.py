@@ -0,0 +1,38 @@
+from quickpython import viewer
+
+
+def test_line_index(monkeypatch):
+    monkeypatch.setattr(viewer, "BLOCK_SIZE", 8)
+    data = b"".join(f"line {number}\n".encode() for number in range(100)) + b"last"
+    index = viewer.LineIndex(data)
+    assert index.line(0) == "line 0"
+    assert not index.complete
+    assert index.line(57) == "line 57"
+    assert index.line(100) == "last"
+    assert index.line(101) is None
+    assert index.line_of(data.index(b"line 42")) == 42
+    assert index.line_count() == 101
+    assert index.complete
+
+    assert viewer.LineIndex(b"").line(0) is None
+    assert viewer.LineIndex(b"one\n").line_count() == 1
+
+
+def test_large_file_viewer(tmp_path):
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"entry {number}\n" for number in range(1000)))
+    large_file = viewer.LargeFileViewer(path)
+    try:
+        large_file.goto(500)
+        content = large_file.create_content(width=80, height=10)
+        assert content.line_count == 10
+        assert "entry 500" in "".join(text for _, text in content.get_line(9))
+
+        assert large_file.search("entry 750")
+        assert large_file.cursor_line == 750
+        assert not large_file.search("missing")
+
+        large_file.goto(5000)
+        assert large_file.cursor_line == 999
+    finally:
+        large_file.close()